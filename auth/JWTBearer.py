@@ -1,23 +1,16 @@
-import base64
+import binascii
+import copy
+import hashlib
 import json
-from typing import Dict, Optional, List, Any
-from botocore.exceptions import ClientError
+from typing import Optional, Any, Union
 from fastapi import HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwk
-from jose.utils import base64url_decode
 from pydantic import BaseModel
 from starlette.requests import Request
 from starlette.status import HTTP_403_FORBIDDEN
-from auth.user_auth import user_info_with_token
-
-# Define the type for JWK
-JWK = Dict[str, str]
-
-
-# Model for the JSON Web Key Set (JWKS)
-class JWKS(BaseModel):
-    keys: List[JWK]
+from auth.cache import LRUCache
+from auth.jwks import JWK, JWKS, JWKSProvider
+from auth.revocation import RevocationChecker, RevocationPolicy
 
 
 # Model for JWT authorization credentials
@@ -29,87 +22,210 @@ class JWTAuthorizationCredentials(BaseModel):
     message: str
 
 
+class JWTCredentials:
+    """
+    Lightweight credentials of a parsed JWT token.
+
+    Holds the decoded header and claims plus the raw segments needed to verify
+    the signature. Use to_model() to get a JWTAuthorizationCredentials object.
+    """
+
+    __slots__ = ("jwt_token", "header", "claims", "signature", "message", "signing_input", "decoded_signature")
+
+    def __init__(
+        self,
+        jwt_token: str,
+        header: dict,
+        claims: dict,
+        signature: str,
+        message: str,
+        signing_input: bytes,
+        decoded_signature: bytes,
+    ):
+        self.jwt_token = jwt_token
+        self.header = header
+        self.claims = claims
+        self.signature = signature
+        self.message = message
+        self.signing_input = signing_input
+        self.decoded_signature = decoded_signature
+
+    def to_model(self) -> JWTAuthorizationCredentials:
+        """
+        Convert the credentials to the pydantic model.
+
+        :return: JWTAuthorizationCredentials object.
+        """
+        # Remove unnecessary fields from claims
+        claims = {name: value for name, value in self.claims.items() if name != "version"}
+
+        # Convert timestamps to strings
+        for claim in ["auth_time", "iat", "exp"]:
+            if claim in claims:
+                claims[claim] = str(claims[claim])
+
+        return JWTAuthorizationCredentials(
+            jwt_token=self.jwt_token,
+            header=self.header,
+            claims=claims,
+            signature=self.signature,
+            message=self.message,
+        )
+
+
+URLSAFE_TO_STANDARD_ALPHABET = bytes.maketrans(b"-_", b"+/")
+
+
+def b64url_decode(segment: bytes) -> bytes:
+    # Extra padding is ignored by a2b_base64, so there's no need to compute it
+    return binascii.a2b_base64(segment.translate(URLSAFE_TO_STANDARD_ALPHABET) + b"==")
+
+
+def parse_jwt(jwt_token: str) -> JWTCredentials:
+    """
+    Parse a JWT token, splitting it only once.
+
+    :param jwt_token: JWT token to parse.
+    :return: JWTCredentials object.
+
+    :raises HTTPException: If the JWT structure, header or claims are invalid.
+    """
+    token = jwt_token.encode()
+    segments = token.split(b".")
+    if len(segments) != 3:
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Invalid JWT structure"
+        )
+    header_segment, claims_segment, signature_segment = segments
+
+    try:
+        header = json.loads(b64url_decode(header_segment).decode())
+    except Exception:
+        header = None
+    try:
+        claims = json.loads(b64url_decode(claims_segment).decode())
+    except Exception:
+        claims = None
+    if not isinstance(claims, dict):
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Failed to decode claims"
+        )
+    if not isinstance(header, dict) or not all(isinstance(value, str) for value in header.values()):
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Invalid JWT header"
+        )
+    try:
+        decoded_signature = b64url_decode(signature_segment)
+    except Exception:
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="JWK invalid")
+
+    signing_input = token[: len(header_segment) + 1 + len(claims_segment)]
+    return JWTCredentials(
+        jwt_token=jwt_token,
+        header=header,
+        claims=claims,
+        signature=signature_segment.decode(),
+        message=signing_input.decode(),
+        signing_input=signing_input,
+        decoded_signature=decoded_signature,
+    )
+
+
 # Class to handle JWT authentication
 class JWTBearer(HTTPBearer):
-    def __init__(self, jwks: JWKS, auto_error: bool = True):
+    def __init__(
+        self,
+        jwks: Union[JWKS, JWKSProvider],
+        auto_error: bool = True,
+        cache_size: int = 4096,
+        revocation_policy: RevocationPolicy = RevocationPolicy.CACHED,
+        revocation_checker: Optional[RevocationChecker] = None,
+    ):
         super().__init__(auto_error=auto_error)
-        # Map KIDs to their corresponding JWKs
-        self.kid_to_jwk = {jwk["kid"]: jwk for jwk in jwks.keys}
-
-    def decode_jwt(self, token: str):
+        self.revocation_policy = revocation_policy
+        self.revocation_checker = revocation_checker or RevocationChecker()
+        # The provider maps KIDs to their public keys, constructed once per key set
+        self.jwks_provider = jwks if isinstance(jwks, JWKSProvider) else JWKSProvider.from_jwks(jwks)
+        # Tokens whose signature was already verified, keyed by their digest
+        self.verified_tokens = LRUCache(maxsize=cache_size)
+
+    @property
+    def kid_to_key(self) -> dict:
+        return self.jwks_provider.kid_to_key
+
+    @property
+    def cache_hits(self) -> int:
+        return self.verified_tokens.hits
+
+    @property
+    def cache_misses(self) -> int:
+        return self.verified_tokens.misses
+
+    @staticmethod
+    def token_digest(jwt_token: str) -> bytes:
+        return hashlib.sha256(jwt_token.encode()).digest()
+
+    @staticmethod
+    def token_expiry(claims: dict) -> Optional[float]:
         """
-        Decode a JWT token.
+        Get the expiration time of a token from its claims.
 
-        :param token: JWT token to decode.
-        :return: Decoded header and payload.
+        :param claims: Decoded JWT claims.
+        :return: Expiration timestamp, or None if the token doesn't expire.
         """
         try:
-            header, payload, _ = token.split(".")
-            decoded_header = json.loads(
-                base64.urlsafe_b64decode(header + "==").decode("utf-8")
-            )
-            decoded_payload = json.loads(
-                base64.urlsafe_b64decode(payload + "==").decode("utf-8")
-            )
-
-            return decoded_header, decoded_payload
-        except Exception:
-            return None, None  # Return None on error
+            return float(claims["exp"])
+        except (KeyError, TypeError, ValueError):
+            return None
 
-    def verify_jwk_token(self, jwt_credentials: JWTAuthorizationCredentials) -> bool:
+    def verify_jwk_token(self, jwt_credentials: JWTCredentials) -> bool:
         """
         Verify a JWT token using a JWK.
 
-        :param jwt_credentials: JWTAuthorizationCredentials object.
+        :param jwt_credentials: JWTCredentials object.
         :return: True if the token is valid, otherwise False.
         """
         try:
-            public_key = self.kid_to_jwk[jwt_credentials.header["kid"]]
+            key = self.kid_to_key[jwt_credentials.header["kid"]]
         except KeyError:
             raise HTTPException(
                 status_code=HTTP_403_FORBIDDEN, detail="JWK public key not found"
             )
 
-        # Construct the public key
-        key = jwk.construct(public_key)
-        # Decode the signature
-        decoded_signature = base64url_decode(jwt_credentials.signature.encode())
-
         # Verify the token's signature
-        return key.verify(jwt_credentials.message.encode(), decoded_signature)
+        return key.verify(jwt_credentials.signing_input, jwt_credentials.decoded_signature)
+
+    def with_policy(self, revocation_policy: RevocationPolicy) -> "JWTBearer":
+        """
+        Get a bearer sharing this one's keys and caches with another revocation policy.
 
-    def verify_token_revoed(self, jwt_token: str):
+        :param revocation_policy: Revocation policy for the routes using the new bearer.
+        :return: JWTBearer object.
         """
-        Verify if the token is revoked.
+        bearer = copy.copy(self)
+        bearer.revocation_policy = revocation_policy
+        return bearer
+
+    async def verify_token_revoed(self, jwt_token: str, token_digest: bytes, expires_at: Optional[float]):
+        """
+        Verify if the token is revoked, according to the revocation policy.
 
         :param jwt_token: JWT token to verify.
+        :param token_digest: Digest of the JWT token.
+        :param expires_at: Expiration timestamp of the token.
 
         :raises HTTPException: If the token is revoked.
         """
-        try:
-            user_info_with_token(jwt_token)
-        except ClientError as e:
-            # Verifica se a exceção é 'NotAuthorizedException', ou seja, o token foi revogado
-            if e.response["Error"]["Code"] == "NotAuthorizedException":
-                raise HTTPException(
-                    status_code=HTTP_403_FORBIDDEN,
-                    detail="Access token has been revoked",
-                )
-            else:
-                raise  # Levanta outras exceções de boto3
-        except Exception as e:
-            # Qualquer outra exceção que precise ser tratada
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN,
-                detail="An error occurred while validating the token",
-            )
+        await self.revocation_checker.check(
+            jwt_token, token_digest, expires_at, self.revocation_policy
+        )
 
-    async def __call__(self, request: Request) -> Optional[JWTAuthorizationCredentials]:
+    async def __call__(self, request: Request) -> Optional[JWTCredentials]:
         """
         Call method to authenticate the request.
 
         :param request: Incoming request.
-        :return: JWTAuthorizationCredentials object if valid, otherwise raise an HTTPException.
+        :return: JWTCredentials object if valid, otherwise raise an HTTPException.
 
         :raises HTTPException: If the JWT is invalid.
         """
@@ -123,26 +239,50 @@ class JWTBearer(HTTPBearer):
 
         jwt_token = credentials.credentials
 
+        # Tokens already verified skip parsing and the signature check, while they are unexpired:
+        # entries expire with their token
+        token_digest = self.token_digest(jwt_token)
+        jwt_credentials = self.verified_tokens.get(token_digest)
+        if jwt_credentials is None:
+            jwt_credentials = await self.verify_jwt(jwt_token)
+            # Tokens without expiration are never cached
+            expires_at = self.token_expiry(jwt_credentials.claims)
+            if expires_at is not None:
+                self.verified_tokens.set(token_digest, jwt_credentials, expires_at=expires_at)
+
         # Validate if token is revoked
-        self.verify_token_revoed(jwt_token)
+        await self.verify_token_revoed(
+            jwt_token, token_digest, self.token_expiry(jwt_credentials.claims)
+        )
 
-        self.validate_jwt_structure(jwt_token)
+        return jwt_credentials  # Return the JWT credentials if valid
 
-        try:
-            decoded_header, claims = self.decode_jwt(jwt_token)
-            jwt_credentials = self.create_jwt_credentials(
-                jwt_token, decoded_header, claims
-            )
-        except ValueError:
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN, detail="Invalid JWT header"
-            )
+    async def verify_jwt(self, jwt_token: str) -> JWTCredentials:
+        """
+        Parse a JWT token and verify its signature and expiration.
+
+        :param jwt_token: JWT token to verify.
+        :return: JWTCredentials object.
+
+        :raises HTTPException: If the JWT is invalid.
+        """
+        jwt_credentials = parse_jwt(jwt_token)
+
+        # Keys rotated by the identity provider are fetched on first use
+        kid = jwt_credentials.header.get("kid")
+        if kid not in self.kid_to_key:
+            await self.jwks_provider.refresh_for_unknown_kid(kid)
 
         # Verify if the token is valid
         if not self.verify_jwk_token(jwt_credentials):
             raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="JWK invalid")
 
-        return jwt_credentials  # Return the JWT credentials if valid
+        # Checked under every revocation policy, the identity provider isn't called for all of them
+        expires_at = self.token_expiry(jwt_credentials.claims)
+        if expires_at is not None and expires_at <= self.verified_tokens.clock():
+            raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Token expired")
+
+        return jwt_credentials
 
     def verify_authentication_scheme(self, credentials: HTTPAuthorizationCredentials):
         """
@@ -155,48 +295,3 @@ class JWTBearer(HTTPBearer):
             raise HTTPException(
                 status_code=HTTP_403_FORBIDDEN, detail="Wrong authentication method"
             )
-
-    def validate_jwt_structure(self, jwt_token: str):
-        """
-        Validate the structure of a JWT token.
-
-        :param jwt_token: JWT token to validate.
-
-        :raises HTTPException: If the JWT structure is invalid.
-        """
-        if len(jwt_token.split(".")) != 3:
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN, detail="Invalid JWT structure"
-            )
-
-    def create_jwt_credentials(
-        self, jwt_token: str, decoded_header: dict, claims: dict
-    ) -> JWTAuthorizationCredentials:
-        """
-        Create a JWTAuthorizationCredentials object.
-
-        :param jwt_token: JWT token.
-        :param decoded_header: Decoded JWT header.
-        :param claims: Decoded JWT claims.
-        :return: JWTAuthorizationCredentials object.
-        """
-        if claims is None:
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN, detail="Failed to decode claims"
-            )
-
-        # Remove unnecessary fields from claims
-        claims.pop("version", None)
-
-        # Convert timestamps to strings
-        for claim in ["auth_time", "iat", "exp"]:
-            if claim in claims:
-                claims[claim] = str(claims[claim])
-
-        return JWTAuthorizationCredentials(
-            jwt_token=jwt_token,
-            header=decoded_header,
-            claims=claims,
-            signature=jwt_token.rsplit(".", 1)[-1],
-            message=jwt_token.rsplit(".", 1)[0],
-        )
\ No newline at end of file
@@ -1,32 +1,55 @@
 import os
-import requests
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException
 from starlette.status import HTTP_403_FORBIDDEN
-from auth.JWTBearer import JWKS, JWTBearer, JWTAuthorizationCredentials
+from auth.JWTBearer import JWTBearer, JWTCredentials
+from auth.jwks import JWKSProvider
+from auth.revocation import RevocationChecker, RevocationPolicy
+from concurrency.executor import cognito_executor
+from metrics.registry import register
 
 load_dotenv()
 
 AWS_REGION = os.environ.get("AWS_REGION")
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
+REVOCATION_CACHE_TTL = float(os.environ.get("REVOCATION_CACHE_TTL", 30))
+REVOCATION_NEGATIVE_CACHE_TTL = float(os.environ.get("REVOCATION_NEGATIVE_CACHE_TTL", 300))
+JWKS_SNAPSHOT_PATH = os.environ.get("JWKS_SNAPSHOT_PATH", "jwks_snapshot.json")
+JWKS_REFRESH_INTERVAL = float(os.environ.get("JWKS_REFRESH_INTERVAL", 3600))
+JWKS_MIN_REFETCH_INTERVAL = float(os.environ.get("JWKS_MIN_REFETCH_INTERVAL", 60))
+
+# The JWKS of the Cognito User Pool is loaded from the local snapshot, no network call is made on import
+jwks_provider = JWKSProvider(
+    f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json",
+    snapshot_path=JWKS_SNAPSHOT_PATH,
+    refresh_interval=JWKS_REFRESH_INTERVAL,
+    min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+    executor=cognito_executor,
+)
 
-# Get the JWKS from the Cognito User Pool
-response = requests.get(
-    f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
+revocation_checker = RevocationChecker(
+    ttl=REVOCATION_CACHE_TTL,
+    negative_ttl=REVOCATION_NEGATIVE_CACHE_TTL,
+    executor=cognito_executor,
 )
 
-jwks = JWKS.model_validate(response.json())
+# Routes that change state reuse Cognito's answer for a short TTL
+auth = JWTBearer(jwks_provider, revocation_checker=revocation_checker)
+# Read-only routes trust the token signature alone
+read_auth = auth.with_policy(RevocationPolicy.SIGNATURE_ONLY)
 
-auth = JWTBearer(jwks)
+register("verified_tokens", auth.verified_tokens.stats)
+register("token_revocation", revocation_checker.stats)
+register("jwks", jwks_provider.stats)
 
 
 async def get_current_user(
-    credentials: JWTAuthorizationCredentials = Depends(auth),
+    credentials: JWTCredentials = Depends(auth),
 ) -> dict:
     """
     Get the current user from the JWT token.
 
-    :param credentials: JWTAuthorizationCredentials object.
+    :param credentials: JWTCredentials object.
     :return: Username of the user.
     """
 
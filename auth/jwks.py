@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import requests
+from jose import jwk
+from pydantic import BaseModel
+
+from concurrency.executor import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Define the type for JWK
+JWK = Dict[str, str]
+
+
+# Model for the JSON Web Key Set (JWKS)
+class JWKS(BaseModel):
+    keys: list[JWK]
+
+
+class JWKSProvider:
+    """
+    Provide the public keys of a JWKS endpoint without blocking on the network.
+
+    Keys are loaded from a local snapshot file on startup, refreshed in the
+    background every `refresh_interval` seconds, and refetched (at most once
+    every `min_refetch_interval` seconds) when a token signed with an unknown
+    kid shows up. If a refresh fails, the last good key set keeps being served.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        snapshot_path: Optional[str] = None,
+        refresh_interval: float = 3600,
+        min_refetch_interval: float = 60,
+        fetch_timeout: float = 5,
+        executor: Optional[BlockingExecutor] = None,
+    ):
+        """
+        :param url: URL of the JWKS endpoint, None for a static key set.
+        :param snapshot_path: File where the last good key set is saved.
+        :param refresh_interval: Seconds between background refreshes.
+        :param min_refetch_interval: Minimum seconds between two fetches triggered by unknown kids.
+        :param fetch_timeout: Timeout of the HTTP request to the JWKS endpoint.
+        :param executor: Executor running the HTTP request, None for a dedicated one.
+        """
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.fetch_timeout = fetch_timeout
+        self.executor = executor or BlockingExecutor("jwks", 1)
+        self.kid_to_jwk: Dict[str, JWK] = {}
+        self.kid_to_key: Dict[str, object] = {}
+        self.last_fetch_attempt: Optional[float] = None
+        self.last_refresh: Optional[float] = None
+        self.refresh_failures = 0
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        if snapshot_path:
+            self.load_snapshot()
+
+    @classmethod
+    def from_jwks(cls, jwks: JWKS) -> "JWKSProvider":
+        """
+        Create a provider serving a fixed key set.
+
+        :param jwks: Key set to serve.
+        :return: JWKSProvider object.
+        """
+        provider = cls()
+        provider.set_keys(jwks)
+        return provider
+
+    def set_keys(self, jwks: JWKS):
+        """
+        Replace the served key set, constructing each public key once.
+
+        :param jwks: New key set.
+        """
+        kid_to_jwk = {key["kid"]: key for key in jwks.keys}
+        self.kid_to_key = {kid: jwk.construct(key) for kid, key in kid_to_jwk.items()}
+        self.kid_to_jwk = kid_to_jwk
+
+    def load_snapshot(self) -> bool:
+        """
+        Load the key set saved in the snapshot file.
+
+        :return: True if the snapshot was loaded, otherwise False.
+        """
+        try:
+            with open(self.snapshot_path) as snapshot:
+                self.set_keys(JWKS.model_validate(json.load(snapshot)))
+            return True
+        except FileNotFoundError:
+            logger.info(f"No JWKS snapshot found at {self.snapshot_path}")
+        except Exception as e:
+            logger.warning(f"Ignoring invalid JWKS snapshot {self.snapshot_path}: {e}")
+        return False
+
+    def save_snapshot(self, jwks: JWKS):
+        """
+        Atomically write the key set to the snapshot file.
+
+        :param jwks: Key set to save.
+        """
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as snapshot:
+            json.dump(jwks.model_dump(), snapshot)
+        os.replace(snapshot.name, self.snapshot_path)
+
+    def fetch(self) -> JWKS:
+        """
+        Get the key set from the JWKS endpoint.
+
+        :return: Fetched key set.
+        """
+        response = requests.get(self.url, timeout=self.fetch_timeout)
+        response.raise_for_status()
+        return JWKS.model_validate(response.json())
+
+    async def refresh(self) -> bool:
+        """
+        Fetch the key set off the event loop and serve it if it is valid.
+
+        :return: True if the key set was refreshed, otherwise False.
+        """
+        if self.url is None:
+            return False
+        self.last_fetch_attempt = time.monotonic()
+        try:
+            jwks = await self.executor.run(self.fetch)
+            self.set_keys(jwks)
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning(f"Failed to refresh JWKS, serving the last good key set: {e}")
+            return False
+        self.last_refresh = time.time()
+        if self.snapshot_path:
+            try:
+                self.save_snapshot(jwks)
+            except OSError as e:
+                logger.warning(f"Failed to save JWKS snapshot: {e}")
+        return True
+
+    async def refresh_for_unknown_kid(self, kid: str):
+        """
+        Refetch the key set because a token uses a kid that isn't known.
+
+        Concurrent calls share one fetch, and fetches are rate limited.
+
+        :param kid: Unknown key ID.
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if kid in self.kid_to_key:
+                return
+            if (
+                self.last_fetch_attempt is not None
+                and time.monotonic() - self.last_fetch_attempt < self.min_refetch_interval
+            ):
+                return
+            logger.info(f"Unknown JWK kid {kid}, refetching JWKS")
+            await self.refresh()
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def start(self):
+        """
+        Start refreshing the key set in the background.
+        """
+        if self.url is not None and self._task is None:
+            self._task = asyncio.create_task(self.refresh_periodically())
+
+    async def stop(self):
+        """
+        Stop the background refresh.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.kid_to_key),
+            "last_refresh": self.last_refresh,
+            "refresh_failures": self.refresh_failures,
+        }
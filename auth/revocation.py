@@ -0,0 +1,133 @@
+import asyncio
+import time
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+from starlette.status import HTTP_403_FORBIDDEN
+
+from auth.cache import LRUCache
+from auth.user_auth import user_info_with_token
+from concurrency.executor import BlockingExecutor
+
+
+class RevocationPolicy(str, Enum):
+    # Ask Cognito on every request
+    STRICT = "strict"
+    # Reuse Cognito's answer for a token during a short TTL
+    CACHED = "cached"
+    # Trust the signature alone, no Cognito round trip
+    SIGNATURE_ONLY = "signature_only"
+
+
+class RevocationChecker:
+    """
+    Check with Cognito whether access tokens have been revoked.
+
+    Cognito calls run on a bounded executor, concurrent checks of the same
+    token share one lookup, and results are cached: tokens known to be good
+    for `ttl` seconds and revoked tokens for `negative_ttl` seconds (both
+    capped at the token's expiration).
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30,
+        negative_ttl: float = 300,
+        maxsize: int = 4096,
+        max_workers: int = 4,
+        lookup: Optional[Callable[[str], object]] = None,
+        executor: Optional[BlockingExecutor] = None,
+    ):
+        """
+        :param ttl: Seconds a token known to be good is trusted without asking Cognito.
+        :param negative_ttl: Seconds a revoked token is rejected without asking Cognito.
+        :param maxsize: Maximum number of tokens kept in each cache.
+        :param max_workers: Maximum number of concurrent Cognito calls, when no executor is given.
+        :param lookup: Function that calls Cognito with the token (defaults to user_info_with_token).
+        :param executor: Executor running the Cognito calls, e.g. the shared cognito_executor.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lookup = lookup
+        self.known_good = LRUCache(maxsize=maxsize)
+        self.revoked = LRUCache(maxsize=maxsize)
+        self.executor = executor or BlockingExecutor("cognito", max_workers)
+        self.in_flight: Dict[bytes, asyncio.Future] = {}
+        self.lookups = 0
+
+    async def check(
+        self,
+        jwt_token: str,
+        token_digest: bytes,
+        expires_at: Optional[float],
+        policy: RevocationPolicy = RevocationPolicy.CACHED,
+    ):
+        """
+        Verify that a token has not been revoked.
+
+        :param jwt_token: JWT token to verify.
+        :param token_digest: Digest identifying the token in the caches.
+        :param expires_at: Expiration timestamp of the token, if any.
+        :param policy: Revocation policy of the route.
+
+        :raises HTTPException: If the token is revoked or Cognito fails to validate it.
+        """
+        if policy == RevocationPolicy.SIGNATURE_ONLY:
+            return
+        if token_digest in self.revoked:
+            raise self.revoked_exception()
+        if policy == RevocationPolicy.CACHED and self.known_good.get(token_digest):
+            return
+
+        future = self.in_flight.get(token_digest)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch(jwt_token, token_digest, expires_at))
+            self.in_flight[token_digest] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(token_digest, None))
+        await asyncio.shield(future)
+
+    async def fetch(self, jwt_token: str, token_digest: bytes, expires_at: Optional[float]):
+        """
+        Call Cognito off the event loop and cache its answer.
+
+        :raises HTTPException: If the token is revoked or Cognito fails to validate it.
+        """
+        self.lookups += 1
+        lookup = self.lookup or user_info_with_token
+        try:
+            await self.executor.run(lookup, jwt_token)
+        except ClientError as e:
+            # Verifica se a exceção é 'NotAuthorizedException', ou seja, o token foi revogado
+            if e.response["Error"]["Code"] == "NotAuthorizedException":
+                self.revoked.set(token_digest, True, self.cache_expiry(self.negative_ttl, expires_at))
+                raise self.revoked_exception()
+            raise  # Levanta outras exceções de boto3
+        except Exception:
+            # Qualquer outra exceção que precise ser tratada
+            raise HTTPException(
+                status_code=HTTP_403_FORBIDDEN,
+                detail="An error occurred while validating the token",
+            )
+        self.known_good.set(token_digest, True, self.cache_expiry(self.ttl, expires_at))
+
+    @staticmethod
+    def cache_expiry(ttl: float, expires_at: Optional[float]) -> float:
+        expiry = time.time() + ttl
+        return expiry if expires_at is None else min(expiry, expires_at)
+
+    @staticmethod
+    def revoked_exception() -> HTTPException:
+        return HTTPException(
+            status_code=HTTP_403_FORBIDDEN,
+            detail="Access token has been revoked",
+        )
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "in_flight": len(self.in_flight),
+            "known_good": self.known_good.stats(),
+            "revoked": self.revoked.stats(),
+        }
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from auth.cache import LRUCache
+from auth.user_auth import get_user_info_from_user_sub
+from concurrency.executor import BlockingExecutor, cognito_executor
+from metrics.registry import register
+
+load_dotenv()
+
+USER_PROFILE_CACHE_TTL = float(os.environ.get("USER_PROFILE_CACHE_TTL", 300))
+USER_PROFILE_CACHE_SIZE = int(os.environ.get("USER_PROFILE_CACHE_SIZE", 10000))
+
+
+class UserProfileCache:
+    """
+    Cache of the Cognito user profiles looked up by sub.
+
+    Cognito calls run on a bounded executor and concurrent lookups of the
+    same sub share one call. Only found profiles are cached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        maxsize: int = 10000,
+        max_workers: int = 4,
+        lookup: Optional[Callable[[str], Optional[dict]]] = None,
+        executor: Optional[BlockingExecutor] = None,
+    ):
+        """
+        :param ttl: Seconds a profile is served from the cache.
+        :param maxsize: Maximum number of profiles kept.
+        :param max_workers: Maximum number of concurrent Cognito calls, when no executor is given.
+        :param lookup: Function that gets a profile from Cognito (defaults to get_user_info_from_user_sub).
+        :param executor: Executor running the Cognito calls, e.g. the shared cognito_executor.
+        """
+        self.ttl = ttl
+        self.lookup = lookup
+        self.profiles = LRUCache(maxsize=maxsize)
+        self.executor = executor or BlockingExecutor("cognito-users", max_workers)
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.lookups = 0
+
+    async def get(self, user_sub: str) -> Optional[dict]:
+        """
+        Get the profile of a user.
+
+        :param user_sub: Cognito sub of the user.
+        :return: User name and email, or None if the user wasn't found.
+        """
+        profile = self.profiles.get(user_sub)
+        if profile is not None:
+            return profile
+
+        future = self.in_flight.get(user_sub)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch(user_sub))
+            self.in_flight[user_sub] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(user_sub, None))
+        return await asyncio.shield(future)
+
+    async def fetch(self, user_sub: str) -> Optional[dict]:
+        self.lookups += 1
+        lookup = self.lookup or get_user_info_from_user_sub
+        profile = await self.executor.run(lookup, user_sub)
+        if profile is not None:
+            self.profiles.set(user_sub, profile, time.time() + self.ttl)
+        return profile
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "in_flight": len(self.in_flight),
+            **self.profiles.stats(),
+        }
+
+
+user_profiles = UserProfileCache(
+    ttl=USER_PROFILE_CACHE_TTL,
+    maxsize=USER_PROFILE_CACHE_SIZE,
+    executor=cognito_executor,
+)
+register("user_profiles", user_profiles.stats)
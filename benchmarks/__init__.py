@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks run without production secrets, like TICKET_ID_KEY
+os.environ.setdefault("ENVIRONMENT", "development")
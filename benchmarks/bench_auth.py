@@ -0,0 +1,106 @@
+"""
+Measure the CPU cost of authenticating a request on a fixed corpus of tokens.
+
+"before" is the per-request path JWTBearer used to run: split the token in
+validate_jwt_structure and decode_jwt, rsplit it twice, build the pydantic
+credentials and construct the JWK. "after" is parse_jwt plus the key
+pre-constructed by the JWKS provider, and "cached" is a repeat token served
+from the verified-token cache.
+
+    python -m benchmarks.bench_auth --tokens 200 --rounds 5
+"""
+import argparse
+import base64
+import json
+import random
+import time
+
+from jose import jwk
+from jose.utils import base64url_decode
+
+from auth.JWTBearer import JWKS, JWTAuthorizationCredentials, JWTBearer, parse_jwt
+from auth.revocation import RevocationPolicy
+from tests.services.helpers import generate_rsa_jwk, sign_token
+
+
+def legacy_parse(token: str) -> JWTAuthorizationCredentials:
+    if len(token.split(".")) != 3:
+        raise ValueError("Invalid JWT structure")
+    header, payload, _ = token.split(".")
+    decoded_header = json.loads(base64.urlsafe_b64decode(header + "==").decode("utf-8"))
+    claims = json.loads(base64.urlsafe_b64decode(payload + "==").decode("utf-8"))
+    claims.pop("version", None)
+    for claim in ["auth_time", "iat", "exp"]:
+        if claim in claims:
+            claims[claim] = str(claims[claim])
+    return JWTAuthorizationCredentials(
+        jwt_token=token,
+        header=decoded_header,
+        claims=claims,
+        signature=token.rsplit(".", 1)[-1],
+        message=token.rsplit(".", 1)[0],
+    )
+
+
+def legacy_verify(kid_to_jwk: dict, token: str) -> bool:
+    credentials = legacy_parse(token)
+    key = jwk.construct(kid_to_jwk[credentials.header["kid"]])
+    decoded_signature = base64url_decode(credentials.signature.encode())
+    return key.verify(credentials.message.encode(), decoded_signature)
+
+
+def cpu_per_call(function, tokens: list[str], rounds: int) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        for token in tokens:
+            function(token)
+    return (time.process_time() - start) / (rounds * len(tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    keys = [generate_rsa_jwk(f"kid_{i}") for i in range(2)]
+    tokens = []
+    for i in range(args.tokens):
+        private_pem, public_jwk = keys[i % len(keys)]
+        tokens.append(
+            sign_token(
+                private_pem,
+                public_jwk["kid"],
+                username=f"user_{i}",
+                **{"cognito:groups": ["Admin"] if random.random() < 0.1 else []},
+            )
+        )
+
+    bearer = JWTBearer(JWKS(keys=[public_jwk for _, public_jwk in keys]))
+    bearer.revocation_policy = RevocationPolicy.SIGNATURE_ONLY
+    kid_to_jwk = {public_jwk["kid"]: public_jwk for _, public_jwk in keys}
+
+    for token in tokens:
+        credentials = parse_jwt(token)
+        assert legacy_verify(kid_to_jwk, token) and bearer.verify_jwk_token(credentials)
+        bearer.verified_tokens.set(bearer.token_digest(token), credentials, bearer.token_expiry(credentials.claims))
+
+    results = {
+        "parse, before": cpu_per_call(legacy_parse, tokens, args.rounds),
+        "parse, after": cpu_per_call(parse_jwt, tokens, args.rounds),
+        "parse + verify, before": cpu_per_call(lambda token: legacy_verify(kid_to_jwk, token), tokens, args.rounds),
+        "parse + verify, after": cpu_per_call(
+            lambda token: bearer.verify_jwk_token(parse_jwt(token)), tokens, args.rounds
+        ),
+        "cached token": cpu_per_call(
+            lambda token: bearer.verified_tokens.get(bearer.token_digest(token)), tokens, args.rounds
+        ),
+    }
+    for name, seconds in results.items():
+        print(f"{name:24} {seconds * 1e6:10.1f} us CPU per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare writing checkout events one transaction per message, as
+process_message does, with the batching mode, which writes each batch of
+messages in one transaction (async_crud.buy_tickets_batch).
+
+Runs on a SQLite file so every commit reaches the disk.
+
+    python -m benchmarks.bench_batch_consumer --events 1000 --batch-sizes 10 50 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from crud import async_crud
+from db.migrate import migrate
+from schemas.userticket import UserTicketCreate
+from tests.crud.helpers import ticket_model
+
+
+async def noop_callback(db, ticket_db):
+    pass
+
+
+def make_orders(events: int, offset: int) -> list:
+    order = UserTicketCreate(
+        user_id="bench", ticket_id=1, unit_amount=10.0, created_at="2023-10-01T12:00:00", quantity=2
+    )
+    return [(order, f"checkout.session.completed:cs_{offset + i}") for i in range(events)]
+
+
+async def write(path: str, orders: list, batch_size: int) -> tuple[float, int]:
+    """
+    :return: Seconds and number of commits
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    commits = []
+    event.listen(engine.sync_engine, "commit", lambda connection: commits.append(1))
+    make_session = async_sessionmaker(engine, expire_on_commit=False)
+    start = time.perf_counter()
+    for index in range(0, len(orders), batch_size):
+        batch = orders[index:index + batch_size]
+        async with make_session() as db:
+            if batch_size == 1:
+                ticket, key = batch[0]
+                await async_crud.buy_tickets(db, ticket, noop_callback, event_key=key)
+            else:
+                await async_crud.buy_tickets_batch(db, batch, noop_callback)
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed, len(commits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 50, 100])
+    args = parser.parse_args()
+    logging.getLogger("crud.async_crud").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        migrate(engine)
+        with Session(engine) as db:
+            db.add(ticket_model(id=1))
+            db.commit()
+        engine.dispose()
+
+        print(f"{'mode':16} {'events/s':>10} {'commits':>8}")
+        for offset, batch_size in enumerate([1] + args.batch_sizes):
+            orders = make_orders(args.events, offset * args.events)
+            elapsed, commits = asyncio.run(write(path, orders, batch_size))
+            name = "per message" if batch_size == 1 else f"batches of {batch_size}"
+            print(f"{name:16} {args.events / elapsed:>10.0f} {commits:>8}")
+
+
+if __name__ == "__main__":
+    main()
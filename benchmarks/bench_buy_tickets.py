@@ -0,0 +1,100 @@
+"""
+Compare writing an order of N tickets with the per-unit loop buy_tickets used
+to run (collision query, add, commit and refresh per ticket) against the
+set-based version (ids from the allocator, one bulk insert, one commit).
+
+Runs on a SQLite file so every commit reaches the disk. Statements counts are
+the round trips a networked database like MySQL would pay for.
+
+    python -m benchmarks.bench_buy_tickets --sizes 1 10 100 1000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import string
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from crud.crud import buy_tickets
+from db.migrate import migrate
+from models.userticket import UserTicket as UserTicketModel
+from schemas.userticket import UserTicketCreate
+from tests.crud.helpers import ticket_model
+
+
+def generate_random_user_ticket_id(id_length: int) -> str:
+    return ''.join(secrets.choice(string.digits) for _ in range(id_length))
+
+
+async def legacy_buy_tickets(db: Session, ticket: UserTicketCreate, send_message_callback):
+    for _ in range(ticket.quantity):
+        ticket_db = UserTicketModel(**ticket.model_dump(exclude={'quantity'}))
+        random_ticket_id = generate_random_user_ticket_id(12)
+        while db.query(UserTicketModel).filter(UserTicketModel.id == random_ticket_id).first() is not None:
+            random_ticket_id = generate_random_user_ticket_id(12)
+        ticket_db.id = random_ticket_id
+        db.add(ticket_db)
+        db.commit()
+        db.refresh(ticket_db)
+        await send_message_callback(db, ticket_db)
+
+
+async def noop_callback(db, ticket_db):
+    pass
+
+
+def measure(engine, function, quantity: int, rounds: int) -> tuple[float, float]:
+    """
+    :return: Seconds and statements per order
+    """
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count)
+    order = UserTicketCreate(
+        user_id="bench", ticket_id=1, unit_amount=10.0, created_at="2023-10-01T12:00:00", quantity=quantity
+    )
+    make_session = sessionmaker(bind=engine)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with make_session() as db:
+            asyncio.run(function(db, order, noop_callback))
+    elapsed = time.perf_counter() - start
+    event.remove(engine, "before_cursor_execute", count)
+    return elapsed / rounds, len(statements) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("crud.crud").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        migrate(engine)
+        with Session(engine) as db:
+            db.add(ticket_model(id=1))
+            db.commit()
+
+        print(f"{'size':>6} {'before ms':>10} {'stmts':>7} {'after ms':>10} {'stmts':>7} {'speedup':>8}")
+        for size in args.sizes:
+            before, before_statements = measure(engine, legacy_buy_tickets, size, args.rounds)
+            after, after_statements = measure(engine, buy_tickets, size, args.rounds)
+            print(
+                f"{size:>6} {before * 1e3:>10.1f} {before_statements:>7.0f} "
+                f"{after * 1e3:>10.1f} {after_statements:>7.0f} {before / after:>7.1f}x"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure the throughput of the payments consumer against an in-memory broker
+stand-in. Handling a message waits `--latency` seconds, standing in for the
+database and Cognito round trips of process_message.
+
+"before" is the listener lifespan used to run, handling one message at a
+time; "after" is KeyedConsumer with the given workers and prefetch counts,
+ordering the messages by user.
+
+    python -m benchmarks.bench_consumer --messages 500 --users 100 --latency 0.01
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from messaging.consumer import KeyedConsumer
+from routers.ticket import message_key
+from tests.messaging.helpers import InMemoryQueue
+
+
+def make_bodies(messages: int, users: int) -> list[bytes]:
+    return [
+        json.dumps({"event": "checkout.session.completed", "user_id": f"user_{i % users}", "session_id": f"cs_{i}"}).encode()
+        for i in range(messages)
+    ]
+
+
+def make_handler(latency: float):
+    async def handler(body: bytes):
+        json.loads(body)
+        await asyncio.sleep(latency)
+
+    return handler
+
+
+async def sequential(bodies: list[bytes], latency: float) -> float:
+    handler = make_handler(latency)
+    queue = InMemoryQueue(bodies, prefetch=len(bodies))
+    start = time.perf_counter()
+    for message in queue.pending:
+        async with message.process():
+            await handler(message.body)
+    return time.perf_counter() - start
+
+
+async def concurrent(bodies: list[bytes], latency: float, workers: int, prefetch: int) -> float:
+    queue = InMemoryQueue(bodies, prefetch=prefetch)
+    consumer = KeyedConsumer(make_handler(latency), workers=workers, key=message_key)
+    start = time.perf_counter()
+    await consumer.start(queue)
+    await queue.done.wait()
+    elapsed = time.perf_counter() - start
+    await consumer.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 32])
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[8, 32, 128])
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.messages, args.users)
+    elapsed = asyncio.run(sequential(bodies, args.latency))
+    print(f"{'before':24} {args.messages / elapsed:10.0f} msg/s")
+    for workers in args.workers:
+        for prefetch in args.prefetch:
+            elapsed = asyncio.run(concurrent(bodies, args.latency, workers, prefetch))
+            name = f"workers={workers} prefetch={prefetch}"
+            print(f"{name:24} {args.messages / elapsed:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
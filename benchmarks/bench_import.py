@@ -0,0 +1,89 @@
+"""
+Measure how long a worker takes to import the app.
+
+A local HTTP server stands in for Cognito's JWKS endpoint, answering after a
+configurable delay. The app is imported in fresh interpreters, once as it is
+now (keys from the snapshot, no network call) and once followed by the
+blocking JWKS request that auth/auth.py used to make at import time.
+
+    python -m benchmarks.bench_import --runs 10 --latency 0.15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_APP = "import main"
+IMPORT_APP_WITH_FETCH = "import main, os, requests; requests.get(os.environ['BENCH_JWKS_URL'])"
+TIMED = "import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+
+
+def serve_jwks(latency: float) -> ThreadingHTTPServer:
+    class JWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"keys": []}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_import(code: str, env: dict, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", TIMED.format(code=code)],
+            cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.15, help="JWKS endpoint latency in seconds")
+    args = parser.parse_args()
+
+    server = serve_jwks(args.latency)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "jwks.json")
+        with open(snapshot_path, "w") as snapshot:
+            json.dump({"keys": []}, snapshot)
+        env = {
+            **os.environ,
+            "JWKS_SNAPSHOT_PATH": snapshot_path,
+            "BENCH_JWKS_URL": f"http://127.0.0.1:{server.server_port}/.well-known/jwks.json",
+        }
+
+        # Warm up the filesystem caches before measuring
+        time_import(IMPORT_APP, env, 1)
+        lazy = time_import(IMPORT_APP, env, args.runs)
+        eager = time_import(IMPORT_APP_WITH_FETCH, env, args.runs)
+    server.shutdown()
+
+    lazy_median, eager_median = statistics.median(lazy), statistics.median(eager)
+    print(f"import with JWKS fetch:    {eager_median * 1000:8.1f} ms (median of {args.runs})")
+    print(f"import with JWKS snapshot: {lazy_median * 1000:8.1f} ms (median of {args.runs})")
+    print(f"saved per worker start:    {(eager_median - lazy_median) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
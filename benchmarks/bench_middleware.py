@@ -0,0 +1,81 @@
+"""
+Measure the per-request overhead of the database session middleware.
+
+"before" is the @app.middleware("http") function main.py used to run, which
+wraps every request in BaseHTTPMiddleware and opens a SessionLocal for it,
+"after" is DBSessionMiddleware, which only opens a session for routes that
+use one, and "none" is the bare app. Every variant keeps CORSMiddleware and
+serves /health.
+
+    python -m benchmarks.bench_middleware --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm import sessionmaker
+
+from db.database import create_pooled_engine
+from db.middleware import DBSessionMiddleware
+
+
+def create_app(variant: str, session_factory) -> FastAPI:
+    app = FastAPI()
+
+    if variant == "before":
+
+        @app.middleware("http")
+        async def db_session_middleware(request: Request, call_next):
+            request.state.db = session_factory()
+            response = await call_next(request)
+            request.state.db.close()
+            return response
+
+    elif variant == "after":
+        app.add_middleware(DBSessionMiddleware, session_factory=session_factory, async_session_factory=None)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.get("/health")
+    def get_health():
+        return {"status": "ok"}
+
+    return app
+
+
+async def seconds_per_request(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            await client.get("/health")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/health")
+        return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = create_pooled_engine("sqlite://", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    for variant in ["none", "before", "after"]:
+        seconds = asyncio.run(seconds_per_request(create_app(variant, session_factory), args.requests))
+        print(f"{variant:8} {seconds * 1e6:10.1f} us per /health request")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Measure publish throughput and confirm latency against an in-memory broker
+stand-in, where writing a frame takes `--write-time` seconds and a confirm
+arrives `--confirm-latency` seconds later.
+
+"before" is send_message as it used to be: one exchange on one channel,
+awaiting each publish before the next one. The other rows use Publisher with
+the given numbers of channels, fed by `--producers` concurrent producers
+(e.g. the outbox relay and the request handlers).
+
+    python -m benchmarks.bench_publisher --messages 2000 --confirm-latency 0.002
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from aio_pika import Message
+
+from messaging.publisher import Publisher
+from messaging.publisher import logger as publisher_logger
+from tests.messaging.helpers import InMemoryExchange
+
+
+def make_bodies(messages: int) -> list[bytes]:
+    return [json.dumps({"event": "ticket_stock_updated", "ticket_id": i, "stock": 10}).encode() for i in range(messages)]
+
+
+async def sequential(bodies: list[bytes], confirm_latency: float, write_time: float) -> tuple[float, float]:
+    exchange = InMemoryExchange(confirm_latency=confirm_latency, write_time=write_time)
+    start = time.perf_counter()
+    for body in bodies:
+        await exchange.publish(Message(body=body), routing_key="tickets.messages")
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed / len(bodies)
+
+
+async def pooled(
+    bodies: list[bytes], confirm_latency: float, write_time: float, channels: int, producers: int, buffer_size: int
+) -> tuple[float, float, float]:
+    async def open_exchange():
+        return InMemoryExchange(confirm_latency=confirm_latency, write_time=write_time)
+
+    publisher = Publisher(open_exchange, channels=channels, buffer_size=buffer_size)
+    await publisher.start()
+
+    async def produce(producer: int):
+        await asyncio.gather(
+            *(
+                publisher.publish(f"tickets.messages.{i % channels}", body)
+                for i, body in enumerate(bodies[producer::producers])
+            )
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(produce(producer) for producer in range(producers)))
+    elapsed = time.perf_counter() - start
+    stats = publisher.stats()
+    await publisher.stop()
+    return elapsed, stats["confirm_latency_avg"], stats["confirm_latency_max"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--confirm-latency", type=float, default=0.002)
+    parser.add_argument("--write-time", type=float, default=0.0)
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--buffer-size", type=int, default=1000)
+    args = parser.parse_args()
+    publisher_logger.setLevel(logging.WARNING)
+
+    bodies = make_bodies(args.messages)
+    elapsed, latency = asyncio.run(sequential(bodies, args.confirm_latency, args.write_time))
+    print(f"{'before':12} {args.messages / elapsed:10.0f} msg/s  confirm avg {latency * 1000:7.2f} ms")
+    for channels in args.channels:
+        elapsed, latency_avg, latency_max = asyncio.run(
+            pooled(bodies, args.confirm_latency, args.write_time, channels, args.producers, args.buffer_size)
+        )
+        name = f"channels={channels}"
+        print(
+            f"{name:12} {args.messages / elapsed:10.0f} msg/s  confirm avg {latency_avg * 1000:7.2f} ms"
+            f"  max {latency_max * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
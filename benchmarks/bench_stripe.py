@@ -0,0 +1,78 @@
+"""
+Measure ticket provisioning latency and throughput against a fake Stripe
+whose requests take `--latency` seconds.
+
+"before" is create_ticket as it used to be: File.create, FileLink.create and
+Product.create one after another, each a blocking call on a pool of 8
+threads. "after" is StripeGateway: two async round trips over one pool of
+keep-alive connections, the link being created with the file.
+
+    python -m benchmarks.bench_stripe --latency 0.05 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gateways.stripe_gateway import StripeGateway
+from tests.gateways.fake_stripe import FakeStripe
+from tests.routers.helpers import png_bytes
+
+STRIPE_THREADS = 8
+
+
+async def before(tickets: int, latency: float) -> list[float]:
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(STRIPE_THREADS)
+
+    async def create():
+        started_at = time.perf_counter()
+        for _ in range(3):
+            await loop.run_in_executor(executor, time.sleep, latency)
+        return time.perf_counter() - started_at
+
+    try:
+        return await asyncio.gather(*(create() for _ in range(tickets)))
+    finally:
+        executor.shutdown()
+
+
+async def after(tickets: int, latency: float) -> list[float]:
+    fake = FakeStripe(latency=latency)
+    stripe_gateway = StripeGateway("sk_test", api_base="http://stripe.test", transport=fake.transport())
+    image = png_bytes(600, 400)
+
+    async def create(n: int):
+        started_at = time.perf_counter()
+        await stripe_gateway.create_product(f"Ticket {n}", "Final match", True, 15000, io.BytesIO(image), "image.png")
+        return time.perf_counter() - started_at
+
+    try:
+        return await asyncio.gather(*(create(n) for n in range(tickets)))
+    finally:
+        await stripe_gateway.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+    logging.getLogger("stripe").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    for concurrency in args.concurrency:
+        for name, run in [("before", before), ("after", after)]:
+            started_at = time.perf_counter()
+            latencies = asyncio.run(run(concurrency, args.latency))
+            elapsed = time.perf_counter() - started_at
+            print(
+                f"{name:6} concurrency={concurrency:<4} {concurrency / elapsed:8.1f} tickets/s"
+                f"  latency avg {sum(latencies) / len(latencies) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measure the memory used by ticket image uploads to Stripe as concurrency grows.
+
+Each upload is a PNG of `--size` bytes held in a SpooledTemporaryFile, as
+Starlette stores multipart files (in memory up to 1MB, then on disk), and
+goes through the real StripeGateway and its httpx client. Only the socket is
+replaced: the transport reads the request body chunk by chunk, as it would
+be written to the network, and answers like Stripe's files API.
+
+"before" copies the upload into a BytesIO and hands it to the Stripe SDK,
+which builds the whole multipart body in memory; "after" checks the PNG
+header and streams the spooled file with StripeGateway.upload_image.
+
+    python -m benchmarks.bench_upload --size 2000000 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import io
+import json
+import tempfile
+import tracemalloc
+
+import httpx
+
+from gateways.stripe_gateway import StripeGateway
+from tests.routers.helpers import png_bytes
+from uploads.png import read_png_header
+
+SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class FilesTransport(httpx.AsyncBaseTransport):
+    """
+    Stand-in for the socket to Stripe's files API: the body is read and dropped.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.uploads = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async for _ in request.stream:
+            pass
+        await asyncio.sleep(self.latency)
+        self.uploads += 1
+        links = {"object": "list", "data": [{"url": f"https://files.example.com/links/{self.uploads}"}]}
+        return httpx.Response(200, content=json.dumps({"id": f"file_{self.uploads}", "object": "file", "links": links}))
+
+
+def spooled_upload(content: bytes) -> tempfile.SpooledTemporaryFile:
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for start in range(0, len(content), CHUNK_SIZE):
+        file.write(content[start:start + CHUNK_SIZE])
+    file.seek(0)
+    return file
+
+
+async def before(stripe_gateway: StripeGateway, file):
+    await stripe_gateway.client.files.create_async(
+        params={"purpose": "product_image", "file": io.BytesIO(file.read()), "file_link_data": {"create": True}}
+    )
+
+
+async def after(stripe_gateway: StripeGateway, file):
+    read_png_header(file)
+    await stripe_gateway.upload_image(file, "image.png")
+
+
+def peak_memory(upload, content: bytes, concurrency: int, latency: float) -> int:
+    files = [spooled_upload(content) for _ in range(concurrency)]
+
+    async def run():
+        stripe_gateway = StripeGateway(
+            "sk_test", api_base="http://stripe.test", max_connections=concurrency, transport=FilesTransport(latency)
+        )
+        try:
+            await asyncio.gather(*(upload(stripe_gateway, file) for file in files))
+        finally:
+            await stripe_gateway.close()
+
+    tracemalloc.start()
+    asyncio.run(run())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for file in files:
+        file.close()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2_000_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    content = png_bytes(800, 600, padding=args.size)
+    for concurrency in args.concurrency:
+        for name, upload in [("before", before), ("after", after)]:
+            peak = peak_memory(upload, content, concurrency, args.latency)
+            print(
+                f"{name:7} concurrency={concurrency:<4} peak {peak / 2**20:8.2f} MiB"
+                f"  per upload {peak / concurrency / 2**20:6.2f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from dotenv import load_dotenv
+
+from metrics.registry import register
+
+load_dotenv()
+
+COGNITO_MAX_WORKERS = int(os.environ.get("COGNITO_MAX_WORKERS", 8))
+DB_SYNC_MAX_WORKERS = int(os.environ.get("DB_SYNC_MAX_WORKERS", 8))
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """
+    Run blocking calls (SDKs, sync database sessions) off the event loop on a bounded thread pool.
+
+    At most `max_workers` calls run at once. The others wait on the event
+    loop, where they can be cancelled, instead of in the executor's queue, so
+    the queue depth and the time spent waiting for a thread are measurable.
+    An asyncio semaphore only works on one event loop, so each loop using the
+    executor (e.g. after a restart, or in tests) waits on its own, the thread
+    pool itself being bounded too.
+    """
+
+    def __init__(self, name: str, max_workers: int = 8):
+        """
+        :param name: Name of the executor, prefix of its thread names.
+        :param max_workers: Maximum number of concurrent calls.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.queued = 0
+        self.running = 0
+        self.calls = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Call a blocking function in a thread of the pool.
+
+        :param func: Blocking function.
+        :return: Result of the function.
+        :raises Exception: The exception raised by the function.
+        """
+        slots = self.slots()
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.queued -= 1
+        started_at = time.monotonic()
+        self.record_wait(started_at - queued_at)
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        future.add_done_callback(lambda _: self.finish(future, started_at, slots))
+        # A cancelled caller doesn't free the slot before the thread is done
+        return await asyncio.shield(future)
+
+    def slots(self) -> asyncio.Semaphore:
+        """
+        :return: Semaphore bounding the calls of the running event loop, created on its first call.
+        """
+        loop = asyncio.get_running_loop()
+        slots = self.loop_slots.get(loop)
+        if slots is None:
+            slots = self.loop_slots[loop] = asyncio.Semaphore(self.max_workers)
+        return slots
+
+    def finish(self, future: asyncio.Future, started_at: float, slots: asyncio.Semaphore):
+        self.running -= 1
+        self.calls += 1
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        self.record_run(time.monotonic() - started_at)
+        slots.release()
+
+    def record_wait(self, wait_time: float):
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def record_run(self, run_time: float):
+        self.run_time_total += run_time
+        self.run_time_max = max(self.run_time_max, run_time)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "running": self.running,
+            "calls": self.calls,
+            "failed": self.failed,
+            "wait_time_avg": self.wait_time_total / self.calls if self.calls else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "run_time_avg": self.run_time_total / self.calls if self.calls else 0.0,
+            "run_time_max": self.run_time_max,
+        }
+
+
+# Shared by the call sites of each blocking dependency, so a slow one can't take the threads of the others
+cognito_executor = BlockingExecutor("cognito", COGNITO_MAX_WORKERS)
+db_executor = BlockingExecutor("db-sync", DB_SYNC_MAX_WORKERS)
+
+register("executor_cognito", cognito_executor.stats)
+register("executor_db_sync", db_executor.stats)
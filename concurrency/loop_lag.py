@@ -0,0 +1,69 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop runs its callbacks.
+
+    A task asks to wake up every `interval` seconds; how much later than
+    asked it actually wakes up is the lag, the time the loop was blocked by
+    other work (e.g. a blocking call made on the loop).
+    """
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.1):
+        """
+        :param interval: Seconds between two measures.
+        :param stall_threshold: Lag in seconds from which the loop is counted as stalled.
+        """
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._task: Optional[asyncio.Task] = None
+        self.samples = 0
+        self.stalls = 0
+        self.lag_last = 0.0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(time.perf_counter() - expected, 0.0))
+
+    def record(self, lag: float):
+        self.samples += 1
+        self.lag_last = lag
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        if lag >= self.stall_threshold:
+            self.stalls += 1
+
+    def start(self):
+        """
+        Start measuring in the background.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop measuring.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "lag_last": self.lag_last,
+            "lag_avg": self.lag_total / self.samples if self.samples else 0.0,
+            "lag_max": self.lag_max,
+        }
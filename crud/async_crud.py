@@ -0,0 +1,401 @@
+import json
+import logging
+import sys
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.ticket import Ticket
+from models.ticket import Ticket as TicketModel
+from models.outboxmessage import OutboxMessage
+from models.processedevent import ProcessedEvent
+from models.stripeimage import StripeImage
+from models.userticket import UserTicket as UserTicketModel
+
+from crud.crud import validate_ticket_statement, validation_error
+from crud.ticket_ids import ticket_id_allocator
+from schemas.ticket import TicketCreate, TicketUpdate
+from schemas.userticket import (
+    UserTicketCreate,
+    UserTicket,
+    to_utc,
+    utc_now,
+)
+
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Async versions of the functions in crud.crud, for the async routes and the message consumer
+
+
+async def post_ticket(
+    db: AsyncSession,
+    ticket: TicketCreate,
+    stripe_prod_id: str,
+    stripe_price_id: str,
+    stripe_image_url: str,
+    outbox_messages: Optional[Callable[[Ticket], List[Tuple[dict, str]]]] = None,
+    provisioning_status: str = "ready",
+):
+    """
+    Create a ticket.
+
+    :param stripe_prod_id: id for the product in stripe
+    :param stripe_price_id id for the corresponding price object in stripe
+    :param stripe_image_url: url for the ticket product image
+    :param db: Database session
+    :param ticket: Ticket to create
+    :param outbox_messages: Function giving the messages announcing the ticket, written to the outbox in the same transaction
+    :param provisioning_status: "provisioning" if the stripe fields are filled in later by provision_ticket
+    :return: Ticket created
+    """
+    ticket_dict = ticket.model_dump(exclude={'stock'})
+    ticket_dict['stripe_prod_id'] = stripe_prod_id
+    ticket_dict['stripe_price_id'] = stripe_price_id
+    ticket_dict['stripe_image_url'] = stripe_image_url
+    ticket_dict['provisioning_status'] = provisioning_status
+    ticket_db = TicketModel(**ticket_dict)
+    db.add(ticket_db)
+    if outbox_messages is not None:
+        # The id of the ticket is needed by its messages
+        await db.flush()
+        for message, routing_key in outbox_messages(ticket_db):
+            add_outbox_message(db, message, routing_key)
+    await db.commit()
+    await db.refresh(ticket_db)
+    return ticket_db
+
+
+async def provision_ticket(
+    db: AsyncSession,
+    ticket_id: int,
+    stripe_prod_id: str,
+    stripe_price_id: str,
+    stripe_image_url: str,
+    outbox_messages: Optional[Callable[[Ticket], List[Tuple[dict, str]]]] = None,
+):
+    """
+    Fill in the stripe fields of a ticket created while provisioning and mark it ready.
+
+    :param db: Database session
+    :param ticket_id: Id of the ticket
+    :param stripe_prod_id: id for the product in stripe
+    :param stripe_price_id: id for the corresponding price object in stripe
+    :param stripe_image_url: url for the ticket product image
+    :param outbox_messages: Function giving the messages announcing the ticket, written to the outbox in the same transaction
+    :return: Ticket provisioned
+    """
+    ticket = await get_ticket_by_id(db, ticket_id)
+    ticket.stripe_prod_id = stripe_prod_id
+    ticket.stripe_price_id = stripe_price_id
+    ticket.stripe_image_url = stripe_image_url
+    ticket.provisioning_status = "ready"
+    if outbox_messages is not None:
+        for message, routing_key in outbox_messages(ticket):
+            add_outbox_message(db, message, routing_key)
+    await db.commit()
+    await db.refresh(ticket)
+    return ticket
+
+
+async def fail_ticket_provisioning(db: AsyncSession, ticket_id: int):
+    """
+    Mark a ticket whose stripe product couldn't be created.
+
+    :param db: Database session
+    :param ticket_id: Id of the ticket
+    """
+    ticket = await get_ticket_by_id(db, ticket_id)
+    ticket.provisioning_status = "failed"
+    await db.commit()
+
+
+async def update_ticket(
+    db: AsyncSession,
+    ticket: Ticket,
+    ticket_update: TicketUpdate,
+    outbox_messages: Optional[Callable[[Ticket], List[Tuple[dict, str]]]] = None,
+):
+    """
+    Update a ticket.
+
+    :param db: Database session
+    :param ticket: Ticket database model
+    :param ticket_update: Ticket data to update
+    :param outbox_messages: Function giving the messages announcing the update, written to the outbox in the same transaction
+    :return: Ticket updated
+    """
+    ticket_update_parameters = ticket_update.model_dump(exclude_none=True)
+    for field_name, field_value in ticket_update_parameters.items():
+        setattr(ticket, field_name, field_value)
+    if outbox_messages is not None:
+        for message, routing_key in outbox_messages(ticket):
+            add_outbox_message(db, message, routing_key)
+    await db.commit()
+    await db.refresh(ticket)
+    return ticket
+
+
+async def buy_tickets(
+    db: AsyncSession,
+    ticket: UserTicketCreate,
+    send_message_callback: Callable,
+    event_key: Optional[str] = None,
+):
+    """
+    Buy various ticket and assign them different generated ids.
+
+    The ids come from the ticket id allocator, so no collision check is needed.
+    The whole order is written in one transaction with a single bulk insert.
+    The callback is invoked once with the tickets of the order before the commit,
+    so the messages it adds to the outbox are committed with them.
+
+    :param send_message_callback: callback adding the order's messages for the email microservice to the outbox
+    :param db: Database session
+    :param ticket: Ticket to buy
+    :param event_key: Key of the event ordering the tickets, recorded in the same transaction
+    :return: Tickets bought, or None if the event was already processed
+    """
+    ticket_fields = ticket.model_dump(exclude={'quantity'})
+    rows = [{**ticket_fields, "id": ticket_id} for ticket_id in await ticket_id_allocator.allocate_async(db, ticket.quantity)]
+    if event_key is not None:
+        try:
+            await db.execute(insert(ProcessedEvent).values(event_key=event_key, processed_at=utc_now()))
+        except IntegrityError:
+            await db.rollback()
+            logger.info(f"Event {event_key} already processed")
+            return None
+    await db.execute(insert(UserTicketModel), rows)
+    tickets_db = [UserTicketModel(**row) for row in rows]
+    await send_message_callback(db, tickets_db)
+    await db.commit()
+    logger.info(f"Tickets bought: {[row['id'] for row in rows]} for {ticket_fields}")
+    return tickets_db
+
+
+async def buy_tickets_batch(
+    db: AsyncSession,
+    orders: List[Tuple[UserTicketCreate, Optional[str]]],
+    send_message_callback: Callable,
+):
+    """
+    Buy the tickets of several orders in one transaction.
+
+    :param send_message_callback: callback adding each order's messages for the email microservice to the outbox
+    :param db: Database session
+    :param orders: Tickets to buy, each with the key of the event ordering them
+    :return: Tickets bought
+    :raises IntegrityError: If an event was already processed, in which case nothing is written
+    """
+    ticket_ids = iter(await ticket_id_allocator.allocate_async(db, sum(ticket.quantity for ticket, _ in orders)))
+    order_rows = [
+        [{**ticket.model_dump(exclude={'quantity'}), "id": next(ticket_ids)} for _ in range(ticket.quantity)]
+        for ticket, _ in orders
+    ]
+    processed_at = utc_now()
+    events = [{"event_key": key, "processed_at": processed_at} for _, key in orders if key is not None]
+    order_tickets = [[UserTicketModel(**row) for row in rows] for rows in order_rows]
+    try:
+        if events:
+            await db.execute(insert(ProcessedEvent), events)
+        await db.execute(insert(UserTicketModel), [row for rows in order_rows for row in rows])
+        for tickets_db in order_tickets:
+            await send_message_callback(db, tickets_db)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    logger.info(f"Tickets bought: {[[ticket_db.id for ticket_db in tickets_db] for tickets_db in order_tickets]}")
+    return [ticket_db for tickets_db in order_tickets for ticket_db in tickets_db]
+
+
+def add_outbox_message(db: AsyncSession, message: dict, routing_key: str):
+    """
+    Add a message to the outbox, to be published once the transaction is committed.
+
+    :param db: Database session
+    :param message: Message to publish
+    :param routing_key: Routing key of the message
+    """
+    db.add(OutboxMessage(routing_key=routing_key, body=json.dumps(message), created_at=utc_now()))
+
+
+async def get_outbox_messages(db: AsyncSession, limit: int):
+    """
+    Get the oldest messages of the outbox, locking them until the end of the transaction.
+
+    Rows locked by another relay are skipped (ignored by SQLite, which locks the whole database).
+
+    :param db: Database session
+    :param limit: Maximum number of messages
+    :return: List of messages in publication order
+    """
+    result = await db.scalars(
+        select(OutboxMessage).order_by(OutboxMessage.id).limit(limit).with_for_update(skip_locked=True)
+    )
+    return result.all()
+
+
+async def delete_outbox_messages(db: AsyncSession, ids: List[int]):
+    """
+    Delete published messages from the outbox.
+
+    :param db: Database session
+    :param ids: IDs of the published messages
+    """
+    if ids:
+        await db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+    await db.commit()
+
+
+async def get_stripe_image(db: AsyncSession, digest: str):
+    """
+    Get the Stripe file of an image uploaded before.
+
+    :param db: Database session
+    :param digest: SHA-256 of the image
+    :return: Stripe image, or None if the image was never uploaded
+    """
+    return await db.get(StripeImage, digest)
+
+
+async def add_stripe_image(db: AsyncSession, digest: str, stripe_file_id: str, url: str):
+    """
+    Record the Stripe file of an uploaded image.
+
+    The image may have been recorded concurrently by another request, the first record is kept.
+
+    :param db: Database session
+    :param digest: SHA-256 of the image
+    :param stripe_file_id: id of the file in stripe
+    :param url: url of the public link of the file
+    """
+    try:
+        await db.execute(
+            insert(StripeImage).values(digest=digest, stripe_file_id=stripe_file_id, url=url, created_at=utc_now())
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+
+
+async def get_tickets_by_user_id(db: AsyncSession, user_id: str):
+    """
+    Get tickets for a specific user ID.
+
+    :param db: Database session
+    :param user_id: ID of the user
+    :return: List of tickets ID for the user
+    """
+    result = await db.scalars(select(UserTicketModel).where(UserTicketModel.user_id == user_id))
+    return result.all()
+
+
+async def get_tickets_sold_between(db: AsyncSession, start: datetime, end: Optional[datetime] = None):
+    """
+    Get the tickets bought in a time window, e.g. the last hour.
+
+    :param db: Database session
+    :param start: Start of the window (inclusive), in UTC if naive
+    :param end: End of the window (exclusive), None for now
+    :return: List of tickets ordered by purchase time
+    """
+    query = select(UserTicketModel).where(UserTicketModel.created_at >= to_utc(start))
+    if end is not None:
+        query = query.where(UserTicketModel.created_at < to_utc(end))
+    result = await db.scalars(query.order_by(UserTicketModel.created_at))
+    return result.all()
+
+
+async def get_tickets_validated_between(db: AsyncSession, start: datetime, end: Optional[datetime] = None):
+    """
+    Get the tickets validated in a time window, e.g. since kickoff.
+
+    :param db: Database session
+    :param start: Start of the window (inclusive), in UTC if naive
+    :param end: End of the window (exclusive), None for now
+    :return: List of tickets ordered by validation time
+    """
+    query = select(UserTicketModel).where(UserTicketModel.deactivated_at >= to_utc(start))
+    if end is not None:
+        query = query.where(UserTicketModel.deactivated_at < to_utc(end))
+    result = await db.scalars(query.order_by(UserTicketModel.deactivated_at))
+    return result.all()
+
+
+async def validate_ticket(db: AsyncSession, ticket_id: str) -> UserTicket:
+    """
+    Validate a ticket, deactivating it with one conditional UPDATE.
+
+    See crud.crud.validate_ticket: of concurrent validations of the same
+    ticket, only one succeeds.
+
+    :param ticket_id: ticket_id of ticket to validate
+    :param db: Database session
+    :return: Ticket validated
+    """
+    statement = validate_ticket_statement(ticket_id)
+    if db.get_bind().dialect.update_returning:
+        ticket = (await db.scalars(statement.returning(UserTicketModel))).first()
+    else:
+        ticket = (
+            await db.get(UserTicketModel, ticket_id, populate_existing=True)
+            if (await db.execute(statement)).rowcount == 1
+            else None
+        )
+    if ticket is None:
+        await db.rollback()
+        raise validation_error(ticket_id, await db.get(UserTicketModel, ticket_id))
+    db.expunge(ticket)
+    await db.commit()
+    return ticket
+
+
+async def get_ticket_by_id(db: AsyncSession, ticket_id: int):
+    """
+    Get a ticket by ID.
+
+    :param db: Database session
+    :param ticket_id: ID of the ticket
+    :return: Ticket
+    """
+    return await db.get(TicketModel, ticket_id)
+
+
+async def get_ticket_by_game_id(db: AsyncSession, game_id: int):
+    """
+    Get ticket by game ID.
+
+    :param db: Database session
+    :param game_id: ID of the game
+    :return: Active ticket for the game
+    """
+    result = await db.scalars(
+        select(TicketModel)
+        .where(TicketModel.game_id == game_id, TicketModel.active == True)
+        .limit(1)
+    )
+    return result.first()
+
+
+##########################
+### FOR DEBUG PURPOSES ###
+##########################
+async def get_tickets(db: AsyncSession, skip: int = 0, limit: int = 100):
+    """
+    Get all tickets.
+
+    :param db: Database session
+    :param skip: Skip
+    :param limit: Limit
+    :return: List of tickets
+    """
+    result = await db.scalars(select(TicketModel).offset(skip).limit(limit))
+    return result.all()
@@ -1,19 +1,23 @@
 import logging
 import sys
-from typing import Callable
+from typing import Callable, List, Optional
 
 from fastapi import HTTPException
 
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
 from models.ticket import Ticket
 from models.ticket import Ticket as TicketModel
-from models.userticket import UserTicket as UserTicketModel, generate_random_user_ticket_id
+from models.userticket import UserTicket as UserTicketModel
 
+from crud.ticket_ids import ticket_id_allocator
 from schemas.ticket import TicketCreate, TicketUpdate, TicketInDB
 from schemas.userticket import (
     UserTicketCreate,
     UserTicket,
+    to_utc,
+    utc_now,
 )
 
 from datetime import datetime
@@ -71,22 +75,23 @@ async def buy_tickets(db: Session, ticket: UserTicketCreate, send_message_callba
     """
     Buy various ticket and assign them different generated ids.
 
-    :param send_message_callback: callback to send message to email microservice
+    The ids come from the ticket id allocator, so no collision check is needed.
+    The whole order is written in one transaction with a single bulk insert,
+    and the callback is invoked once with the tickets of the order once they are committed.
+
+    :param send_message_callback: callback to send the order's message to email microservice
     :param db: Database session
     :param ticket: Ticket to buy
-    :return: Ticket bought
+    :return: Tickets bought
     """
-    for _ in range(ticket.quantity):
-        ticket_db = UserTicketModel(**ticket.model_dump(exclude={'quantity'}))
-        random_ticket_id = generate_random_user_ticket_id(12)
-        while db.query(UserTicketModel).filter(UserTicketModel.id == random_ticket_id).first() is not None:
-            random_ticket_id = generate_random_user_ticket_id(12)
-        ticket_db.id = random_ticket_id
-        db.add(ticket_db)
-        db.commit()
-        db.refresh(ticket_db)
-        logger.info(f"Ticket bought: {ticket_db.__dict__}")
-        await send_message_callback(db, ticket_db)
+    ticket_fields = ticket.model_dump(exclude={'quantity'})
+    rows = [{**ticket_fields, "id": ticket_id} for ticket_id in ticket_id_allocator.allocate(db, ticket.quantity)]
+    db.execute(insert(UserTicketModel), rows)
+    db.commit()
+    tickets_db = [UserTicketModel(**row) for row in rows]
+    logger.info(f"Tickets bought: {[row['id'] for row in rows]} for {ticket_fields}")
+    await send_message_callback(db, tickets_db)
+    return tickets_db
 
 
 def get_tickets_by_user_id(db: Session, user_id: int):
@@ -100,31 +105,85 @@ def get_tickets_by_user_id(db: Session, user_id: int):
     return db.query(UserTicketModel).filter(UserTicketModel.user_id == user_id).all()
 
 
+def get_tickets_sold_between(db: Session, start: datetime, end: Optional[datetime] = None):
+    """
+    Get the tickets bought in a time window, e.g. the last hour.
+
+    :param db: Database session
+    :param start: Start of the window (inclusive), in UTC if naive
+    :param end: End of the window (exclusive), None for now
+    :return: List of tickets ordered by purchase time
+    """
+    query = db.query(UserTicketModel).filter(UserTicketModel.created_at >= to_utc(start))
+    if end is not None:
+        query = query.filter(UserTicketModel.created_at < to_utc(end))
+    return query.order_by(UserTicketModel.created_at).all()
+
+
+def get_tickets_validated_between(db: Session, start: datetime, end: Optional[datetime] = None):
+    """
+    Get the tickets validated in a time window, e.g. since kickoff.
+
+    :param db: Database session
+    :param start: Start of the window (inclusive), in UTC if naive
+    :param end: End of the window (exclusive), None for now
+    :return: List of tickets ordered by validation time
+    """
+    query = db.query(UserTicketModel).filter(UserTicketModel.deactivated_at >= to_utc(start))
+    if end is not None:
+        query = query.filter(UserTicketModel.deactivated_at < to_utc(end))
+    return query.order_by(UserTicketModel.deactivated_at).all()
+
+
 def validate_ticket(db: Session, ticket_id: str) -> UserTicket:
     """
-    Validate a ticket.
+    Validate a ticket, deactivating it with one conditional UPDATE.
+
+    Of concurrent validations of the same ticket, only the one whose UPDATE
+    matches the still active row succeeds. The row is returned by the UPDATE
+    where the database supports RETURNING, otherwise read back by primary key
+    once the UPDATE matched it. It is only read before to tell an unknown ticket from a used
+    one once the UPDATE matched nothing.
 
     :param ticket_id: ticket_id of ticket to validate
     :param db: Database session
     :return: Ticket validated
     """
-    ticket = db.query(UserTicketModel).filter(UserTicketModel.id == ticket_id).first()
-    if not ticket:
-        raise HTTPException(
-            status_code=404, detail=f"Ticket with id {ticket_id} not found."
-        )
-    if not ticket.is_active:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Ticket with id {ticket_id} is already deactivated.",
-        )
-    setattr(ticket, "is_active", False)
-    setattr(ticket, "deactivated_at", str(datetime.now()))
+    statement = validate_ticket_statement(ticket_id)
+    if db.get_bind().dialect.update_returning:
+        ticket = db.scalars(statement.returning(UserTicketModel)).first()
+    else:
+        ticket = db.get(UserTicketModel, ticket_id, populate_existing=True) if db.execute(statement).rowcount == 1 else None
+    if ticket is None:
+        db.rollback()
+        raise validation_error(ticket_id, db.get(UserTicketModel, ticket_id))
+    # Detached, the row isn't expired by the commit and read again to be returned
+    db.expunge(ticket)
     db.commit()
-    db.refresh(ticket)
     return ticket
 
 
+def validate_ticket_statement(ticket_id: str):
+    return (
+        update(UserTicketModel)
+        .where(UserTicketModel.id == ticket_id, UserTicketModel.is_active.is_(True))
+        .values(is_active=False, deactivated_at=utc_now())
+        # Nothing read before the UPDATE, the row it matched is read fresh, by RETURNING or after it
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+
+
+def validation_error(ticket_id: str, ticket: Optional[UserTicketModel]) -> HTTPException:
+    """
+    :param ticket_id: ticket_id of the ticket that couldn't be validated
+    :param ticket: The ticket, None if it doesn't exist
+    :return: Error telling an unknown ticket from an already used one
+    """
+    if ticket is None:
+        return HTTPException(status_code=404, detail=f"Ticket with id {ticket_id} not found.")
+    return HTTPException(status_code=400, detail=f"Ticket with id {ticket_id} is already deactivated.")
+
+
 def get_ticket_by_id(db: Session, ticket_id: int):
     """
     Get a ticket by ID.
@@ -142,11 +201,11 @@ def get_ticket_by_game_id(db: Session, game_id: int):
 
     :param db: Database session
     :param game_id: ID of the game
-    :return: List of tickets for the game
+    :return: Active ticket for the game
     """
     return (
         db.query(TicketModel)
-        .filter(TicketModel.game_id == game_id and TicketModel.active == True)
+        .filter(TicketModel.game_id == game_id, TicketModel.active == True)
         .first()
     )
 
@@ -0,0 +1,226 @@
+import hashlib
+import hmac
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from typing import List
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from metrics.registry import register
+from models.idsequence import IdSequence
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Secret of the permutation. It must never change: ids from different keys may collide
+TICKET_ID_KEY = os.environ.get("TICKET_ID_KEY", "")
+TICKET_ID_BLOCK_SIZE = int(os.environ.get("TICKET_ID_BLOCK_SIZE", 100))
+# development or test: runs without TICKET_ID_KEY, with predictable ids; anything else requires it
+ENVIRONMENT = os.environ.get("ENVIRONMENT", "production")
+INSECURE_ENVIRONMENTS = ("development", "test")
+
+PAYLOAD_DIGITS = 12
+# Payload followed by its check digit
+TICKET_ID_LENGTH = PAYLOAD_DIGITS + 1
+# Random ids issued before the allocator, without a check digit
+LEGACY_TICKET_ID_LENGTH = 12
+HALF_MODULUS = 10 ** (PAYLOAD_DIGITS // 2)
+FEISTEL_ROUNDS = 4
+
+
+def luhn_check_digit(digits: str) -> str:
+    """
+    Compute the Luhn check digit of a string of digits.
+
+    :param digits: Digits to protect
+    :return: Check digit to append
+    """
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str(-total % 10)
+
+
+def is_valid_ticket_id(ticket_id: str) -> bool:
+    """
+    Check locally that a ticket id is well formed, without querying the database.
+
+    :param ticket_id: Ticket id, e.g. read by a scanner
+    :return: True if it is an allocator id with a valid check digit or a legacy id
+    """
+    if not (ticket_id.isascii() and ticket_id.isdigit()):
+        return False
+    if len(ticket_id) == TICKET_ID_LENGTH:
+        return ticket_id[-1] == luhn_check_digit(ticket_id[:-1])
+    return len(ticket_id) == LEGACY_TICKET_ID_LENGTH
+
+
+def reserve_block(connection: Connection, sequence: str, size: int) -> range:
+    """
+    Reserve a block of values of a sequence.
+
+    :param connection: Connection in its own transaction, committed right after
+    :param sequence: Name of the sequence
+    :param size: Number of values to reserve
+    :return: Reserved values
+    """
+    updated = connection.execute(
+        update(IdSequence).where(IdSequence.name == sequence).values(next_value=IdSequence.next_value + size)
+    )
+    if updated.rowcount == 0:
+        # The sequence is seeded by the migrations, this only happens on databases created from the models
+        connection.execute(insert(IdSequence).values(name=sequence, next_value=size))
+        return range(0, size)
+    end = connection.scalar(select(IdSequence.next_value).where(IdSequence.name == sequence))
+    return range(end - size, end)
+
+
+class TicketIdAllocator:
+    """
+    Allocate collision-free ticket ids without probing the database.
+
+    Values come from a database sequence, reserved a block at a time, so
+    workers never hand out the same value. Each value is mixed by a keyed
+    Feistel permutation of the 12-digit space, which is a bijection, so ids
+    stay unique while looking random, and a Luhn check digit is appended.
+    """
+
+    def __init__(self, key: bytes, block_size: int = 100, sequence: str = "user_tickets"):
+        """
+        :param key: Secret of the permutation.
+        :param block_size: Number of values reserved at a time.
+        :param sequence: Name of the sequence in the id_sequences table.
+        """
+        self.mac = hmac.new(key, digestmod=hashlib.sha256)
+        self.block_size = block_size
+        self.sequence = sequence
+        self.blocks: deque[range] = deque()
+        self.lock = threading.Lock()
+        self.reserved_blocks = 0
+        self.allocated = 0
+
+    def permute(self, value: int) -> int:
+        left, right = divmod(value, HALF_MODULUS)
+        for round_number in range(FEISTEL_ROUNDS):
+            mac = self.mac.copy()
+            mac.update(f"{round_number}:{right}".encode())
+            left, right = right, (left + int.from_bytes(mac.digest()[:8], "big")) % HALF_MODULUS
+        return left * HALF_MODULUS + right
+
+    def encode(self, value: int) -> str:
+        """
+        Turn a sequence value into a ticket id.
+
+        :param value: Sequence value
+        :return: Ticket id
+        """
+        if not 0 <= value < HALF_MODULUS * HALF_MODULUS:
+            raise ValueError(f"Ticket id sequence exhausted: {value}")
+        payload = f"{self.permute(value):0{PAYLOAD_DIGITS}d}"
+        return payload + luhn_check_digit(payload)
+
+    def take(self, count: int) -> List[int]:
+        values = []
+        with self.lock:
+            while len(values) < count and self.blocks:
+                block = self.blocks[0]
+                taken = block[:count - len(values)]
+                values.extend(taken)
+                if len(taken) == len(block):
+                    self.blocks.popleft()
+                else:
+                    self.blocks[0] = block[len(taken):]
+        return values
+
+    def add_block(self, block: range):
+        with self.lock:
+            self.blocks.append(block)
+            self.reserved_blocks += 1
+
+    def block_size_for(self, missing: int) -> int:
+        return max(self.block_size, missing)
+
+    def finish(self, values: List[int]) -> List[str]:
+        self.allocated += len(values)
+        return [self.encode(value) for value in values]
+
+    def allocate(self, db: Session, count: int) -> List[str]:
+        """
+        Allocate ticket ids, reserving a new block in its own transaction when needed.
+
+        :param db: Database session
+        :param count: Number of ids
+        :return: List of ticket ids
+        """
+        values = self.take(count)
+        while len(values) < count:
+            with db.get_bind().engine.begin() as connection:
+                block = reserve_block(connection, self.sequence, self.block_size_for(count - len(values)))
+            self.add_block(block)
+            values.extend(self.take(count - len(values)))
+        return self.finish(values)
+
+    async def allocate_async(self, db: AsyncSession, count: int) -> List[str]:
+        """
+        Allocate ticket ids, reserving a new block in its own transaction when needed.
+
+        :param db: Database session
+        :param count: Number of ids
+        :return: List of ticket ids
+        """
+        values = self.take(count)
+        while len(values) < count:
+            engine = db.bind if isinstance(db.bind, AsyncEngine) else db.bind.engine
+            async with engine.begin() as connection:
+                block = await connection.run_sync(
+                    reserve_block, self.sequence, self.block_size_for(count - len(values))
+                )
+            self.add_block(block)
+            values.extend(self.take(count - len(values)))
+        return self.finish(values)
+
+    def stats(self) -> dict:
+        return {
+            "allocated": self.allocated,
+            "reserved_blocks": self.reserved_blocks,
+            "available": sum(len(block) for block in self.blocks),
+        }
+
+
+def check_ticket_id_key(key: str, environment: str):
+    """
+    Refuse to start without the permutation key, except in development and test.
+
+    :param key: TICKET_ID_KEY.
+    :param environment: ENVIRONMENT.
+    :raises ValueError: If the key is missing outside of development and test.
+    """
+    if key:
+        return
+    if environment not in INSECURE_ENVIRONMENTS:
+        raise ValueError(
+            f"TICKET_ID_KEY is not set, ticket ids would be predictable in the {environment} environment "
+            f"(allowed only with ENVIRONMENT set to one of {', '.join(INSECURE_ENVIRONMENTS)})"
+        )
+    logger.warning("TICKET_ID_KEY is not set, ticket ids are predictable")
+
+
+check_ticket_id_key(TICKET_ID_KEY, ENVIRONMENT)
+ticket_id_allocator = TicketIdAllocator(TICKET_ID_KEY.encode(), block_size=TICKET_ID_BLOCK_SIZE)
+
+register("ticket_ids", ticket_id_allocator.stats)
@@ -0,0 +1,69 @@
+import os
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import Request
+
+from db.database import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLALCHEMY_DATABASE_URL,
+)
+from metrics.registry import register
+
+# Async drivers replacing the sync ones of SQLALCHEMY_DATABASE_URL
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> URL:
+    """
+    Get the URL of the same database using an async driver.
+
+    :param url: Database URL using a sync driver
+    :return: Database URL using an async driver
+    """
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = os.environ.get("MYSQL_ASYNC_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+register(
+    "db_async_pool",
+    lambda: {
+        "size": async_engine.pool.size(),
+        "checked_in": async_engine.pool.checkedin(),
+        "checked_out": async_engine.pool.checkedout(),
+        "overflow": async_engine.pool.overflow(),
+    },
+)
+
+
+async def get_async_db(request: Request):
+    sessions = getattr(request.state, "db_sessions", None)
+    if sessions is not None:
+        # The session is shared with the rest of the request and closed by DBSessionMiddleware
+        yield sessions.get_async()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,9 +1,17 @@
 import os
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from starlette.requests import Request
+
+from concurrency.executor import db_executor
+from metrics.registry import register
 
 load_dotenv()
 
@@ -16,15 +24,108 @@ SQLALCHEMY_DATABASE_URL = os.environ.get(
     f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DATABASE}",
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={})
+# Connection pool
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Recycle connections before MySQL's wait_timeout (8 hours by default) closes them
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts wait and how many time out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_time_total, wait_time_max = self.wait_time_total, self.wait_time_max
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_time_avg": wait_time_total / checkouts if checkouts else 0.0,
+            "wait_time_max": wait_time_max,
+        }
+
+
+def create_pooled_engine(
+    url: str,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    **kwargs,
+) -> Engine:
+    """
+    Create an engine backed by an instrumented connection pool.
+
+    :param url: Database URL
+    :param pool_size: Connections kept open in the pool
+    :param max_overflow: Connections opened beyond pool_size under load
+    :param pool_timeout: Seconds to wait for a connection before giving up
+    :param pool_recycle: Seconds after which a connection is replaced
+    :param pool_pre_ping: Test connections for liveness on checkout
+    :return: Engine
+    """
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        **kwargs,
+    )
+
+
+engine = create_pooled_engine(SQLALCHEMY_DATABASE_URL, connect_args={})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+register("db_pool", lambda: engine.pool.stats())
+
 
-def get_db():
+async def get_db(request: Request):
+    # Async so that it doesn't take a thread of the default threadpool: the queries run on db_executor
+    sessions = getattr(request.state, "db_sessions", None)
+    if sessions is not None:
+        # The session is shared with the rest of the request and closed by DBSessionMiddleware
+        yield sessions.get()
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db_executor.run(db.close)
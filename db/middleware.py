@@ -0,0 +1,74 @@
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from concurrency.executor import db_executor
+from db.async_database import AsyncSessionLocal
+from db.database import SessionLocal
+
+
+class RequestSessions:
+    """
+    Database sessions of one request, opened only when first used.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        async_session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+    ):
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+        self.session: Optional[Session] = None
+        self.async_session: Optional[AsyncSession] = None
+
+    def get(self) -> Session:
+        if self.session is None:
+            self.session = self.session_factory()
+        return self.session
+
+    def get_async(self) -> AsyncSession:
+        if self.async_session is None:
+            self.async_session = self.async_session_factory()
+        return self.async_session
+
+    async def close(self):
+        if self.async_session is not None:
+            await self.async_session.close()
+        if self.session is not None:
+            # Closing may roll back on the database, keep it off the event loop
+            await db_executor.run(self.session.close)
+
+
+class DBSessionMiddleware:
+    """
+    ASGI middleware giving each HTTP request lazily opened database sessions.
+
+    The sessions are stored in the request state as `db_sessions`, shared by
+    the get_db and get_async_db dependencies, and closed once the response is
+    sent. Requests that never use them, like health checks, don't touch the pool.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        session_factory: Callable[[], Session] = SessionLocal,
+        async_session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+    ):
+        self.app = app
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sessions = RequestSessions(self.session_factory, self.async_session_factory)
+        scope.setdefault("state", {})["db_sessions"] = sessions
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await sessions.close()
@@ -0,0 +1,150 @@
+"""
+Apply the pending schema migrations, once per deployment.
+
+Migrations are the modules of the db.migrations package named
+`<version>_<name>.py`. Each one exposes an `upgrade(connection)` function and
+is applied in version order exactly once, forward only: a schema change is
+shipped by adding a new migration, never by editing an applied one. Applied
+versions are recorded in the schema_migrations table.
+
+    python -m db.migrate           # apply the pending migrations
+    python -m db.migrate --status  # list the applied and pending migrations
+"""
+import argparse
+import importlib
+import logging
+import pkgutil
+import sys
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Engine, Integer, MetaData, String, Table, select, text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+MIGRATIONS_PACKAGE = "db.migrations"
+# Name and timeout (in seconds) of the MySQL lock serializing concurrent runs
+LOCK_NAME = "ticket_microservice.schema_migrations"
+LOCK_TIMEOUT = 60
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def load_migrations(package: str = MIGRATIONS_PACKAGE) -> List[Migration]:
+    """
+    Import the migrations of a package.
+
+    :param package: Package containing the migration modules.
+    :return: Migrations sorted by version.
+    """
+    migrations = []
+    for module_info in pkgutil.iter_modules(importlib.import_module(package).__path__):
+        version, _, name = module_info.name.partition("_")
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f"{package}.{module_info.name}")
+        migrations.append(Migration(int(version), name, module.upgrade))
+    migrations.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {package}: {versions}")
+    return migrations
+
+
+def applied_versions(connection: Connection) -> set[int]:
+    """
+    Get the versions of the migrations already applied.
+
+    :param connection: Database connection.
+    :return: Applied versions.
+    """
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def acquire_lock(connection: Connection):
+    # DDL isn't transactional on MySQL, so concurrent runs are serialized by a named lock instead
+    if connection.dialect.name == "mysql":
+        acquired = connection.scalar(text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT})
+        connection.commit()
+        if acquired != 1:
+            raise RuntimeError("Timed out waiting for another migration run to finish")
+
+
+def release_lock(connection: Connection):
+    if connection.dialect.name == "mysql":
+        connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+        connection.commit()
+
+
+def migrate(engine: Engine, migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    """
+    Apply the migrations that haven't been applied yet, each in its own transaction.
+
+    :param engine: Engine of the database to migrate.
+    :param migrations: Migrations to apply (defaults to the db.migrations package).
+    :return: Migrations applied by this run.
+    """
+    if migrations is None:
+        migrations = load_migrations()
+    applied = []
+    with engine.connect() as connection:
+        acquire_lock(connection)
+        try:
+            with connection.begin():
+                done = applied_versions(connection)
+            for migration in migrations:
+                if migration.version in done:
+                    continue
+                logger.info(f"Applying migration {migration.version:04d} {migration.name}")
+                with connection.begin():
+                    migration.upgrade(connection)
+                    connection.execute(
+                        schema_migrations.insert().values(
+                            version=migration.version,
+                            name=migration.name,
+                            applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                        )
+                    )
+                applied.append(migration)
+        finally:
+            release_lock(connection)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="list the migrations without applying them")
+    args = parser.parse_args()
+
+    from db.database import engine
+
+    if args.status:
+        with engine.begin() as connection:
+            done = applied_versions(connection)
+        for migration in load_migrations():
+            state = "applied" if migration.version in done else "pending"
+            print(f"{migration.version:04d} {migration.name:40} {state}")
+        return
+
+    applied = migrate(engine)
+    logger.info(f"Applied {len(applied)} migration(s)")
+
+
+if __name__ == "__main__":
+    main()
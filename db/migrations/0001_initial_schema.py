@@ -0,0 +1,39 @@
+"""
+Create the tickets and user_tickets tables as they were created by
+create_tables before migrations existed. Databases that already have them
+are left untouched.
+"""
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "tickets",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("game_id", Integer, nullable=False),
+    Column("name", String(200), index=True, nullable=False),
+    Column("description", String(500), nullable=True),
+    Column("active", Boolean, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("stripe_prod_id", String(32), nullable=False),
+    Column("stripe_price_id", String(32), nullable=False),
+    Column("stripe_image_url", String(512), nullable=False),
+)
+
+Table(
+    "user_tickets",
+    metadata,
+    Column("id", String(12), primary_key=True, index=True),
+    Column("user_id", String(50), nullable=False),
+    Column("ticket_id", Integer, ForeignKey("tickets.id"), nullable=False),
+    Column("unit_amount", Float, nullable=False),
+    Column("created_at", String(500), nullable=False),
+    Column("is_active", Boolean, default=True),
+    Column("deactivated_at", String(500), nullable=True),
+)
+
+
+def upgrade(connection: Connection):
+    metadata.create_all(connection, checkfirst=True)
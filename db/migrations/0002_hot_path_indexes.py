@@ -0,0 +1,38 @@
+"""
+Index the hot lookups:
+
+- user_tickets(user_id): tickets of a user (wallet endpoint).
+- tickets(game_id, active): active ticket of a game. Its game_id prefix also
+  serves lookups by game_id alone.
+- user_tickets(ticket_id, is_active): active units of a ticket.
+"""
+from sqlalchemy import Boolean, Column, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+tickets = Table(
+    "tickets",
+    metadata,
+    Column("game_id", Integer),
+    Column("active", Boolean),
+)
+
+user_tickets = Table(
+    "user_tickets",
+    metadata,
+    Column("user_id", String(50)),
+    Column("ticket_id", Integer),
+    Column("is_active", Boolean),
+)
+
+indexes = [
+    Index("ix_user_tickets_user_id", user_tickets.c.user_id),
+    Index("ix_tickets_game_id_active", tickets.c.game_id, tickets.c.active),
+    Index("ix_user_tickets_ticket_id_is_active", user_tickets.c.ticket_id, user_tickets.c.is_active),
+]
+
+
+def upgrade(connection: Connection):
+    for index in indexes:
+        index.create(connection)
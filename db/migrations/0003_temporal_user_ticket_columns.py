@@ -0,0 +1,90 @@
+"""
+Convert user_tickets.created_at and deactivated_at from strings to indexed
+DateTime columns.
+
+The stored strings (str(datetime) or ISO 8601) are first rewritten in place in
+the format MySQL and SQLAlchemy's SQLite DateTime both read, then the columns
+are retyped. Timestamps with a UTC offset (or "Z") are converted to UTC.
+Rows with an unparsable timestamp abort the migration.
+"""
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Index, MetaData, String, Table, select
+from sqlalchemy.engine import Connection
+
+BATCH_SIZE = 1000
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# Fractional seconds, which fromisoformat only reads with 3 or 6 digits before Python 3.11
+FRACTION = re.compile(r"(:\d{2})\.(\d+)")
+
+metadata = MetaData()
+
+user_tickets = Table(
+    "user_tickets",
+    metadata,
+    Column("id", String(12), primary_key=True),
+    Column("created_at", String(500)),
+    Column("deactivated_at", String(500)),
+)
+
+indexes = [
+    Index("ix_user_tickets_created_at", user_tickets.c.created_at),
+    Index("ix_user_tickets_deactivated_at", user_tickets.c.deactivated_at),
+]
+
+
+def normalize(ticket_id: str, value):
+    if value is None or value == "":
+        return None
+    stripped = value.strip()
+    # fromisoformat only reads the "Z" suffix from Python 3.11
+    if stripped.endswith(("Z", "z")):
+        stripped = stripped[:-1] + "+00:00"
+    stripped = FRACTION.sub(lambda match: f"{match[1]}.{match[2][:6].ljust(6, '0')}", stripped)
+    try:
+        timestamp = datetime.fromisoformat(stripped)
+    except ValueError:
+        raise ValueError(f"User ticket {ticket_id} has an invalid timestamp: {value!r}")
+    # Stored naive, in UTC for the values that carry an offset
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def normalize_timestamps(connection: Connection):
+    last_id = ""
+    while True:
+        rows = connection.execute(
+            select(user_tickets)
+            .where(user_tickets.c.id > last_id)
+            .order_by(user_tickets.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            created_at = normalize(row.id, row.created_at)
+            if created_at is None:
+                raise ValueError(f"User ticket {row.id} has no purchase timestamp")
+            deactivated_at = normalize(row.id, row.deactivated_at)
+            if (created_at, deactivated_at) != (row.created_at, row.deactivated_at):
+                connection.execute(
+                    user_tickets.update()
+                    .where(user_tickets.c.id == row.id)
+                    .values(created_at=created_at, deactivated_at=deactivated_at)
+                )
+        last_id = rows[-1].id
+
+
+def upgrade(connection: Connection):
+    normalize_timestamps(connection)
+    if connection.dialect.name == "mysql":
+        connection.exec_driver_sql(
+            "ALTER TABLE user_tickets "
+            "MODIFY created_at DATETIME(6) NOT NULL, "
+            "MODIFY deactivated_at DATETIME(6) NULL"
+        )
+    # SQLite columns aren't retyped: SQLAlchemy stores its DateTime as text in the normalized format
+    for index in indexes:
+        index.create(connection)
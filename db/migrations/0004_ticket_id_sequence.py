@@ -0,0 +1,24 @@
+"""
+Create the id_sequences table used by the ticket id allocator and widen
+user_tickets.id to the 13 characters of allocator ids (12 digits and a check
+digit). Legacy 12-digit ids are kept as they are.
+"""
+from sqlalchemy import BigInteger, Column, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+id_sequences = Table(
+    "id_sequences",
+    metadata,
+    Column("name", String(50), primary_key=True),
+    Column("next_value", BigInteger, nullable=False),
+)
+
+
+def upgrade(connection: Connection):
+    id_sequences.create(connection)
+    connection.execute(id_sequences.insert().values(name="user_tickets", next_value=0))
+    if connection.dialect.name == "mysql":
+        connection.exec_driver_sql("ALTER TABLE user_tickets MODIFY id VARCHAR(13) NOT NULL")
+    # SQLite doesn't enforce VARCHAR lengths
@@ -0,0 +1,19 @@
+"""
+Create the processed_events table, whose unique keys make the consumer
+ignore redelivered events.
+"""
+from sqlalchemy import Column, DateTime, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+processed_events = Table(
+    "processed_events",
+    metadata,
+    Column("event_key", String(255), primary_key=True),
+    Column("processed_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection: Connection):
+    processed_events.create(connection)
@@ -0,0 +1,21 @@
+"""
+Create the outbox_messages table, where broker messages are written in the
+same transaction as the change they announce before being relayed to RabbitMQ.
+"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+outbox_messages = Table(
+    "outbox_messages",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("routing_key", String(255), nullable=False),
+    Column("body", Text, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection: Connection):
+    outbox_messages.create(connection)
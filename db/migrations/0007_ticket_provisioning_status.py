@@ -0,0 +1,12 @@
+"""
+Add tickets.provisioning_status, the state of the Stripe product of a ticket:
+"provisioning" while it is created in the background, then "ready" or
+"failed". Existing tickets are ready.
+"""
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection):
+    connection.exec_driver_sql(
+        "ALTER TABLE tickets ADD COLUMN provisioning_status VARCHAR(16) NOT NULL DEFAULT 'ready'"
+    )
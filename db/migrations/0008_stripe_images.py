@@ -0,0 +1,22 @@
+"""
+Create the stripe_images table, mapping the SHA-256 of the product images
+uploaded to Stripe to their file and public link, so an identical image is
+reused instead of uploaded again.
+"""
+from sqlalchemy import Column, DateTime, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+stripe_images = Table(
+    "stripe_images",
+    metadata,
+    Column("digest", String(64), primary_key=True),
+    Column("stripe_file_id", String(64), nullable=False),
+    Column("url", String(512), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection: Connection):
+    stripe_images.create(connection)
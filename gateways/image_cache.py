@@ -0,0 +1,71 @@
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.cache import LRUCache
+from crud import async_crud
+
+
+class CachedImage(NamedTuple):
+    stripe_file_id: str
+    url: str
+
+
+class ImageCache:
+    """
+    Stripe files of the product images already uploaded, by SHA-256 of their bytes.
+
+    Entries are persisted in the stripe_images table, shared by the workers,
+    and the recently used ones are also kept in memory. File links created
+    with their file never expire, so entries are never invalidated.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], maxsize: int = 1024):
+        """
+        :param session_factory: Function opening a database session.
+        :param maxsize: Maximum number of entries kept in memory.
+        """
+        self.session_factory = session_factory
+        self.recent = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, digest: str) -> Optional[CachedImage]:
+        """
+        :param digest: SHA-256 of the image.
+        :return: Stripe file of the image, or None if it was never uploaded.
+        """
+        image = self.recent.get(digest)
+        if image is None:
+            async with self.session_factory() as db:
+                stripe_image = await async_crud.get_stripe_image(db, digest)
+            if stripe_image is not None:
+                image = CachedImage(stripe_image.stripe_file_id, stripe_image.url)
+                self.recent.set(digest, image)
+        if image is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return image
+
+    async def put(self, digest: str, stripe_file_id: str, url: str):
+        """
+        Record the Stripe file of an uploaded image.
+
+        :param digest: SHA-256 of the image.
+        :param stripe_file_id: ID of the Stripe file.
+        :param url: URL of the public link of the file.
+        """
+        async with self.session_factory() as db:
+            await async_crud.add_stripe_image(db, digest, stripe_file_id, url)
+        self.recent.set(digest, CachedImage(stripe_file_id, url))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_hits": self.recent.hits,
+            "memory_size": len(self.recent),
+        }
@@ -0,0 +1,263 @@
+import json
+import logging
+import sys
+import time
+import uuid
+from typing import BinaryIO, Mapping, NamedTuple, Optional, Tuple
+
+import anyio
+import httpx
+import stripe
+
+from gateways.image_cache import ImageCache
+from uploads.digest import file_digest
+from uploads.multipart import MultipartFile
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class StripeProduct(NamedTuple):
+    prod_id: str
+    price_id: str
+    image_url: str
+
+
+# Errors raised for the status of a failed Stripe request, as the SDK does, APIError for the others
+STATUS_ERRORS = {
+    401: stripe.AuthenticationError,
+    403: stripe.PermissionError,
+    429: stripe.RateLimitError,
+}
+
+
+def stripe_error(status: int, body: bytes, headers: Mapping[str, str]) -> stripe.StripeError:
+    """
+    :param status: HTTP status of the failed request.
+    :param body: Body of the response.
+    :param headers: Headers of the response.
+    :return: Error of the class the Stripe SDK raises for the response.
+    """
+    try:
+        json_body = json.loads(body)
+        error = json_body["error"]
+        message, code = error.get("message"), error.get("code")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return stripe.APIError(f"Invalid response from Stripe (HTTP {status})", body, status, headers=dict(headers))
+    if status in (400, 404):
+        return stripe.InvalidRequestError(message, error.get("param"), code, body, status, json_body, dict(headers))
+    return STATUS_ERRORS.get(status, stripe.APIError)(message, body, status, json_body, dict(headers), code)
+
+
+class PooledHTTPXClient(stripe.HTTPClient):
+    """
+    Async HTTP client of the Stripe SDK reusing the connections of one httpx pool.
+    """
+
+    name = "httpx-pooled"
+
+    def __init__(self, max_connections: int = 20, timeout: float = 30, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        :param max_connections: Maximum number of connections to Stripe.
+        :param timeout: Timeout of a request, in seconds.
+        :param transport: httpx transport, e.g. to reach a fake Stripe server.
+        """
+        super().__init__()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            transport=transport,
+        )
+        self.requests = 0
+        self.request_time_total = 0.0
+        self.request_time_max = 0.0
+
+    def request(self, method: str, url: str, headers: Mapping[str, str], post_data=None) -> Tuple[bytes, int, Mapping[str, str]]:
+        raise RuntimeError("The Stripe gateway only makes async requests")
+
+    async def request_async(
+        self, method: str, url: str, headers: Mapping[str, str], post_data=None
+    ) -> Tuple[bytes, int, Mapping[str, str]]:
+        started_at = time.monotonic()
+        try:
+            response = await self.client.request(method, url, headers=headers, content=post_data)
+        except httpx.HTTPError as e:
+            raise stripe.APIConnectionError(f"Error communicating with Stripe: {e!r}", should_retry=True)
+        finally:
+            self.record_request(time.monotonic() - started_at)
+        return response.content, response.status_code, response.headers
+
+    def sleep_async(self, secs: float):
+        return anyio.sleep(secs)
+
+    async def close_async(self):
+        await self.client.aclose()
+
+    def record_request(self, request_time: float):
+        self.requests += 1
+        self.request_time_total += request_time
+        self.request_time_max = max(self.request_time_max, request_time)
+
+
+class StripeGateway:
+    """
+    Provision the Stripe products of tickets without blocking the event loop.
+
+    Requests go through one pool of keep-alive connections. A product takes
+    two round trips: the image upload, which also creates its public link,
+    then the product with its price, which needs the link. With an image
+    cache, an image already uploaded isn't uploaded again and its link is
+    reused.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        api_base: Optional[str] = None,
+        max_connections: int = 20,
+        timeout: float = 30,
+        max_network_retries: int = 2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        image_cache: Optional[ImageCache] = None,
+    ):
+        """
+        :param api_key: Stripe secret key.
+        :param api_base: Base URL of the Stripe API and files API, None for Stripe's.
+        :param max_connections: Maximum number of connections to Stripe.
+        :param timeout: Timeout of a request, in seconds.
+        :param max_network_retries: Retries of requests failing on the network (with idempotency keys).
+        :param transport: httpx transport, e.g. to reach a fake Stripe server.
+        :param image_cache: Stripe files of the images already uploaded.
+        """
+        self.image_cache = image_cache
+        self.api_key = api_key or ""
+        self.files_url = f"{api_base or stripe.upload_api_base}/v1/files"
+        self.max_network_retries = max_network_retries
+        self.http_client = PooledHTTPXClient(max_connections, timeout, transport)
+        base_addresses = {"api": api_base, "files": api_base} if api_base else {}
+        self.client = stripe.StripeClient(
+            self.api_key,
+            http_client=self.http_client,
+            base_addresses=base_addresses,
+            max_network_retries=max_network_retries,
+        )
+        self.products_created = 0
+        self.failures = 0
+
+    async def create_product(
+        self,
+        name: str,
+        description: str,
+        active: bool,
+        unit_amount: int,
+        image: BinaryIO,
+        image_name: str,
+    ) -> StripeProduct:
+        """
+        Upload a product image and create the product with its default price.
+
+        :param name: Product name.
+        :param description: Product description.
+        :param active: Whether the product can be bought.
+        :param unit_amount: Price in cents of euro.
+        :param image: PNG image, read in chunks.
+        :param image_name: File name of the image.
+        :return: IDs of the product and price, and the public URL of the image.
+        :raises stripe.StripeError: If a Stripe request fails.
+        """
+        try:
+            image_url = await self.upload_image(image, image_name)
+            product = await self.client.products.create_async(
+                params={
+                    "name": name,
+                    "description": description,
+                    "active": active,
+                    "default_price_data": {"currency": "eur", "unit_amount": unit_amount},
+                    "images": [image_url],
+                }
+            )
+        except stripe.StripeError:
+            self.failures += 1
+            raise
+        self.products_created += 1
+        return StripeProduct(product.id, product.default_price, image_url)
+
+    async def upload_image(self, image: BinaryIO, image_name: str) -> str:
+        """
+        Upload a product image, unless an identical one was uploaded before.
+
+        :return: Public URL of the image.
+        """
+        digest = None
+        if self.image_cache is not None:
+            # Hashed in chunks from the start of the file, which is rewound for the upload
+            digest = file_digest(image)
+            cached = await self.image_cache.get(digest)
+            if cached is not None:
+                return cached.url
+        uploaded_image = await self.upload_file(image, image_name)
+        image_url = uploaded_image["links"]["data"][0]["url"]
+        if digest is not None:
+            await self.image_cache.put(digest, uploaded_image["id"], image_url)
+        return image_url
+
+    async def upload_file(self, image: BinaryIO, image_name: str) -> dict:
+        """
+        Upload a product image with its public link.
+
+        The SDK builds the whole multipart body in memory, so the file is
+        sent with a body streamed from it instead, through the SDK's HTTP
+        client for its retries. Only one chunk of the image is held in
+        memory at a time.
+
+        :return: Stripe file, with its link.
+        :raises stripe.StripeError: If the upload fails.
+        """
+        body = MultipartFile(
+            # The link is created with the file instead of in a second round trip
+            {"purpose": "product_image", "file_link_data[create]": "true"},
+            "file",
+            image,
+            image_name,
+        )
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Stripe-Version": stripe.api_version,
+            # Retries of the upload don't create a second file
+            "Idempotency-Key": str(uuid.uuid4()),
+            **body.headers,
+        }
+        content, status, response_headers = await self.http_client.request_with_retries_async(
+            "POST", self.files_url, headers, body, max_network_retries=self.max_network_retries
+        )
+        if not 200 <= status < 300:
+            raise stripe_error(status, content, response_headers)
+        return json.loads(content)
+
+    async def update_product(self, prod_id: str, **fields):
+        """
+        Update the product of a ticket.
+
+        :param prod_id: ID of the product.
+        :param fields: Fields to change among name, description and active, the others are left as they are.
+        :raises stripe.StripeError: If the Stripe request fails.
+        """
+        try:
+            await self.client.products.update_async(prod_id, params=fields)
+        except stripe.StripeError:
+            self.failures += 1
+            raise
+
+    async def close(self):
+        await self.http_client.close_async()
+
+    def stats(self) -> dict:
+        requests = self.http_client.requests
+        return {
+            "products_created": self.products_created,
+            "failures": self.failures,
+            "requests": requests,
+            "request_time_avg": self.http_client.request_time_total / requests if requests else 0.0,
+            "request_time_max": self.http_client.request_time_max,
+        }
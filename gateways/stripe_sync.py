@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import sys
+from typing import Awaitable, Callable, Dict, Tuple, Type
+
+import stripe
+
+from messaging.retry import exponential_delays
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Ticket fields stored on its Stripe product, stock and price aren't
+PRODUCT_FIELDS = ("name", "description", "active")
+
+# Errors worth retrying: network, rate limiting and Stripe's own (5xx) errors
+RETRYABLE_ERRORS: Tuple[Type[Exception], ...] = (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)
+
+
+def product_changes(ticket, update: dict) -> dict:
+    """
+    :param ticket: Ticket before the update.
+    :param update: Fields set by the update.
+    :return: Fields of the Stripe product changed by the update.
+    """
+    return {
+        field: update[field]
+        for field in PRODUCT_FIELDS
+        if field in update and update[field] != getattr(ticket, field)
+    }
+
+
+class StripeSync:
+    """
+    Apply ticket changes to their Stripe products in the background.
+
+    The changes scheduled for a product within `delay` seconds of each other
+    are merged into one update, the latest value of a field winning. Failed
+    updates are retried with exponential backoff while later changes keep
+    being merged, and are sent after them so they never overwrite newer
+    values. Changes are kept in memory: those still waiting when the process
+    is killed are lost, the next change of the fields resyncs them.
+    """
+
+    def __init__(
+        self,
+        update_product: Callable[..., Awaitable],
+        delay: float = 1,
+        max_attempts: int = 5,
+        retry_base_delay: float = 1,
+        drain_timeout: float = 10,
+    ):
+        """
+        :param update_product: Coroutine function updating a product from its id and fields.
+        :param delay: Seconds the changes of a product are merged for before being sent.
+        :param max_attempts: Maximum number of attempts of an update.
+        :param retry_base_delay: Seconds before the first retry, doubling at each retry.
+        :param drain_timeout: Seconds given to the pending updates to be sent on stop.
+        """
+        self.update_product = update_product
+        self.delay = delay
+        self.retry_delays = exponential_delays(retry_base_delay, max_attempts - 1)
+        self.drain_timeout = drain_timeout
+        self.pending: Dict[str, dict] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.scheduled = 0
+        self.skipped = 0
+        self.updated = 0
+        self.retried = 0
+        self.failed = 0
+
+    def schedule(self, prod_id: str, changes: dict):
+        """
+        Schedule changes of a product, without waiting for them to be sent.
+
+        :param prod_id: ID of the Stripe product.
+        :param changes: Changed fields of the product, nothing is sent if empty.
+        """
+        if not changes:
+            self.skipped += 1
+            return
+        self.scheduled += 1
+        self.pending.setdefault(prod_id, {}).update(changes)
+        if prod_id not in self.tasks:
+            self.tasks[prod_id] = asyncio.create_task(self.sync(prod_id))
+
+    async def sync(self, prod_id: str):
+        try:
+            while prod_id in self.pending:
+                await asyncio.sleep(self.delay)
+                await self.send(prod_id, self.pending.pop(prod_id))
+        finally:
+            del self.tasks[prod_id]
+
+    async def send(self, prod_id: str, changes: dict):
+        for attempt, retry_delay in enumerate(self.retry_delays + [None], start=1):
+            try:
+                await self.update_product(prod_id, **changes)
+            except RETRYABLE_ERRORS as e:
+                if retry_delay is None:
+                    break
+                self.retried += 1
+                logger.warning(f"Failed to update Stripe product {prod_id} (attempt {attempt}), retrying in {retry_delay}s: {e}")
+                await asyncio.sleep(retry_delay)
+                continue
+            except stripe.StripeError as e:
+                logger.error(f"Stripe rejected the update of product {prod_id} with {changes}: {e}")
+                self.failed += 1
+                return
+            self.updated += 1
+            return
+        logger.error(f"Gave up updating Stripe product {prod_id} with {changes} after {attempt} attempts")
+        self.failed += 1
+
+    async def stop(self):
+        """
+        Send the pending changes and stop.
+
+        Updates not sent within the drain timeout are cancelled.
+        """
+        if self.tasks:
+            _, pending = await asyncio.wait(list(self.tasks.values()), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "updated": self.updated,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
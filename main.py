@@ -1,12 +1,12 @@
 from contextlib import asynccontextmanager
 
-from db.create_database import create_tables
-from db.database import SessionLocal
-from fastapi import FastAPI, Request
+from db.middleware import DBSessionMiddleware
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import ticket
-from routers.ticket import lifespan
+from routers import metrics, ticket
+from routers.ticket import MAX_REQUEST_BODY_SIZE, lifespan
 from starlette import status
+from uploads.middleware import BodySizeLimitMiddleware
 
 app = FastAPI(
     lifespan=lifespan,
@@ -21,6 +21,10 @@ app = FastAPI(
     root_path="/tickets/v1",
 )
 
+# One lazily opened database session per request
+app.add_middleware(DBSessionMiddleware)
+# Oversized uploads are rejected while they stream in
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_REQUEST_BODY_SIZE)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -42,11 +46,6 @@ def get_health():
 
 
 app.include_router(ticket.router)
+if metrics.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
-
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    request.state.db = SessionLocal()
-    response = await call_next(request)
-    request.state.db.close()
-    return response
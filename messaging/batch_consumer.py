@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import sys
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from aio_pika.abc import AbstractIncomingMessage, AbstractQueue
+
+from messaging.consumer import handle
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class BatchConsumer:
+    """
+    Consume a queue in batches.
+
+    Messages are collected until `max_batch_size` of them arrived or
+    `max_wait` seconds passed since the first one, then handled together by
+    `batch_handler` (e.g. in one database transaction) and acked. If the
+    batch fails, its messages are handled one by one by `handler`, and each
+    is acked or passed to `on_failure` on its own. Batches are handled one after the
+    other, in delivery order.
+
+    The channel prefetch count must be at least `max_batch_size`, otherwise
+    batches never fill up and are only flushed by the timer.
+    """
+
+    def __init__(
+        self,
+        batch_handler: Callable[[List[bytes]], Awaitable],
+        handler: Callable[[bytes], Awaitable],
+        max_batch_size: int = 100,
+        max_wait: float = 0.05,
+        drain_timeout: float = 10,
+        on_failure: Optional[Callable[[AbstractIncomingMessage, Exception], Awaitable]] = None,
+    ):
+        """
+        :param batch_handler: Coroutine function handling the bodies of a batch.
+        :param handler: Coroutine function handling a single body, used when a batch fails.
+        :param max_batch_size: Maximum number of messages in a batch.
+        :param max_wait: Maximum seconds the first message of a batch waits for others.
+        :param drain_timeout: Seconds given to the pending batch on stop.
+        :param on_failure: Coroutine function routing a failed message elsewhere before it is acked.
+        """
+        self.batch_handler = batch_handler
+        self.handler = handler
+        self.on_failure = on_failure
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.drain_timeout = drain_timeout
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.queue: Optional[AbstractQueue] = None
+        self.consumer_tag: Optional[str] = None
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.batch_failures = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+        self.lag_last: Optional[float] = None
+        self.lag_max = 0.0
+
+    async def start(self, queue: AbstractQueue):
+        """
+        Start batching and consume the queue.
+
+        :param queue: Queue to consume.
+        """
+        self.task = asyncio.create_task(self.run())
+        self.queue = queue
+        self.consumer_tag = await queue.consume(self.on_message)
+
+    async def stop(self):
+        """
+        Stop consuming and flush the pending batch.
+
+        Messages not handled within the drain timeout stay unacked and are redelivered.
+        """
+        if self.consumer_tag is not None:
+            await self.queue.cancel(self.consumer_tag)
+            self.consumer_tag = None
+        if self.task is not None:
+            self.incoming.put_nowait(None)
+            _, pending = await asyncio.wait([self.task], timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.task = None
+
+    async def on_message(self, message: AbstractIncomingMessage):
+        self.received += 1
+        self.incoming.put_nowait(message)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self.incoming.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(self.incoming.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if message is None:
+                    stopping = True
+                    break
+                batch.append(message)
+            await self.flush(batch)
+
+    async def flush(self, batch: List[AbstractIncomingMessage]):
+        started_at = time.monotonic()
+        self.record_lag(batch[0])
+        try:
+            await self.batch_handler([message.body for message in batch])
+        except Exception:
+            self.batch_failures += 1
+            logger.exception(f"Failed to handle a batch of {len(batch)} messages, handling them one by one")
+            for message in batch:
+                await self.handle_one(message)
+        else:
+            for message in batch:
+                await message.ack()
+            self.batches += 1
+            self.processed += len(batch)
+        self.record_flush(time.monotonic() - started_at)
+
+    async def handle_one(self, message: AbstractIncomingMessage):
+        try:
+            if await handle(message, self.handler, self.on_failure):
+                self.processed += 1
+            else:
+                self.failed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Failed to handle message {message.body}")
+
+    def record_lag(self, message: AbstractIncomingMessage):
+        # Time since the oldest message of the batch was published, when the publisher set its timestamp
+        if message.timestamp is not None:
+            self.lag_last = max(time.time() - message.timestamp.timestamp(), 0.0)
+            self.lag_max = max(self.lag_max, self.lag_last)
+
+    def record_flush(self, flush_time: float):
+        self.flush_time_total += flush_time
+        self.flush_time_max = max(self.flush_time_max, flush_time)
+
+    def stats(self) -> dict:
+        flushes = self.batches + self.batch_failures
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queued": self.incoming.qsize(),
+            "batches": self.batches,
+            "batch_failures": self.batch_failures,
+            "batch_size_avg": (self.processed + self.failed) / flushes if flushes else 0.0,
+            "flush_time_avg": self.flush_time_total / flushes if flushes else 0.0,
+            "flush_time_max": self.flush_time_max,
+            "lag_last": self.lag_last,
+            "lag_max": self.lag_max,
+        }
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import sys
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from aio_pika.abc import AbstractIncomingMessage, AbstractQueue
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+async def handle(
+    message: AbstractIncomingMessage,
+    handler: Callable[[bytes], Awaitable],
+    on_failure: Optional[Callable[[AbstractIncomingMessage, Exception], Awaitable]] = None,
+) -> bool:
+    """
+    Handle a message and settle it.
+
+    If the handler fails, the message is passed to on_failure and acked. If
+    on_failure fails too, the message is requeued so it isn't lost.
+
+    :return: True if the message was handled, False if it was passed to on_failure.
+    :raises Exception: If the message was rejected.
+    """
+    async with message.process(requeue=on_failure is not None):
+        try:
+            await handler(message.body)
+        except Exception as e:
+            if on_failure is None:
+                raise
+            logger.exception(f"Failed to handle message {message.body}")
+            await on_failure(message, e)
+            return False
+    return True
+
+
+class KeyedConsumer:
+    """
+    Consume a queue with a bounded pool of worker tasks.
+
+    Messages with the same key (e.g. the same user) always go to the same
+    worker, so they are handled in the order they were delivered, while
+    messages with different keys are handled concurrently. Messages without
+    a key go to the least busy worker. Each message is acked once handled.
+    A message that fails is passed to `on_failure` (e.g. RetryPolicy.on_failure)
+    and acked, or rejected when there is no `on_failure`.
+
+    The number of messages held by the workers is bounded by the channel
+    prefetch count, which must be set with `channel.set_qos`.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[bytes], Awaitable],
+        workers: int = 8,
+        key: Optional[Callable[[bytes], Optional[str]]] = None,
+        drain_timeout: float = 10,
+        on_failure: Optional[Callable[[AbstractIncomingMessage, Exception], Awaitable]] = None,
+    ):
+        """
+        :param handler: Coroutine function handling a message body.
+        :param workers: Number of worker tasks.
+        :param key: Function giving the ordering key of a message body, None for no ordering.
+        :param drain_timeout: Seconds given to the workers to finish their messages on stop.
+        :param on_failure: Coroutine function routing a failed message elsewhere before it is acked.
+        """
+        self.handler = handler
+        self.on_failure = on_failure
+        self.key = key
+        self.drain_timeout = drain_timeout
+        self.queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+        # Messages queued or being handled by each worker
+        self.loads = [0] * workers
+        self.tasks: List[asyncio.Task] = []
+        self.queue: Optional[AbstractQueue] = None
+        self.consumer_tag: Optional[str] = None
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.processing_time_total = 0.0
+        self.processing_time_max = 0.0
+        self.lag_last: Optional[float] = None
+        self.lag_max = 0.0
+
+    async def start(self, queue: AbstractQueue):
+        """
+        Start the workers and consume the queue.
+
+        :param queue: Queue to consume.
+        """
+        self.tasks = [asyncio.create_task(self.work(worker)) for worker in range(len(self.queues))]
+        self.queue = queue
+        self.consumer_tag = await queue.consume(self.on_message)
+
+    async def stop(self):
+        """
+        Stop consuming and let the workers finish the messages they hold.
+
+        Messages not handled within the drain timeout stay unacked and are redelivered.
+        """
+        if self.consumer_tag is not None:
+            await self.queue.cancel(self.consumer_tag)
+            self.consumer_tag = None
+        for worker_queue in self.queues:
+            worker_queue.put_nowait(None)
+        if self.tasks:
+            _, pending = await asyncio.wait(self.tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.tasks = []
+
+    def least_busy_worker(self) -> int:
+        return min(range(len(self.loads)), key=self.loads.__getitem__)
+
+    def worker_for(self, body: bytes) -> int:
+        key = self.key(body) if self.key is not None else None
+        if key is None:
+            return self.least_busy_worker()
+        return hash(key) % len(self.queues)
+
+    async def on_message(self, message: AbstractIncomingMessage):
+        self.received += 1
+        try:
+            worker = self.worker_for(message.body)
+        except Exception:
+            logger.exception("Failed to get the key of a message, handling it without ordering")
+            worker = self.least_busy_worker()
+        self.loads[worker] += 1
+        self.queues[worker].put_nowait((message, time.monotonic()))
+
+    async def work(self, worker: int):
+        worker_queue = self.queues[worker]
+        while True:
+            item = await worker_queue.get()
+            if item is None:
+                return
+            message, received_at = item
+            started_at = time.monotonic()
+            self.record_wait(started_at - received_at, message)
+            self.in_flight += 1
+            try:
+                if await handle(message, self.handler, self.on_failure):
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Failed to handle message {message.body}")
+            finally:
+                self.in_flight -= 1
+                self.loads[worker] -= 1
+                self.record_processing(time.monotonic() - started_at)
+
+    def record_wait(self, wait_time: float, message: AbstractIncomingMessage):
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        # Time since the message was published, when the publisher set its timestamp
+        if message.timestamp is not None:
+            self.lag_last = max(time.time() - message.timestamp.timestamp(), 0.0)
+            self.lag_max = max(self.lag_max, self.lag_last)
+
+    def record_processing(self, processing_time: float):
+        self.processing_time_total += processing_time
+        self.processing_time_max = max(self.processing_time_max, processing_time)
+
+    def stats(self) -> dict:
+        handled = self.processed + self.failed
+        return {
+            "workers": len(self.queues),
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "queued": sum(worker_queue.qsize() for worker_queue in self.queues),
+            "wait_time_avg": self.wait_time_total / handled if handled else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "processing_time_avg": self.processing_time_total / handled if handled else 0.0,
+            "processing_time_max": self.processing_time_max,
+            "lag_last": self.lag_last,
+            "lag_max": self.lag_max,
+        }
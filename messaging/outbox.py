@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import sys
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud import async_crud
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class OutboxRelay:
+    """
+    Publish the messages of the outbox table to the broker.
+
+    Messages are written to the outbox in the same transaction as the change
+    they announce, and this relay publishes them in the background in id
+    order, in batches whose publisher confirms are awaited together. A message
+    is deleted once the broker has confirmed it, so messages left by a crash
+    or a broker outage are published after the restart. Delivery is at least
+    once: a message may be published again if the relay stops between the
+    confirm and the delete.
+
+    When a publish fails, the messages after it stay in the outbox even if
+    they were confirmed, so a message is never overtaken by an older one.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        publish: Callable[[str, bytes, str], Awaitable],
+        batch_size: int = 100,
+        poll_interval: float = 1,
+        retry_interval: float = 5,
+    ):
+        """
+        :param session_factory: Function opening a database session.
+        :param publish: Coroutine function publishing a message body with a routing key and a message id, returning once it is confirmed.
+        :param batch_size: Maximum number of messages published at once.
+        :param poll_interval: Seconds between two reads of an empty outbox when the relay isn't notified.
+        :param retry_interval: Seconds to wait after a failed publish.
+        """
+        self.session_factory = session_factory
+        self.publish = publish
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.relayed = 0
+        self.failed = 0
+
+    def notify(self):
+        """
+        Wake the relay up because messages were committed to the outbox.
+        """
+        self.wakeup.set()
+
+    async def relay_batch(self) -> int:
+        """
+        Publish a batch of messages and delete the confirmed ones.
+
+        :return: Number of messages published.
+        :raises Exception: The first publish error, after deleting the messages confirmed before it.
+        """
+        async with self.session_factory() as db:
+            messages = await async_crud.get_outbox_messages(db, self.batch_size)
+            if not messages:
+                return 0
+            self.batches += 1
+            results = await asyncio.gather(
+                *(self.publish(message.routing_key, message.body.encode(), str(message.id)) for message in messages),
+                return_exceptions=True,
+            )
+            confirmed = []
+            error = None
+            for message, result in zip(messages, results):
+                if isinstance(result, BaseException):
+                    error = result
+                    break
+                confirmed.append(message.id)
+            await async_crud.delete_outbox_messages(db, confirmed)
+        self.relayed += len(confirmed)
+        if error is not None:
+            self.failed += 1
+            raise error
+        return len(confirmed)
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                relayed = await self.relay_batch()
+            except Exception as e:
+                logger.warning(f"Failed to relay the outbox, retrying in {self.retry_interval}s: {e}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            if relayed == self.batch_size:
+                # There may be more messages waiting
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """
+        Start relaying the outbox in the background.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the relay. Messages not yet confirmed stay in the outbox.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "relayed": self.relayed,
+            "failed": self.failed,
+        }
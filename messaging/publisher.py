@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import sys
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from aio_pika import DeliveryMode, Message
+from aio_pika.abc import AbstractExchange
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Message waiting to be published, its routing key, the future of its confirm and the time it was buffered
+Pending = Tuple[Message, str, asyncio.Future, float]
+
+
+class Publisher:
+    """
+    Publish messages through a small pool of channels with publisher confirms.
+
+    Each channel has a task publishing the messages buffered for it in
+    batches: the publishes of a batch are sent back to back and their confirms
+    are awaited together, instead of one round trip per message. Messages with
+    the same routing key always use the same channel, so they reach the broker
+    in the order they were published.
+
+    At most `buffer_size` messages are buffered or waiting for their confirm;
+    when the buffer is full, `publish` waits for room (backpressure).
+    """
+
+    def __init__(
+        self,
+        open_exchange: Callable[[], Awaitable[AbstractExchange]],
+        channels: int = 4,
+        buffer_size: int = 1000,
+        batch_size: int = 100,
+        drain_timeout: float = 10,
+    ):
+        """
+        :param open_exchange: Coroutine function opening a channel with publisher confirms and returning its exchange.
+        :param channels: Number of channels.
+        :param buffer_size: Maximum number of messages buffered or waiting for their confirm.
+        :param batch_size: Maximum number of messages whose confirms are awaited together on a channel.
+        :param drain_timeout: Seconds given to the buffered messages to be published on stop.
+        """
+        self.open_exchange = open_exchange
+        self.batch_size = batch_size
+        self.drain_timeout = drain_timeout
+        self.queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(channels)]
+        self.room = asyncio.Semaphore(buffer_size)
+        self.buffer_size = buffer_size
+        self.exchanges: List[AbstractExchange] = []
+        self.tasks: List[asyncio.Task] = []
+        self.buffered = 0
+        self.published = 0
+        self.failed = 0
+        self.batches = 0
+        self.confirm_latency_total = 0.0
+        self.confirm_latency_max = 0.0
+
+    async def start(self):
+        """
+        Open the channels and start publishing.
+        """
+        self.exchanges = [await self.open_exchange() for _ in self.queues]
+        self.tasks = [asyncio.create_task(self.work(channel)) for channel in range(len(self.queues))]
+
+    async def stop(self):
+        """
+        Publish the buffered messages and stop.
+
+        Messages not confirmed within the drain timeout fail with CancelledError.
+        """
+        for queue in self.queues:
+            queue.put_nowait(None)
+        if self.tasks:
+            _, pending = await asyncio.wait(self.tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for queue in self.queues:
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None:
+                    item[2].cancel()
+                    self.release(1)
+        self.tasks = []
+
+    def channel_for(self, routing_key: str) -> int:
+        return zlib.crc32(routing_key.encode()) % len(self.queues)
+
+    async def publish(self, routing_key: str, body: bytes, message_id: Optional[str] = None, persistent: bool = True):
+        """
+        Publish a message and wait for the broker to confirm it.
+
+        :param routing_key: Routing key of the message.
+        :param body: Message body.
+        :param message_id: ID of the message, for consumers to drop duplicates.
+        :param persistent: Whether the broker writes the message to disk, which business events require.
+        :raises Exception: If the broker doesn't confirm the message.
+        """
+        future = await self.enqueue(routing_key, body, message_id, persistent)
+        await future
+
+    async def enqueue(
+        self, routing_key: str, body: bytes, message_id: Optional[str] = None, persistent: bool = True
+    ) -> asyncio.Future:
+        """
+        Buffer a message, waiting for room in the buffer.
+
+        :return: Future resolved once the broker confirms the message.
+        """
+        await self.room.acquire()
+        self.buffered += 1
+        message = Message(
+            body=body,
+            message_id=message_id,
+            content_type="application/json",
+            delivery_mode=DeliveryMode.PERSISTENT if persistent else DeliveryMode.NOT_PERSISTENT,
+        )
+        future = asyncio.get_running_loop().create_future()
+        self.queues[self.channel_for(routing_key)].put_nowait((message, routing_key, future, time.monotonic()))
+        return future
+
+    async def work(self, channel: int):
+        queue = self.queues[channel]
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self.publish_batch(self.exchanges[channel], batch)
+
+    async def publish_batch(self, exchange: AbstractExchange, batch: List[Pending]):
+        self.batches += 1
+        try:
+            results = await asyncio.gather(
+                *(exchange.publish(message, routing_key=routing_key) for message, routing_key, _, _ in batch),
+                return_exceptions=True,
+            )
+        except asyncio.CancelledError:
+            for _, _, future, _ in batch:
+                future.cancel()
+            self.release(len(batch))
+            raise
+        now = time.monotonic()
+        for (_, routing_key, future, buffered_at), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                self.failed += 1
+                logger.warning(f"Message to {routing_key} not confirmed: {result!r}")
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            self.published += 1
+            # Time from buffering to confirm, including the wait for room on the channel
+            latency = now - buffered_at
+            self.confirm_latency_total += latency
+            self.confirm_latency_max = max(self.confirm_latency_max, latency)
+            if not future.done():
+                future.set_result(None)
+        self.release(len(batch))
+
+    def release(self, count: int):
+        self.buffered -= count
+        for _ in range(count):
+            self.room.release()
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self.queues),
+            "buffered": self.buffered,
+            "buffer_size": self.buffer_size,
+            "published": self.published,
+            "failed": self.failed,
+            "batches": self.batches,
+            "confirm_latency_avg": self.confirm_latency_total / self.published if self.published else 0.0,
+            "confirm_latency_max": self.confirm_latency_max,
+        }
@@ -0,0 +1,105 @@
+"""
+Move dead-lettered messages back to the queue they failed on.
+
+Messages are published with a fresh retry schedule and acked from the
+dead-letter queue once the broker confirmed them. With --dry-run, the
+messages and their failure reasons are only listed and stay dead-lettered.
+
+    python -m messaging.replay --queue PAYMENTS [--limit 10] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Optional
+
+import aio_pika
+from aio_pika import DeliveryMode, Message
+from aio_pika.abc import AbstractExchange, AbstractQueue
+from dotenv import load_dotenv
+
+from messaging.retry import ATTEMPTS_HEADER, FAILURE_REASON_HEADER, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+load_dotenv()
+
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+
+REPLAYS_HEADER = "replays"
+
+
+async def replay(
+    dead_letter_queue: AbstractQueue,
+    exchange: AbstractExchange,
+    queue: str,
+    limit: Optional[int] = None,
+    dry_run: bool = False,
+) -> int:
+    """
+    Move messages from a dead-letter queue back to their queue.
+
+    :param dead_letter_queue: Dead-letter queue.
+    :param exchange: Default exchange, on a channel with publisher confirms.
+    :param queue: Queue of messages that don't record their original queue.
+    :param limit: Maximum number of messages, None for all of them.
+    :param dry_run: Only list the messages.
+    :return: Number of messages replayed (or listed).
+    """
+    count = 0
+    while limit is None or count < limit:
+        message = await dead_letter_queue.get(no_ack=False, fail=False)
+        if message is None:
+            break
+        headers = dict(message.headers or {})
+        target = headers.get(ORIGINAL_QUEUE_HEADER, queue)
+        logger.info(
+            f"{'Found' if dry_run else 'Replaying'} {message.message_id or message.body[:80]} to {target}, "
+            f"failed with {headers.get(FAILURE_REASON_HEADER)}"
+        )
+        count += 1
+        if dry_run:
+            # Left unacked, the messages return to the queue when the channel is closed
+            continue
+        for header in [ATTEMPTS_HEADER, LAST_ERROR_HEADER, FAILURE_REASON_HEADER]:
+            headers.pop(header, None)
+        headers[REPLAYS_HEADER] = int(headers.get(REPLAYS_HEADER, 0)) + 1
+        await exchange.publish(
+            Message(
+                body=message.body,
+                headers=headers,
+                content_type=message.content_type,
+                message_id=message.message_id,
+                timestamp=message.timestamp,
+                delivery_mode=DeliveryMode.PERSISTENT,
+            ),
+            routing_key=target,
+        )
+        await message.ack()
+    return count
+
+
+async def run(queue: str, limit: Optional[int], dry_run: bool) -> int:
+    connection = await aio_pika.connect_robust(RABBITMQ_URL)
+    async with connection:
+        channel = await connection.channel(publisher_confirms=True)
+        dead_letter_queue = await channel.get_queue(f"{queue}.dead")
+        return await replay(dead_letter_queue, channel.default_exchange, queue, limit, dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default="PAYMENTS", help="queue whose dead-lettered messages are replayed")
+    parser.add_argument("--limit", type=int, help="maximum number of messages to replay")
+    parser.add_argument("--dry-run", action="store_true", help="list the messages without replaying them")
+    args = parser.parse_args()
+
+    count = asyncio.run(run(args.queue, args.limit, args.dry_run))
+    logger.info(f"{'Found' if args.dry_run else 'Replayed'} {count} message(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Delayed retries and dead-lettering of the messages a consumer fails to handle.
+
+A message failing for the n-th time is published to `<queue>.retry.<n>`,
+a queue without consumers whose messages expire after the n-th delay and are
+then dead-lettered by the broker back to `<queue>`. Once the attempts are
+exhausted, or right away for errors that retrying can't fix (malformed
+messages), the message is published to `<queue>.dead` with the failure
+reason in its headers, where it stays until it is replayed with
+`python -m messaging.replay`.
+"""
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple, Type
+
+from aio_pika import DeliveryMode, Message
+from aio_pika.abc import AbstractChannel, AbstractExchange, AbstractIncomingMessage
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+# Headers recording the history of a message
+ATTEMPTS_HEADER = "retry_attempts"
+LAST_ERROR_HEADER = "last_error"
+FAILURE_REASON_HEADER = "failure_reason"
+FAILED_AT_HEADER = "failed_at"
+ORIGINAL_QUEUE_HEADER = "original_queue"
+
+# Bad JSON and missing or invalid fields (pydantic's ValidationError is a ValueError)
+PERMANENT_ERRORS: Tuple[Type[Exception], ...] = (ValueError, KeyError, TypeError)
+
+MAX_REASON_LENGTH = 1000
+
+
+def exponential_delays(base: float, retries: int) -> List[float]:
+    """
+    :param base: Delay before the first retry, in seconds.
+    :param retries: Number of retries.
+    :return: Delays doubling at each retry.
+    """
+    return [base * 2 ** retry for retry in range(retries)]
+
+
+def failure_reason(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"[:MAX_REASON_LENGTH]
+
+
+class RetryPolicy:
+    """
+    Route the failed messages of a queue to its retry queues, then to its dead-letter queue.
+    """
+
+    def __init__(
+        self,
+        queue: str,
+        delays: Sequence[float],
+        permanent_errors: Tuple[Type[Exception], ...] = PERMANENT_ERRORS,
+        exchange: Optional[AbstractExchange] = None,
+    ):
+        """
+        :param queue: Name of the consumed queue.
+        :param delays: Seconds before each retry, a message is handled at most len(delays) + 1 times.
+        :param permanent_errors: Errors sending a message to the dead-letter queue without retrying it.
+        :param exchange: Default exchange used to publish to the retry and dead-letter queues, set by declare.
+        """
+        self.queue = queue
+        self.delays = list(delays)
+        self.permanent_errors = permanent_errors
+        self.exchange = exchange
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @property
+    def max_attempts(self) -> int:
+        return len(self.delays) + 1
+
+    @property
+    def dead_letter_queue(self) -> str:
+        return f"{self.queue}.dead"
+
+    def retry_queue(self, attempt: int) -> str:
+        return f"{self.queue}.retry.{attempt}"
+
+    async def declare(self, channel: AbstractChannel):
+        """
+        Declare the retry and dead-letter queues of the queue.
+
+        :param channel: Channel, with publisher confirms so failed messages are only acked once routed.
+        """
+        for attempt, delay in enumerate(self.delays, start=1):
+            await channel.declare_queue(
+                self.retry_queue(attempt),
+                durable=True,
+                arguments={
+                    "x-message-ttl": int(delay * 1000),
+                    # Expired messages go back to the consumed queue through the default exchange
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": self.queue,
+                },
+            )
+        await channel.declare_queue(self.dead_letter_queue, durable=True)
+        self.exchange = channel.default_exchange
+
+    @staticmethod
+    def attempts(message: AbstractIncomingMessage) -> int:
+        """
+        :return: Number of times the message was handled, including the current one.
+        """
+        return int((message.headers or {}).get(ATTEMPTS_HEADER, 0)) + 1
+
+    async def on_failure(self, message: AbstractIncomingMessage, error: Exception):
+        """
+        Publish a failed message to its next retry queue, or to the dead-letter queue.
+
+        The caller acks the message once this returns.
+
+        :param message: Message that failed.
+        :param error: Error raised while handling it.
+        """
+        attempts = self.attempts(message)
+        headers = {**(message.headers or {}), ATTEMPTS_HEADER: attempts, LAST_ERROR_HEADER: failure_reason(error)}
+        if isinstance(error, self.permanent_errors) or attempts >= self.max_attempts:
+            headers[FAILURE_REASON_HEADER] = failure_reason(error)
+            headers[FAILED_AT_HEADER] = datetime.now(timezone.utc).isoformat()
+            headers[ORIGINAL_QUEUE_HEADER] = self.queue
+            routing_key = self.dead_letter_queue
+            self.dead_lettered += 1
+            logger.warning(f"Dead-lettering message after {attempts} attempt(s): {failure_reason(error)}")
+        else:
+            routing_key = self.retry_queue(attempts)
+            self.retried += 1
+            logger.info(f"Retrying message in {self.delays[attempts - 1]}s (attempt {attempts}): {failure_reason(error)}")
+        await self.exchange.publish(
+            Message(
+                body=message.body,
+                headers=headers,
+                content_type=message.content_type,
+                message_id=message.message_id,
+                timestamp=message.timestamp,
+                delivery_mode=DeliveryMode.PERSISTENT,
+            ),
+            routing_key=routing_key,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
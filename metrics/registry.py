@@ -0,0 +1,23 @@
+from typing import Callable, Dict
+
+# Functions returning the current statistics of each instrumented component
+providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    """
+    Register the statistics of a component.
+
+    :param name: Name under which the statistics are exposed.
+    :param provider: Function returning the current statistics.
+    """
+    providers[name] = provider
+
+
+def snapshot() -> dict:
+    """
+    Get the current statistics of every registered component.
+
+    :return: Statistics by component name.
+    """
+    return {name: provider() for name, provider in providers.items()}
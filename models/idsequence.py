@@ -0,0 +1,10 @@
+from sqlalchemy import BigInteger, Column, String
+
+from db.database import Base
+
+
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+
+    name = Column(String(50), primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
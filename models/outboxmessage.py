@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from db.database import Base
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+
+    # Increasing id, messages are published in id order
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    routing_key = Column(String(255), nullable=False)
+    # JSON encoded message
+    body = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
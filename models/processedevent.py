@@ -0,0 +1,11 @@
+from sqlalchemy import Column, DateTime, String
+
+from db.database import Base
+
+
+class ProcessedEvent(Base):
+    __tablename__ = "processed_events"
+
+    # Event type and id (or body digest), e.g. "checkout.session.completed:cs_123"
+    event_key = Column(String(255), primary_key=True)
+    processed_at = Column(DateTime, nullable=False)
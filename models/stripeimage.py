@@ -0,0 +1,13 @@
+from sqlalchemy import Column, DateTime, String
+
+from db.database import Base
+
+
+class StripeImage(Base):
+    __tablename__ = "stripe_images"
+
+    # SHA-256 of the image bytes, identical images are uploaded to Stripe once
+    digest = Column(String(64), primary_key=True)
+    stripe_file_id = Column(String(64), nullable=False)
+    url = Column(String(512), nullable=False)
+    created_at = Column(DateTime, nullable=False)
@@ -1,13 +1,14 @@
 from typing import List, Optional
 
-from sqlalchemy import (ARRAY, Boolean, Column, DateTime, Float, Integer,
-                        String, Text)
+from sqlalchemy import (ARRAY, Boolean, Column, DateTime, Float, Index,
+                        Integer, String, Text)
 
 from db.database import Base
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (Index("ix_tickets_game_id_active", "game_id", "active"),)
 
     id = Column(Integer, primary_key=True, index=True)
     game_id = Column(Integer, nullable=False)
@@ -18,4 +19,6 @@ class Ticket(Base):
     stripe_prod_id = Column(String(32), nullable=False)
     stripe_price_id = Column(String(32), nullable=False)
     stripe_image_url = Column(String(512), nullable=False)
+    # The Stripe fields are empty while the product is provisioned in the background
+    provisioning_status = Column(String(16), nullable=False, default="ready", server_default="ready")
     
\ No newline at end of file
@@ -1,21 +1,22 @@
 from sqlalchemy import (ARRAY, Boolean, Column, DateTime, Float, ForeignKey,
-                        Integer, String, Text)
+                        Index, Integer, String, Text)
+from sqlalchemy.dialects import mysql
 
 from db.database import Base
-import secrets
-import string
+
+# Keep microseconds on MySQL, whose DATETIME defaults to whole seconds
+Timestamp = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+
 
 class UserTicket(Base):
     __tablename__ = "user_tickets"
+    __table_args__ = (Index("ix_user_tickets_ticket_id_is_active", "ticket_id", "is_active"),)
 
-    id = Column(String(12), primary_key=True, index=True)
-    user_id = Column(String(50), nullable=False)
+    # 13-digit ids from crud.ticket_ids, or legacy 12-digit random ids
+    id = Column(String(13), primary_key=True, index=True)
+    user_id = Column(String(50), nullable=False, index=True)
     ticket_id = Column(Integer, ForeignKey('tickets.id'), nullable=False)
     unit_amount = Column(Float, nullable=False)
-    created_at = Column(String(500), nullable=False)
+    created_at = Column(Timestamp, nullable=False, index=True)
     is_active = Column(Boolean, default=True)
-    deactivated_at = Column(String(500), nullable=True)
-
-def generate_random_user_ticket_id(id_length: int) -> str:
-    secure_chars = string.digits
-    return ''.join(secrets.choice(secure_chars) for _ in range(id_length))
+    deactivated_at = Column(Timestamp, nullable=True, index=True)
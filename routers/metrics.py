@@ -0,0 +1,24 @@
+import os
+
+from dotenv import load_dotenv
+from fastapi import APIRouter
+from starlette import status
+
+from metrics.registry import snapshot
+
+load_dotenv()
+
+# The statistics expose internals of the service, /metrics is only served when enabled
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get(
+    "/metrics",
+    summary="Get runtime statistics",
+    response_description="Statistics of the caches, pools and queues of this worker",
+    status_code=status.HTTP_200_OK,
+)
+def get_metrics():
+    return snapshot()
@@ -1,27 +1,41 @@
 import asyncio
+import hashlib
 import io
 import json
 import logging
 import os
 import sys
 from contextlib import asynccontextmanager
-from typing import List
+from typing import Callable, List, Optional
 
 import aio_pika
-import stripe
-from aio_pika import Message
 
 from auth.JWTBearer import JWTAuthorizationCredentials
-from auth.auth import auth
-from auth.user_auth import user_info_with_token, get_user_info_from_user_sub
-from crud import crud
-from db.create_database import create_tables
+from auth.auth import auth, read_auth, jwks_provider
+from auth.user_auth import user_info_with_token
+from auth.user_profiles import user_profiles
+from crud import async_crud, crud
+from crud.ticket_ids import is_valid_ticket_id
+from concurrency.executor import db_executor
+from concurrency.loop_lag import LoopLagMonitor
+from gateways.image_cache import ImageCache
+from gateways.stripe_gateway import StripeGateway
+from gateways.stripe_sync import StripeSync, product_changes
+from uploads.png import InvalidImage, read_png_header
+from db.async_database import AsyncSessionLocal, async_engine, get_async_db
 from db.database import get_db
-from fastapi import (APIRouter, Depends, FastAPI, Form, HTTPException,
-                     UploadFile)
+from fastapi import (APIRouter, BackgroundTasks, Depends, FastAPI, Form,
+                     HTTPException, Response, UploadFile)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from auth.auth import jwks, get_current_user
-from auth.JWTBearer import JWTAuthorizationCredentials, JWTBearer
+from auth.auth import get_current_user
+from auth.cache import LRUCache
+from messaging.batch_consumer import BatchConsumer
+from messaging.consumer import KeyedConsumer
+from messaging.outbox import OutboxRelay
+from messaging.publisher import Publisher
+from messaging.retry import RetryPolicy, exponential_delays
+from metrics.registry import register
 
 from models.ticket import Ticket as TicketModel
 from models.userticket import UserTicket as UserTicketModel
@@ -36,14 +50,77 @@ from models.userticket import UserTicket as UserTicketModel
 router = APIRouter(tags=["Tickets"])
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
-stripe.api_key = os.getenv("STRIPE_API_KEY")
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler(sys.stdout))
+RECENT_EVENTS_SIZE = int(os.getenv("RECENT_EVENTS_SIZE", 10000))
+CONSUMER_PREFETCH = int(os.getenv("CONSUMER_PREFETCH", 32))
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", 8))
+# Batching mode is enabled when the batch size is greater than 1
+CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", 0))
+CONSUMER_BATCH_WAIT_MS = float(os.getenv("CONSUMER_BATCH_WAIT_MS", 50))
+# v1: one EMAILS message per ticket, v2: one per order (see email_messages)
+EMAIL_MESSAGE_FORMAT = os.getenv("EMAIL_MESSAGE_FORMAT", "v1")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1))
+# A failing PAYMENTS message is retried after 2s, 4s, 8s and 16s, then dead-lettered
+PAYMENTS_MAX_ATTEMPTS = int(os.getenv("PAYMENTS_MAX_ATTEMPTS", 5))
+PAYMENTS_RETRY_BASE_DELAY = float(os.getenv("PAYMENTS_RETRY_BASE_DELAY", 2))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))
+PUBLISHER_CHANNELS = int(os.getenv("PUBLISHER_CHANNELS", 4))
+PUBLISHER_BUFFER_SIZE = int(os.getenv("PUBLISHER_BUFFER_SIZE", 1000))
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", 20))
+STRIPE_IMAGE_CACHE_SIZE = int(os.getenv("STRIPE_IMAGE_CACHE_SIZE", 1024))
+# Ticket updates within STRIPE_SYNC_DELAY seconds are sent to Stripe as one product update
+STRIPE_SYNC_DELAY = float(os.getenv("STRIPE_SYNC_DELAY", 1))
+STRIPE_SYNC_MAX_ATTEMPTS = int(os.getenv("STRIPE_SYNC_MAX_ATTEMPTS", 5))
+# sync: tickets are created once their Stripe product is, background: tickets are
+# created right away (202) and their Stripe product is provisioned in the background
+TICKET_PROVISIONING_MODE = os.getenv("TICKET_PROVISIONING_MODE", "sync")
+if TICKET_PROVISIONING_MODE not in ("sync", "background"):
+    raise ValueError(f"Unknown TICKET_PROVISIONING_MODE {TICKET_PROVISIONING_MODE}, expected sync or background")
+if EMAIL_MESSAGE_FORMAT not in ("v1", "v2"):
+    raise ValueError(f"Unknown EMAIL_MESSAGE_FORMAT {EMAIL_MESSAGE_FORMAT}, expected v1 or v2")
 MAX_FILE_SIZE = 2097152  # 2MB - Stripe maximum
+# Room for the form fields and multipart headers around the image
+MAX_REQUEST_BODY_SIZE = MAX_FILE_SIZE + 65536
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", 8000))
 ACCEPTED_FILE_MIME_TYPE = ["image/png"]
 ACCEPTED_FILE_EXTENSIONS = [".png"]
 
+# How late the event loop runs, to spot blocking calls made on it
+loop_lag = LoopLagMonitor(interval=LOOP_LAG_INTERVAL)
+register("event_loop", loop_lag.stats)
+
+# Images already uploaded to Stripe, reused by the tickets with the same artwork
+stripe_images = ImageCache(lambda: AsyncSessionLocal(), maxsize=STRIPE_IMAGE_CACHE_SIZE)
+register("stripe_images", stripe_images.stats)
+
+# Stripe requests are made asynchronously over a pool of keep-alive connections
+stripe_gateway = StripeGateway(
+    os.getenv("STRIPE_API_KEY"),
+    api_base=os.getenv("STRIPE_API_BASE"),
+    max_connections=STRIPE_MAX_CONNECTIONS,
+    image_cache=stripe_images,
+)
+register("stripe", stripe_gateway.stats)
+
+# Product updates are sent after the response, merged and retried in the background
+stripe_sync = StripeSync(stripe_gateway.update_product, delay=STRIPE_SYNC_DELAY, max_attempts=STRIPE_SYNC_MAX_ATTEMPTS)
+register("stripe_sync", stripe_sync.stats)
+
+# Keys of the events processed recently by this worker
+recent_events = LRUCache(maxsize=RECENT_EVENTS_SIZE)
+register("recent_events", recent_events.stats)
+
+def message_key(body: bytes) -> Optional[str]:
+    """
+    Ordering key of a payments message: messages of the same user are handled in order.
+    """
+    user_id = json.loads(body).get("user_id")
+    return None if user_id is None else str(user_id)
+
+
 connection = None
 channel = None
 exchange = None
@@ -52,7 +129,9 @@ queue = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global connection, channel, exchange, queue
-    create_tables()
+    # The schema is migrated at deploy time by `python -m db.migrate`
+    loop_lag.start()
+    jwks_provider.start()
     # Connect to RabbitMQ
     connection = await aio_pika.connect_robust(RABBITMQ_URL)
     channel = await connection.channel()
@@ -66,74 +145,210 @@ async def lifespan(app: FastAPI):
     await tickets_queue.bind(exchange, routing_key="tickets.messages")
     await payments_queue.bind(exchange, routing_key="payments.messages")
 
-    async def rabbitmq_listener():
-        async with payments_queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                async with message.process():
-                    logger.info(f"Received message: {message.body}")
-                    # Process the message here
-                    await process_message(message.body)
-    
-    # Run RabbitMQ listener in the background
-    task = asyncio.create_task(rabbitmq_listener())
+    # Delayed-retry queues (PAYMENTS.retry.<n>) and dead-letter queue (PAYMENTS.dead)
+    await payments_retry.declare(channel)
+
+    # At most CONSUMER_PREFETCH unacked messages are held by the consumer, enough to fill a batch
+    await channel.set_qos(prefetch_count=max(CONSUMER_PREFETCH, 2 * CONSUMER_BATCH_SIZE))
+    await payments_consumer.start(payments_queue)
+    await publisher.start()
+    outbox_relay.start()
     yield
     # Cleanup
+    await payments_consumer.stop()
+    await outbox_relay.stop()
+    await publisher.stop()
+    await stripe_sync.stop()
+    await stripe_gateway.close()
+    await jwks_provider.stop()
+    await loop_lag.stop()
     await channel.close()
     await connection.close()
+    await async_engine.dispose()
+
+def event_key(message: dict, body: bytes) -> str:
+    """
+    Key identifying an event across redeliveries.
+
+    :param message: Decoded event
+    :param body: Raw event body
+    :return: Event type followed by the event or checkout session id, or by the digest of the body
+    """
+    for field in ["event_id", "session_id", "checkout_session_id"]:
+        if message.get(field):
+            return f"{message.get('event')}:{message[field]}"
+    return f"{message.get('event')}:sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+def checkout_order(message: dict) -> UserTicketCreate:
+    return UserTicketCreate(
+        user_id=message["user_id"],
+        ticket_id=message["ticket_id"],
+        quantity=message["quantity"],
+        unit_amount=message["unit_amount"],
+        created_at=message["created_at"],
+    )
+
 
 async def process_message(body):
+    logger.info(f"Received message: {body}")
     message = json.loads(body)
     event = message.get("event")
     if event == "checkout.session.completed":
-        ticket = UserTicketCreate(
-            user_id=message["user_id"],
-            ticket_id=message["ticket_id"],
-            quantity=message["quantity"],
-            unit_amount=message["unit_amount"],
-            created_at=message["created_at"],
-        )
-        db = next(get_db())
-        try:
-            await crud.buy_tickets(db, ticket, process_ticket)
-        finally:
-            db.close()
-
-
-async def process_ticket(db, user_ticket_db: UserTicketModel):
-    user_info = get_user_info_from_user_sub(user_ticket_db.user_id)
-    if user_info is None:
-        logger.info(f"Found user_info is None for sub {user_ticket_db.user_id}")
-    else:
-        main_ticket = crud.get_ticket_by_id(db, ticket_id=user_ticket_db.ticket_id)
-        await send_message({
-            "user_name": user_info["name"],
-            "ticket_id": user_ticket_db.id,
-            "ticket_name": main_ticket.name,
-            "ticket_price": main_ticket.price,
-            "to_email": user_info["email"],
-        }, "EMAILS")
-
-
-
-async def send_message(message: dict, routing_key: str):
-    logger.info(f"Sending message: {message} to {routing_key}")
-    await exchange.publish(
-        message=Message(body=json.dumps(message).encode()),
-        routing_key=routing_key
+        key = event_key(message, body)
+        # Most redeliveries are dropped here, the processed_events table catches the others
+        if key in recent_events:
+            logger.info(f"Dropping redelivered event {key}")
+            return
+        ticket = checkout_order(message)
+        add_order_emails = await order_emails([ticket])
+        async with AsyncSessionLocal() as db:
+            await async_crud.buy_tickets(db, ticket, add_order_emails, event_key=key)
+        recent_events.set(key, True)
+        outbox_relay.notify()
+
+
+async def process_messages(bodies: List[bytes]):
+    """
+    Process a batch of messages, writing the tickets of all its orders in one transaction.
+
+    If an order was already processed, the batch fails and its messages are
+    processed one by one by process_message.
+
+    :param bodies: Message bodies
+    """
+    orders = {}
+    for body in bodies:
+        message = json.loads(body)
+        if message.get("event") != "checkout.session.completed":
+            continue
+        key = event_key(message, body)
+        if key in recent_events or key in orders:
+            logger.info(f"Dropping redelivered event {key}")
+            continue
+        orders[key] = checkout_order(message)
+    if not orders:
+        return
+    add_order_emails = await order_emails(list(orders.values()))
+    async with AsyncSessionLocal() as db:
+        await async_crud.buy_tickets_batch(db, [(ticket, key) for key, ticket in orders.items()], add_order_emails)
+    for key in orders:
+        recent_events.set(key, True)
+    outbox_relay.notify()
+
+
+payments_retry = RetryPolicy("PAYMENTS", exponential_delays(PAYMENTS_RETRY_BASE_DELAY, PAYMENTS_MAX_ATTEMPTS - 1))
+register("payments_retry", payments_retry.stats)
+
+if CONSUMER_BATCH_SIZE > 1:
+    payments_consumer = BatchConsumer(
+        process_messages,
+        process_message,
+        max_batch_size=CONSUMER_BATCH_SIZE,
+        max_wait=CONSUMER_BATCH_WAIT_MS / 1000,
+        on_failure=payments_retry.on_failure,
+    )
+else:
+    payments_consumer = KeyedConsumer(
+        process_message, workers=CONSUMER_WORKERS, key=message_key, on_failure=payments_retry.on_failure
     )
+register("payments_consumer", payments_consumer.stats)
+
+
+def email_messages(user_info: dict, main_ticket: TicketModel, user_tickets: List[UserTicketModel]) -> List[dict]:
+    """
+    Build the EMAILS messages of an order in the EMAIL_MESSAGE_FORMAT format.
 
-auth = JWTBearer(jwks)
+    v1: one message per ticket, with its ticket_id.
+    v2: one message per order, with the list of its ticket_ids.
+
+    :param user_info: Profile of the buyer
+    :param main_ticket: Ticket bought
+    :param user_tickets: Tickets of the order
+    :return: Messages to publish
+    """
+    message = {
+        "user_name": user_info["name"],
+        "ticket_name": main_ticket.name,
+        "ticket_price": main_ticket.price,
+        "to_email": user_info["email"],
+    }
+    if EMAIL_MESSAGE_FORMAT == "v2":
+        return [{"version": 2, **message, "ticket_ids": [user_ticket.id for user_ticket in user_tickets]}]
+    return [{**message, "ticket_id": user_ticket.id} for user_ticket in user_tickets]
+
+
+async def order_emails(orders: List[UserTicketCreate]) -> Callable:
+    """
+    Look up the buyers' profiles and the tickets bought by orders.
+
+    The lookups are done before the orders' transaction is opened, so the
+    Cognito calls don't hold it: the returned callback only adds the emails
+    to the outbox, where they are committed with the orders.
+
+    :param orders: Orders to process
+    :return: Callback adding the emails of an order to the outbox
+    """
+    user_infos = {}
+    for user_id in dict.fromkeys(order.user_id for order in orders):
+        user_infos[user_id] = await user_profiles.get(user_id)
+        if user_infos[user_id] is None:
+            logger.info(f"Found user_info is None for sub {user_id}")
+    main_tickets = {}
+    ticket_ids = dict.fromkeys(order.ticket_id for order in orders if user_infos[order.user_id] is not None)
+    if ticket_ids:
+        async with AsyncSessionLocal() as db:
+            for ticket_id in ticket_ids:
+                main_tickets[ticket_id] = await async_crud.get_ticket_by_id(db, ticket_id=ticket_id)
+
+    async def add_order_emails(db, user_tickets: List[UserTicketModel]):
+        # All the tickets of an order belong to the same user and ticket
+        user_ticket_db = user_tickets[0]
+        user_info = user_infos[user_ticket_db.user_id]
+        if user_info is not None:
+            for message in email_messages(user_info, main_tickets[user_ticket_db.ticket_id], user_tickets):
+                async_crud.add_outbox_message(db, message, "EMAILS")
+
+    return add_order_emails
+
+
+async def open_exchange():
+    # Publishes return once the broker confirms them, so the outbox relay only deletes confirmed messages
+    publisher_channel = await connection.channel(publisher_confirms=True)
+    return await publisher_channel.get_exchange("exchange")
+
+
+publisher = Publisher(open_exchange, channels=PUBLISHER_CHANNELS, buffer_size=PUBLISHER_BUFFER_SIZE)
+register("publisher", publisher.stats)
+
+
+async def publish_message(routing_key: str, body: bytes, message_id: str):
+    logger.info(f"Sending message: {body} to {routing_key}")
+    # Business events are persistent, so they survive a broker restart
+    await publisher.publish(routing_key, body, message_id=message_id, persistent=True)
+
+
+# Broker messages are written to the outbox with the changes they announce and published by this relay
+outbox_relay = OutboxRelay(
+    lambda: AsyncSessionLocal(),
+    publish_message,
+    batch_size=OUTBOX_BATCH_SIZE,
+    poll_interval=OUTBOX_POLL_INTERVAL,
+)
+register("outbox_relay", outbox_relay.stats)
 
 
 @router.post("/tickets", response_model=TicketInDB, dependencies=[Depends(auth)])
 async def create_ticket(
     image: UploadFile,
+    background_tasks: BackgroundTasks,
+    response: Response,
     game_id: int = Form(...),
     name: str = Form(...),
     description: str = Form(...),
     active: bool = Form(...),
     price: float = Form(...),
-    stock: int = Form(...), db: Session = Depends(get_db)):
+    stock: int = Form(...), db: AsyncSession = Depends(get_async_db)):
     ticket = TicketCreate(
         game_id=game_id,
         name=name,
@@ -144,7 +359,7 @@ async def create_ticket(
     )
 
     # Verify if there is already a created ticket for that game
-    if crud.get_ticket_by_game_id(db, game_id) is not None:
+    if await async_crud.get_ticket_by_game_id(db, game_id) is not None:
         raise HTTPException(status_code=400, detail=f"Ticket already exists for game with id {game_id}")
 
     _, file_extension = os.path.splitext(image.filename)
@@ -158,50 +373,101 @@ async def create_ticket(
             status_code=400,
             detail=f"Invalid file MIME type. Supported MIME types include {ACCEPTED_FILE_MIME_TYPE[0]}.",
         )
+    # Bodies over MAX_REQUEST_BODY_SIZE were already rejected by BodySizeLimitMiddleware while streaming
     if image.size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Max size is {MAX_FILE_SIZE} bytes.",
         )
+    # The content is checked from its first bytes, whatever MIME type was declared
+    try:
+        header = read_png_header(image.file)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=f"Invalid PNG image: {e}.")
+    if header.width > MAX_IMAGE_DIMENSION or header.height > MAX_IMAGE_DIMENSION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image too large. Max dimensions are {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION} pixels.",
+        )
 
-    stripe_uploaded_image = stripe.File.create(
-        purpose="product_image",
-        file=io.BytesIO(image.file.read()),
-    )
-    stripe_link = stripe.FileLink().create(file=stripe_uploaded_image)
-    stripe_product = stripe.Product.create(
-        name=ticket.name,
-        description=ticket.description,
-        active=ticket.active,
-        default_price_data={
-            "currency": "eur",
-            "unit_amount": int(ticket.price * 100),  # In cents
-        },
-        images=[stripe_link.url],
+    if TICKET_PROVISIONING_MODE == "background":
+        # The upload is closed with the request, the image is kept in memory for the background task
+        image_copy = io.BytesIO(await image.read())
+        created_ticket = await async_crud.post_ticket(db, ticket, "", "", "", provisioning_status="provisioning")
+        background_tasks.add_task(provision_ticket, created_ticket.id, ticket, image_copy, image.filename)
+        response.status_code = 202
+        return created_ticket
+
+    # Two dependent round trips: the image upload, which also creates its link, then the product.
+    # The image is streamed to Stripe in chunks from the spooled temporary file of the upload.
+    stripe_product = await stripe_gateway.create_product(
+        ticket.name, ticket.description, ticket.active, int(ticket.price * 100), image.file, image.filename
     )
-    stripe_price_id = stripe_product["default_price"]
 
-    created_ticket = crud.post_ticket(
-        db, ticket, stripe_product.id, stripe_price_id, stripe_link.url
+    created_ticket = await async_crud.post_ticket(
+        db,
+        ticket,
+        stripe_product.prod_id,
+        stripe_product.price_id,
+        stripe_product.image_url,
+        ticket_created_messages(ticket, stripe_product.price_id),
     )
-
-    # Publish message to MQ for payment microservice
-    message = {
-        "event": "ticket_created",
-        "ticket_id": created_ticket.id,
-        "stripe_price_id": stripe_price_id,
-        "stock": ticket.stock
-    }
-    await send_message(message, "tickets.messages")
+    outbox_relay.notify()
 
     return created_ticket
 
 
+def ticket_created_messages(ticket: TicketCreate, stripe_price_id: str):
+    # Message to MQ for payment microservice, published by the outbox relay
+    def messages(ticket_db: TicketModel):
+        message = {
+            "event": "ticket_created",
+            "ticket_id": ticket_db.id,
+            "stripe_price_id": stripe_price_id,
+            "stock": ticket.stock
+        }
+        return [(message, "tickets.messages")]
+
+    return messages
+
+
+async def provision_ticket(ticket_id: int, ticket: TicketCreate, image: io.BytesIO, image_name: str):
+    """
+    Create the Stripe product of a ticket created in background provisioning mode.
+
+    The payment microservice is told about the ticket once it has a price.
+    Whatever fails, the ticket is marked failed instead of staying in provisioning.
+    """
+    try:
+        stripe_product = await stripe_gateway.create_product(
+            ticket.name, ticket.description, ticket.active, int(ticket.price * 100), image, image_name
+        )
+        async with AsyncSessionLocal() as db:
+            await async_crud.provision_ticket(
+                db,
+                ticket_id,
+                stripe_product.prod_id,
+                stripe_product.price_id,
+                stripe_product.image_url,
+                ticket_created_messages(ticket, stripe_product.price_id),
+            )
+    except Exception:
+        logger.exception(f"Failed to provision the Stripe product of ticket {ticket_id}")
+        try:
+            # In a new session, the one of the failed update may be unusable
+            async with AsyncSessionLocal() as db:
+                await async_crud.fail_ticket_provisioning(db, ticket_id)
+        except Exception:
+            logger.exception(f"Failed to mark ticket {ticket_id} as failed")
+        return
+    outbox_relay.notify()
+
+
 @router.put("/tickets/{ticket_id}", response_model=TicketInDB, dependencies=[Depends(auth)])
 async def update_ticket(
-    ticket_id: int, ticket_update: TicketUpdate, db: Session = Depends(get_db)
+    ticket_id: int, ticket_update: TicketUpdate, db: AsyncSession = Depends(get_async_db)
 ):
-    ticket = crud.get_ticket_by_id(db, ticket_id)
+    ticket = await async_crud.get_ticket_by_id(db, ticket_id)
     if not ticket:
         raise HTTPException(
             status_code=404, detail=f"Ticket with id {ticket_id} not found."
@@ -210,24 +476,27 @@ async def update_ticket(
         raise HTTPException(
             status_code=400, detail="The content to update the ticket with is empty."
         )
-    
-    if ticket_update.stock is not None:
-        # Publish message to MQ for payment microservice
+    if ticket.provisioning_status != "ready":
+        raise HTTPException(
+            status_code=409, detail=f"Ticket with id {ticket_id} has no Stripe product ({ticket.provisioning_status})."
+        )
+
+    # Message to MQ for payment microservice, published by the outbox relay
+    def ticket_updated_messages(ticket_db: TicketModel):
+        if ticket_update.stock is None:
+            return []
         message = {
             "event": "ticket_stock_updated",
-            "ticket_id": ticket.id,
+            "ticket_id": ticket_db.id,
             "stock": ticket_update.stock
         }
-        await send_message(message, "tickets.messages")
-
-    crud.update_ticket(db, ticket, ticket_update)
+        return [(message, "tickets.messages")]
 
-    stripe.Product.modify(
-        ticket.stripe_prod_id,
-        name=ticket.name,
-        description=ticket.description,
-        active=ticket.active,
-    )        
+    # Only the fields Stripe stores and the update changes are synced, once the update is committed
+    changes = product_changes(ticket, ticket_update.model_dump(exclude_none=True))
+    await async_crud.update_ticket(db, ticket, ticket_update, ticket_updated_messages)
+    stripe_sync.schedule(ticket.stripe_prod_id, changes)
+    outbox_relay.notify()
 
     return ticket
 
@@ -237,22 +506,22 @@ def buy_ticket_endpoint(ticket: UserTicketCreate, db: Session = Depends(get_db))
     return crud.buy_tickets(db, ticket)
 
 
-@router.get("/tickets/user/{user_id}", response_model=List[UserTicketInDB], dependencies=[Depends(auth)])
-def get_tickets_by_user_id_endpoint(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_tickets_by_user_id(db, user_id)
+@router.get("/tickets/user/{user_id}", response_model=List[UserTicketInDB], dependencies=[Depends(read_auth)])
+async def get_tickets_by_user_id_endpoint(user_id: int, db: Session = Depends(get_db)):
+    return await db_executor.run(crud.get_tickets_by_user_id, db, user_id)
 
 
-@router.get("/tickets/{ticket_id}", response_model=TicketInDB, dependencies=[Depends(auth)])
-def get_ticket_by_id_endpoint(ticket_id: int, db: Session = Depends(get_db)):
-    ticket = crud.get_ticket_by_id(db, ticket_id)
+@router.get("/tickets/{ticket_id}", response_model=TicketInDB, dependencies=[Depends(read_auth)])
+async def get_ticket_by_id_endpoint(ticket_id: int, db: Session = Depends(get_db)):
+    ticket = await db_executor.run(crud.get_ticket_by_id, db, ticket_id)
     if ticket is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
     return ticket
 
 
-@router.get("/tickets/game/{game_id}", response_model=TicketInDB, dependencies=[Depends(auth)])
-def get_tickets_by_game_id_endpoint(game_id: int, db: Session = Depends(get_db)):
-    ticket = crud.get_ticket_by_game_id(db, game_id)
+@router.get("/tickets/game/{game_id}", response_model=TicketInDB, dependencies=[Depends(read_auth)])
+async def get_tickets_by_game_id_endpoint(game_id: int, db: Session = Depends(get_db)):
+    ticket = await db_executor.run(crud.get_ticket_by_game_id, db, game_id)
     if ticket is None:
         raise HTTPException(
             status_code=404, detail=f"Ticket not found for game ID {game_id}"
@@ -260,16 +529,19 @@ def get_tickets_by_game_id_endpoint(game_id: int, db: Session = Depends(get_db))
     return ticket
 
 
-@router.get("/tickets", response_model=List[TicketInDB], dependencies=[Depends(auth)])
-def get_tickets_endpoint(
+@router.get("/tickets", response_model=List[TicketInDB], dependencies=[Depends(read_auth)])
+async def get_tickets_endpoint(
     skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
 ):
-    return crud.get_tickets(db, skip, limit)
+    return await db_executor.run(crud.get_tickets, db, skip, limit)
 
 
 @router.put("/tickets/{ticket_id}/validate", response_model=UserTicket, dependencies=[Depends(auth)])
-def deactivate_ticket(ticket_id: str, db: Session = Depends(get_db)):
+async def deactivate_ticket(ticket_id: str, db: Session = Depends(get_db)):
     ticket_id = ticket_id[:-1]
-    ticket = crud.validate_ticket(db, ticket_id)
+    # Malformed or mistyped scans are rejected without a database query
+    if not is_valid_ticket_id(ticket_id):
+        raise HTTPException(status_code=400, detail=f"Invalid ticket id {ticket_id}.")
+    ticket = await db_executor.run(crud.validate_ticket, db, ticket_id)
 
     return ticket
@@ -27,4 +27,5 @@ class TicketInDB(Ticket):
     id: int
     stripe_price_id: str
     stripe_image_url: str
+    provisioning_status: str = "ready" # provisioning, ready or failed
 
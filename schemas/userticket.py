@@ -1,15 +1,39 @@
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Annotated, Optional
 
-from pydantic import BaseModel
+from pydantic import AfterValidator, BaseModel, PlainSerializer
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+    :param value: Timestamp, naive ones being already in UTC.
+    :return: The timestamp in UTC, naive as it is stored.
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def utc_now() -> datetime:
+    """
+    :return: Current time in UTC, naive as it is stored.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Stored as DateTime columns, returned in the formats the API has always used:
+# created_at as the payments service sends it (ISO 8601), deactivated_at as str(datetime)
+CreatedAt = Annotated[datetime, AfterValidator(to_utc), PlainSerializer(datetime.isoformat, return_type=str, when_used="json")]
+DeactivatedAt = Annotated[datetime, AfterValidator(to_utc), PlainSerializer(str, return_type=str, when_used="json")]
 
 
 class UserTicket(BaseModel):
     user_id: str
     ticket_id: int
     unit_amount: float
-    created_at: str
+    created_at: CreatedAt
     is_active: bool = True
-    deactivated_at: Optional[str] = None
+    deactivated_at: Optional[DeactivatedAt] = None
 
 
 class UserTicketCreate(UserTicket):
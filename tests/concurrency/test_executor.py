@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from concurrency.executor import BlockingExecutor
+from concurrency.loop_lag import LoopLagMonitor
+
+
+def test_calls_run_off_the_event_loop():
+    executor = BlockingExecutor("stripe", max_workers=2)
+
+    async def run():
+        return await executor.run(lambda a, b=0: (threading.current_thread().name, a + b), 1, b=2)
+
+    thread, result = asyncio.run(run())
+
+    assert thread.startswith("stripe")
+    assert result == 3
+    assert executor.stats()["calls"] == 1
+
+
+def test_concurrency_is_bounded_and_waits_are_measured():
+    executor = BlockingExecutor("test", max_workers=2)
+    running = []
+    peak = []
+
+    def call():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+
+    async def run():
+        tasks = [asyncio.create_task(executor.run(call)) for _ in range(6)]
+        await asyncio.sleep(0.01)
+        queued = executor.stats()["queued"]
+        await asyncio.gather(*tasks)
+        return queued
+
+    queued = asyncio.run(run())
+
+    assert max(peak) == 2
+    assert queued == 4
+    stats = executor.stats()
+    assert stats["calls"] == 6 and stats["running"] == 0 and stats["queued"] == 0
+    # The last calls waited for two rounds of calls
+    assert stats["wait_time_max"] >= 0.09
+
+
+def test_errors_are_raised_and_counted():
+    executor = BlockingExecutor("test", max_workers=1)
+
+    def call():
+        raise RuntimeError("stripe is down")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await executor.run(call)
+        return executor.slots().locked()
+
+    assert asyncio.run(run()) is False
+    assert executor.stats()["failed"] == 1
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_call_ends():
+    executor = BlockingExecutor("test", max_workers=1)
+
+    async def run():
+        task = asyncio.create_task(executor.run(time.sleep, 0.1))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.sleep(0)
+        busy = executor.slots().locked()
+        await asyncio.sleep(0.15)
+        return busy, executor.slots().locked()
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_executor_is_shared_by_successive_event_loops():
+    executor = BlockingExecutor("test", max_workers=1)
+
+    async def run():
+        return await asyncio.gather(*(executor.run(time.sleep, 0.01) for _ in range(3)))
+
+    # Calls wait for a thread on each loop, e.g. before and after a restart of the app
+    for _ in range(2):
+        asyncio.run(run())
+
+    assert executor.stats()["calls"] == 6
+    assert executor.stats()["failed"] == 0
+
+
+@pytest.mark.parametrize("offloaded", [False, True])
+def test_loop_lag_shows_blocking_calls(offloaded):
+    executor = BlockingExecutor("test", max_workers=1)
+    monitor = LoopLagMonitor(interval=0.01, stall_threshold=0.1)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        for _ in range(2):
+            if offloaded:
+                await executor.run(time.sleep, 0.2)
+            else:
+                time.sleep(0.2)
+            await asyncio.sleep(0.02)
+        await monitor.stop()
+
+    asyncio.run(run())
+
+    stats = monitor.stats()
+    assert stats["samples"] > 0
+    if offloaded:
+        assert stats["stalls"] == 0
+        assert stats["lag_max"] < 0.1
+    else:
+        assert stats["stalls"] >= 1
+        assert stats["lag_max"] >= 0.15
@@ -0,0 +1,4 @@
+import os
+
+# Lets the modules configured at import run without production secrets, like TICKET_ID_KEY
+os.environ.setdefault("ENVIRONMENT", "test")
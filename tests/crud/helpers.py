@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.database import Base
+from models.ticket import Ticket as TicketModel
+from models.userticket import UserTicket as UserTicketModel
+
+
+def run_with_async_db(url: str, test: Callable[[AsyncSession], Awaitable]):
+    """
+    Run a coroutine with a session on a freshly created database.
+
+    :param url: Database URL using an async driver
+    :param test: Coroutine function receiving the session
+    :return: Result of the coroutine
+    """
+
+    async def run():
+        engine = create_async_engine(url)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                return await test(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def ticket_model(**fields) -> TicketModel:
+    return TicketModel(
+        **{
+            "game_id": 1,
+            "name": "Championship Finals",
+            "description": "Final match",
+            "active": True,
+            "price": 150.0,
+            "stripe_prod_id": "prod_123",
+            "stripe_price_id": "price_123",
+            "stripe_image_url": "https://example.com/image.jpg",
+            **fields,
+        }
+    )
+
+
+def user_ticket_model(**fields) -> UserTicketModel:
+    return UserTicketModel(
+        **{
+            "user_id": "12b-12b-12b",
+            "ticket_id": 1,
+            "unit_amount": 150.0,
+            "created_at": datetime(2023, 10, 1, 12),
+            **fields,
+        }
+    )
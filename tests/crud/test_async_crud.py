@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.exceptions import HTTPException
+
+from crud import async_crud
+from crud.ticket_ids import TicketIdAllocator, is_valid_ticket_id
+from models.idsequence import IdSequence
+from models.outboxmessage import OutboxMessage
+from models.ticket import Ticket as TicketModel
+from models.userticket import UserTicket as UserTicketModel
+from schemas.ticket import TicketCreate, TicketUpdate
+from schemas.userticket import UserTicketCreate
+from tests.crud.helpers import run_with_async_db, ticket_model, user_ticket_model
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    return f"sqlite+aiosqlite:///{tmp_path / 'tickets.db'}"
+
+
+def test_post_ticket(db_url):
+    ticket_data = TicketCreate(
+        game_id=1,
+        name="Championship Finals",
+        description="Final match of the championship",
+        active=True,
+        price=150.0,
+        stock=10,
+    )
+
+    async def test(db):
+        created = await async_crud.post_ticket(db, ticket_data, "prod_123", "price_123", "https://example.com/image.jpg")
+        return created, await async_crud.get_ticket_by_id(db, created.id)
+
+    created, fetched = run_with_async_db(db_url, test)
+
+    assert isinstance(created, TicketModel)
+    assert fetched is created
+    assert created.stripe_prod_id == "prod_123"
+    assert created.stripe_price_id == "price_123"
+
+
+def test_post_ticket_writes_outbox_messages_in_the_same_transaction(db_url):
+    ticket_data = TicketCreate(
+        game_id=1,
+        name="Championship Finals",
+        description="Final match of the championship",
+        active=True,
+        price=150.0,
+        stock=10,
+    )
+
+    async def test(db):
+        created = await async_crud.post_ticket(
+            db, ticket_data, "prod_123", "price_123", "https://example.com/image.jpg",
+            lambda ticket_db: [({"event": "ticket_created", "ticket_id": ticket_db.id}, "tickets.messages")],
+        )
+        return created, await async_crud.get_outbox_messages(db, 10)
+
+    created, messages = run_with_async_db(db_url, test)
+
+    [message] = messages
+    assert message.routing_key == "tickets.messages"
+    assert json.loads(message.body) == {"event": "ticket_created", "ticket_id": created.id}
+
+
+def test_failed_commit_writes_no_outbox_message(db_url):
+    async def test(db):
+        ticket = ticket_model()
+        db.add(ticket)
+        await db.commit()
+        with patch.object(db, "commit", side_effect=RuntimeError("connection lost")):
+            with pytest.raises(RuntimeError):
+                await async_crud.update_ticket(
+                    db, ticket, TicketUpdate(stock=0), lambda ticket_db: [({"stock": 0}, "tickets.messages")]
+                )
+        await db.rollback()
+        return await async_crud.get_outbox_messages(db, 10)
+
+    assert run_with_async_db(db_url, test) == []
+
+
+def test_update_ticket(db_url):
+    async def test(db):
+        ticket = ticket_model()
+        db.add(ticket)
+        await db.commit()
+        return await async_crud.update_ticket(
+            db, ticket, TicketUpdate(name="Championship Finals 2", active=False, stock=0)
+        )
+
+    result = run_with_async_db(db_url, test)
+
+    assert result.name == "Championship Finals 2"
+    assert result.active is False
+    assert result.description == "Final match"
+
+
+def test_buy_tickets_allocates_valid_unique_ids(db_url):
+    allocator = TicketIdAllocator(b"test", block_size=2)
+    send_message_callback = AsyncMock()
+    user_ticket_data = UserTicketCreate(
+        user_id="12b-12b-12b",
+        ticket_id=1,
+        quantity=3,
+        unit_amount=300.0,
+        created_at="2023-10-01T12:00:00",
+    )
+
+    async def test(db):
+        db.add(ticket_model(id=1))
+        await db.commit()
+        first = await async_crud.buy_tickets(db, user_ticket_data, send_message_callback)
+        second = await async_crud.buy_tickets(db, user_ticket_data.model_copy(update={"quantity": 2}), AsyncMock())
+        stored = await async_crud.get_tickets_by_user_id(db, "12b-12b-12b")
+        sequence = await db.get(IdSequence, "user_tickets")
+        return first, second, stored, sequence.next_value
+
+    with patch("crud.async_crud.ticket_id_allocator", allocator):
+        first, second, stored, next_value = run_with_async_db(db_url, test)
+
+    ids = [ticket.id for ticket in first + second]
+    assert ids == [allocator.encode(value) for value in range(5)]
+    assert all(len(ticket_id) == 13 and is_valid_ticket_id(ticket_id) for ticket_id in ids)
+    assert sorted(ticket.id for ticket in stored) == sorted(ids)
+    assert all(ticket.unit_amount == 300.0 and ticket.is_active for ticket in stored)
+    # A block of 3 for the first order, a block of 2 for the second one
+    assert next_value == 5
+    assert allocator.stats() == {"allocated": 5, "reserved_blocks": 2, "available": 0}
+    # One callback for the whole order
+    send_message_callback.assert_awaited_once()
+    assert send_message_callback.await_args.args[1] == first
+
+
+def test_get_ticket_by_game_id_only_returns_active_ticket(db_url):
+    async def test(db):
+        db.add_all([ticket_model(id=1, game_id=1, active=False), ticket_model(id=2, game_id=2)])
+        await db.commit()
+        return (
+            await async_crud.get_ticket_by_game_id(db, 1),
+            await async_crud.get_ticket_by_game_id(db, 2),
+            await async_crud.get_tickets(db, skip=0, limit=10),
+        )
+
+    inactive, active, tickets = run_with_async_db(db_url, test)
+
+    assert inactive is None
+    assert active.id == 2
+    assert [ticket.id for ticket in tickets] == [1, 2]
+
+
+def test_validate_ticket(db_url):
+    async def test(db):
+        db.add_all([ticket_model(id=1), user_ticket_model(id="123456789012")])
+        await db.commit()
+        validated = await async_crud.validate_ticket(db, "123456789012")
+        with pytest.raises(HTTPException) as already_deactivated:
+            await async_crud.validate_ticket(db, "123456789012")
+        with pytest.raises(HTTPException) as not_found:
+            await async_crud.validate_ticket(db, "999999999999")
+        return validated, already_deactivated.value, not_found.value
+
+    validated, already_deactivated, not_found = run_with_async_db(db_url, test)
+
+    assert validated.is_active is False
+    assert isinstance(validated.deactivated_at, datetime)
+    assert already_deactivated.status_code == 400
+    assert not_found.status_code == 404
+
+
+def test_time_windowed_queries(db_url):
+    kickoff = datetime(2023, 10, 1, 20)
+
+    async def test(db):
+        db.add(ticket_model(id=1))
+        db.add_all(
+            user_ticket_model(
+                id=f"{hours:012d}",
+                created_at=kickoff - timedelta(hours=hours),
+                is_active=hours > 1,
+                deactivated_at=None if hours > 1 else kickoff + timedelta(minutes=hours),
+            )
+            for hours in range(5)
+        )
+        await db.commit()
+        return (
+            await async_crud.get_tickets_sold_between(db, kickoff - timedelta(hours=2), kickoff),
+            await async_crud.get_tickets_validated_between(db, kickoff),
+        )
+
+    sold, validated = run_with_async_db(db_url, test)
+
+    assert [ticket.id for ticket in sold] == ["000000000002", "000000000001"]
+    assert [ticket.id for ticket in validated] == ["000000000000", "000000000001"]
@@ -1,10 +1,15 @@
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import sys
 from unittest.mock import MagicMock, patch, AsyncMock
 import pytest
 from fastapi.exceptions import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from db.migrate import migrate
 from models.ticket import Ticket as TicketModel
 from models.userticket import UserTicket as UserTicketModel
 from schemas.ticket import TicketCreate, TicketUpdate
@@ -18,6 +23,7 @@ from crud.crud import (
     get_tickets,
     validate_ticket, update_ticket,
 )
+from tests.crud.helpers import ticket_model, user_ticket_model
 
 # Mock asynchronous callback function
 async def mock_send_message_callback(db, user_ticket_db):
@@ -94,50 +100,18 @@ def test_update_ticket():
     assert result.price == 150.0
     # stock is not saved here
 
-@patch("crud.crud.generate_random_user_ticket_id", return_value='123456789012')
-def test_buy_one_ticket_not_repeated_random_id(generate_random_user_ticket_id_func):
-    mock_db = MagicMock(spec=Session)
-    quantity = 1                                                                    # one ticket
-    mock_db.query.return_value.filter.return_value.first.return_value = None        # not repeated
-
-    user_ticket_data = UserTicketCreate(
-        user_id='12b-12b-12b',
-        ticket_id=99,
-        quantity=quantity,
-        unit_amount=300.0,
-        created_at="2023-10-01T12:00:00",
-        is_active=True,
-        deactivated_at="",
-    )
-
-    asyncio.run(
-        buy_tickets(mock_db, user_ticket_data, mock_send_message_callback)
-    )
-
-    mock_db.add.assert_called_once()
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
-    generate_random_user_ticket_id_func.assert_called_once_with(12)
-    result = mock_db.add.call_args_list[0][0][0]
-
-    assert isinstance(result, UserTicketModel)
-    assert result.id == '123456789012'
-    assert result.user_id == '12b-12b-12b'
-    assert result.ticket_id == 99
-    assert result.unit_amount == 300.0
-    assert result.created_at == "2023-10-01T12:00:00"
-    assert result.is_active is True
-    assert result.deactivated_at == ""
+def bulk_inserted_rows(mock_db):
+    mock_db.execute.assert_called_once()
+    statement, rows = mock_db.execute.call_args[0]
+    assert statement.is_insert
+    assert statement.table.name == "user_tickets"
+    return rows
 
 
-@patch("crud.crud.generate_random_user_ticket_id", side_effect=['111111111111', '123456789012'])
-def test_buy_one_ticket_repeated_random_id_at_first(generate_random_user_ticket_id_func):
+@patch("crud.crud.ticket_id_allocator.allocate", return_value=['1234567890128'])
+def test_buy_one_ticket(allocate_func):
     mock_db = MagicMock(spec=Session)
     quantity = 1                                                                    # one ticket
-    mock_db.query.return_value.filter.return_value.first.side_effect = [
-        UserTicketModel(id='111111111111'), # repeated
-        None                                # not repeated
-    ]
 
     user_ticket_data = UserTicketCreate(
         user_id='12b-12b-12b',
@@ -146,36 +120,39 @@ def test_buy_one_ticket_repeated_random_id_at_first(generate_random_user_ticket_
         unit_amount=300.0,
         created_at="2023-10-01T12:00:00",
         is_active=True,
-        deactivated_at="",
+        deactivated_at=None,
     )
 
     asyncio.run(
         buy_tickets(mock_db, user_ticket_data, mock_send_message_callback)
     )
 
-    mock_db.add.assert_called_once()
+    # The allocator ids never collide, so the database isn't probed
+    allocate_func.assert_called_once_with(mock_db, 1)
+    mock_db.scalars.assert_not_called()
+    mock_db.query.assert_not_called()
     mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once()
-    assert generate_random_user_ticket_id_func.call_count == 2
-    assert generate_random_user_ticket_id_func.call_args_list[0][0][0] == 12
-    assert generate_random_user_ticket_id_func.call_args_list[1][0][0] == 12
+    [result] = bulk_inserted_rows(mock_db)
 
-    result = mock_db.add.call_args_list[0][0][0]
-    assert isinstance(result, UserTicketModel)
-    assert result.id == '123456789012'
-    assert result.user_id == '12b-12b-12b'
-    assert result.ticket_id == 99
-    assert result.unit_amount == 300.0
-    assert result.created_at == "2023-10-01T12:00:00"
-    assert result.is_active is True
-    assert result.deactivated_at == ""
+    assert result == {
+        'id': '1234567890128',
+        'user_id': '12b-12b-12b',
+        'ticket_id': 99,
+        'unit_amount': 300.0,
+        'created_at': datetime(2023, 10, 1, 12),
+        'is_active': True,
+        'deactivated_at': None,
+    }
 
 
-@patch("crud.crud.generate_random_user_ticket_id", side_effect=['123456789012', '003456789012', '000056789012'])
-def test_buy_multiple_tickets_not_repeated_random_id(generate_random_user_ticket_id_func):
+@patch("crud.crud.ticket_id_allocator.allocate", return_value=['1234567890128', '0034567890124', '0000567890125'])
+def test_buy_multiple_tickets(allocate_func):
     mock_db = MagicMock(spec=Session)
     quantity = 3                                                                    # three ticket
-    mock_db.query.return_value.filter.return_value.first.return_value = None        # not repeated
+    mock_send_message_callback2.reset_mock()
+    calls = MagicMock()
+    calls.attach_mock(mock_db.commit, "commit")
+    calls.attach_mock(mock_send_message_callback2, "callback")
 
     user_ticket_data = UserTicketCreate(
         user_id='12b-12b-12b',
@@ -184,59 +161,32 @@ def test_buy_multiple_tickets_not_repeated_random_id(generate_random_user_ticket
         unit_amount=300.0,
         created_at="2023-10-01T12:00:00",
         is_active=True,
-        deactivated_at="",
+        deactivated_at=None,
     )
 
-    asyncio.run(
+    result = asyncio.run(
         buy_tickets(mock_db, user_ticket_data, mock_send_message_callback2)
     )
 
-    assert mock_db.add.call_count == 3
-    assert mock_db.commit.call_count == 3
-    assert mock_db.refresh.call_count == 3
-    assert generate_random_user_ticket_id_func.call_count == 3
-    assert generate_random_user_ticket_id_func.call_args_list[0][0][0] == 12
-    assert generate_random_user_ticket_id_func.call_args_list[1][0][0] == 12
-    assert generate_random_user_ticket_id_func.call_args_list[2][0][0] == 12
-
-    result_1 = mock_db.add.call_args_list[0][0][0]
-    assert isinstance(result_1, UserTicketModel)
-    assert result_1.id == '123456789012'
-    assert result_1.user_id == '12b-12b-12b'
-    assert result_1.ticket_id == 99
-    assert result_1.unit_amount == 300.0
-    assert result_1.created_at == "2023-10-01T12:00:00"
-    assert result_1.is_active is True
-    assert result_1.deactivated_at == ""
-    actual_db, actual_user_ticket = mock_send_message_callback2.call_args_list[0][0]
-    assert mock_db == actual_db
-    assert result_1 == actual_user_ticket
-
-    result_2 = mock_db.add.call_args_list[1][0][0]
-    assert isinstance(result_2, UserTicketModel)
-    assert result_2.id == '003456789012'
-    assert result_2.user_id == '12b-12b-12b'
-    assert result_2.ticket_id == 99
-    assert result_2.unit_amount == 300.0
-    assert result_2.created_at == "2023-10-01T12:00:00"
-    assert result_2.is_active is True
-    assert result_2.deactivated_at == ""
-    actual_db, actual_user_ticket = mock_send_message_callback2.call_args_list[1][0]
-    assert mock_db == actual_db
-    assert result_2 == actual_user_ticket
-
-    result_3 = mock_db.add.call_args_list[2][0][0]
-    assert isinstance(result_3, UserTicketModel)
-    assert result_3.id == '000056789012'
-    assert result_3.user_id == '12b-12b-12b'
-    assert result_3.ticket_id == 99
-    assert result_3.unit_amount == 300.0
-    assert result_3.created_at == "2023-10-01T12:00:00"
-    assert result_3.is_active is True
-    assert result_3.deactivated_at == ""
-    actual_db, actual_user_ticket = mock_send_message_callback2.call_args_list[2][0]
+    # One bulk insert and one commit for the whole order
+    allocate_func.assert_called_once_with(mock_db, 3)
+    mock_db.commit.assert_called_once()
+    mock_db.add.assert_not_called()
+    mock_db.refresh.assert_not_called()
+
+    rows = bulk_inserted_rows(mock_db)
+    assert [row['id'] for row in rows] == ['1234567890128', '0034567890124', '0000567890125']
+    assert all(row['user_id'] == '12b-12b-12b' and row['ticket_id'] == 99 for row in rows)
+
+    # The order's email is only sent once it is committed
+    assert [call[0] for call in calls.mock_calls] == ["commit", "callback"]
+    actual_db, actual_user_tickets = mock_send_message_callback2.call_args[0]
     assert mock_db == actual_db
-    assert result_3 == actual_user_ticket
+    assert actual_user_tickets is result
+    assert all(isinstance(user_ticket, UserTicketModel) for user_ticket in result)
+    assert [user_ticket.id for user_ticket in result] == ['1234567890128', '0034567890124', '0000567890125']
+    assert result[0].created_at == datetime(2023, 10, 1, 12)
+    assert result[0].is_active is True
 
 
 def test_get_tickets_by_user_id():
@@ -350,63 +300,94 @@ def test_get_tickets():
     assert result[1].id == 100
 
 
-def test_validate_ticket_success():
-    """Teste para validar um ticket com sucesso."""
-    mock_db = MagicMock(spec=Session)
+@pytest.fixture
+def engine(tmp_path):
+    # Busy writers wait for the lock instead of failing, as they would on MySQL
+    engine = create_engine(f"sqlite:///{tmp_path / 'validation.db'}", connect_args={"timeout": 30})
+    migrate(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all([
+            ticket_model(id=99),
+            user_ticket_model(id="123456789012", ticket_id=99),
+            user_ticket_model(id="222222222222", ticket_id=99, is_active=False, deactivated_at=datetime(2023, 10, 5, 12)),
+        ])
+        db.commit()
+    yield engine
+    engine.dispose()
 
-    mock_ticket = UserTicketModel(
-        id='123456789012',
-        user_id='12b-12b-12b',
-        ticket_id=99,
-        unit_amount=300.0,
-        created_at="2023-10-01T12:00:00",
-        is_active=True,
-        deactivated_at=None,
-    )
 
-    mock_db.query().filter().first.return_value = mock_ticket
-
-    result = validate_ticket(mock_db, ticket_id='1')
+def test_validate_ticket_success(engine):
+    """Teste para validar um ticket com sucesso."""
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
 
-    mock_db.commit.assert_called_once()
-    mock_db.refresh.assert_called_once_with(mock_ticket)
+    with sessionmaker(bind=engine)() as db:
+        result = validate_ticket(db, ticket_id="123456789012")
 
     assert isinstance(result, UserTicketModel)
     assert result.is_active is False
-    assert result.deactivated_at is not None
+    assert isinstance(result.deactivated_at, datetime)
+    assert result.user_id == "12b-12b-12b"
+    # One conditional UPDATE returning the row, nothing read before or after
+    assert len(statements) == 1
+    assert statements[0].lstrip().startswith("UPDATE user_tickets")
+    with sessionmaker(bind=engine)() as db:
+        assert db.get(UserTicketModel, "123456789012").is_active is False
 
 
-def test_validate_ticket_not_found():
+def test_validate_ticket_not_found(engine):
     """Teste para tentar validar um ticket inexistente."""
-    mock_db = MagicMock(spec=Session)
-
-    mock_db.query().filter().first.return_value = None
-
-    with pytest.raises(HTTPException) as exc_info:
-        validate_ticket(mock_db, ticket_id='99')
+    with sessionmaker(bind=engine)() as db, pytest.raises(HTTPException) as exc_info:
+        validate_ticket(db, ticket_id="999999999999")
 
     assert exc_info.value.status_code == 404
-    assert "Ticket with id 99 not found." in exc_info.value.detail
+    assert "Ticket with id 999999999999 not found." in exc_info.value.detail
 
 
-def test_validate_ticket_already_deactivated():
+def test_validate_ticket_already_deactivated(engine):
     """Teste para tentar validar um ticket já desativado."""
-    mock_db = MagicMock(spec=Session)
+    with sessionmaker(bind=engine)() as db, pytest.raises(HTTPException) as exc_info:
+        validate_ticket(db, ticket_id="222222222222")
 
-    mock_ticket = UserTicketModel(
-        id='123456789012',
-        user_id='12b-12b-12b',
-        ticket_id=100,
-        unit_amount=150.0,
-        created_at="2023-10-02T12:00:00",
-        is_active=False,
-        deactivated_at="2023-10-05T12:00:00",
-    )
+    assert exc_info.value.status_code == 400
+    assert "Ticket with id 222222222222 is already deactivated." in exc_info.value.detail
+    with sessionmaker(bind=engine)() as db:
+        assert db.get(UserTicketModel, "222222222222").deactivated_at == datetime(2023, 10, 5, 12)
 
-    mock_db.query().filter().first.return_value = mock_ticket
 
-    with pytest.raises(HTTPException) as exc_info:
-        validate_ticket(mock_db, ticket_id='2')
+def test_validate_ticket_without_returning(engine):
+    """MySQL has no UPDATE ... RETURNING, the row is read back after the UPDATE."""
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
 
+    with patch.object(engine.dialect, "update_returning", False), sessionmaker(bind=engine)() as db:
+        result = validate_ticket(db, ticket_id="123456789012")
+        validated = [statement.split()[0] for statement in statements]
+        with pytest.raises(HTTPException) as exc_info:
+            validate_ticket(db, ticket_id="123456789012")
+
+    assert result.is_active is False
+    assert result.user_id == "12b-12b-12b"
+    # The conditional UPDATE and the read back of the row it matched, nothing read before it
+    assert validated == ["UPDATE", "SELECT"]
     assert exc_info.value.status_code == 400
-    assert "Ticket with id 2 is already deactivated." in exc_info.value.detail
+
+
+def test_concurrent_validations_of_a_ticket_succeed_once(engine):
+    """Two turnstiles scanning the same ticket can't both let it in."""
+    barrier = threading.Barrier(100)
+
+    def scan():
+        with sessionmaker(bind=engine)() as db:
+            barrier.wait()
+            try:
+                validate_ticket(db, ticket_id="123456789012")
+                return 200
+            except HTTPException as e:
+                return e.status_code
+
+    with ThreadPoolExecutor(max_workers=100) as executor:
+        results = list(executor.map(lambda _: scan(), range(100)))
+
+    assert results.count(200) == 1
+    assert results.count(400) == 99
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from crud import crud
+from db.migrate import migrate
+from schemas.userticket import UserTicketCreate
+from tests.crud.helpers import ticket_model, user_ticket_model
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    migrate(engine)
+    with sessionmaker(bind=engine)() as db:
+        for game_id in range(1, 51):
+            db.add(ticket_model(id=game_id, game_id=game_id, active=game_id % 2 == 0))
+        db.add_all(
+            user_ticket_model(
+                id=f"{i:012d}",
+                user_id=f"user_{i % 20}",
+                ticket_id=i % 50 + 1,
+                created_at=datetime(2023, 10, 1) + timedelta(minutes=i),
+                is_active=i % 10 != 0,
+                deactivated_at=datetime(2023, 10, 2) + timedelta(minutes=i) if i % 10 == 0 else None,
+            )
+            for i in range(500)
+        )
+        db.commit()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    engine.dispose()
+
+
+def query_plans(engine, query) -> list[str]:
+    """
+    Run a crud query and explain every SELECT and UPDATE statement it sent.
+
+    :return: Details of the query plans
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with sessionmaker(bind=engine)() as db:
+            query(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert statements
+    with engine.connect() as connection:
+        return [
+            row.detail
+            for statement, parameters in statements
+            for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        ]
+
+
+def noop_callback(db, ticket):
+    async def callback():
+        pass
+
+    return callback()
+
+
+@pytest.mark.parametrize(
+    "name, query, index",
+    [
+        ("get_tickets_by_user_id", lambda db: crud.get_tickets_by_user_id(db, "user_3"), "ix_user_tickets_user_id"),
+        ("get_ticket_by_game_id", lambda db: crud.get_ticket_by_game_id(db, 4), "ix_tickets_game_id_active"),
+        ("get_ticket_by_id", lambda db: crud.get_ticket_by_id(db, 4), "PRIMARY KEY"),
+        (
+            "get_tickets_sold_between",
+            lambda db: crud.get_tickets_sold_between(db, datetime(2023, 10, 1, 2), datetime(2023, 10, 1, 3)),
+            "ix_user_tickets_created_at",
+        ),
+        (
+            "get_tickets_validated_between",
+            lambda db: crud.get_tickets_validated_between(db, datetime(2023, 10, 2, 4)),
+            "ix_user_tickets_deactivated_at",
+        ),
+        ("validate_ticket", lambda db: crud.validate_ticket(db, "000000000007"), "INDEX"),
+        (
+            "buy_tickets",
+            lambda db: asyncio.run(
+                crud.buy_tickets(
+                    db,
+                    UserTicketCreate(
+                        user_id="user_1", ticket_id=1, unit_amount=150.0, created_at="2023-10-01", quantity=2
+                    ),
+                    noop_callback,
+                )
+            ),
+            "INDEX",
+        ),
+    ],
+)
+def test_crud_queries_use_an_index(engine, name, query, index):
+    plans = query_plans(engine, query)
+
+    assert all(plan.startswith("SEARCH") for plan in plans), plans
+    assert any(index in plan for plan in plans), plans
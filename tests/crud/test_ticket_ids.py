@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from crud.ticket_ids import TicketIdAllocator, check_ticket_id_key, is_valid_ticket_id, luhn_check_digit
+from db.migrate import migrate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ids.db'}", connect_args={"timeout": 30})
+    migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_encoded_ids_are_unique_and_self_checking():
+    allocator = TicketIdAllocator(b"key")
+
+    ids = [allocator.encode(value) for value in range(10000)]
+
+    assert len(set(ids)) == len(ids)
+    assert all(len(ticket_id) == 13 and is_valid_ticket_id(ticket_id) for ticket_id in ids)
+    # Consecutive sequence values don't give consecutive ids
+    assert sorted(ids) != ids
+
+
+def test_permutation_depends_on_the_key():
+    assert TicketIdAllocator(b"key").encode(1) != TicketIdAllocator(b"other key").encode(1)
+
+
+def test_check_digit_catches_single_digit_errors():
+    ticket_id = TicketIdAllocator(b"key").encode(42)
+
+    for position in range(len(ticket_id)):
+        for digit in "0123456789":
+            if digit != ticket_id[position]:
+                mistyped = ticket_id[:position] + digit + ticket_id[position + 1:]
+                assert not is_valid_ticket_id(mistyped)
+
+
+@pytest.mark.parametrize(
+    "ticket_id, valid",
+    [
+        ("7992739871" + luhn_check_digit("7992739871"), False),  # too short
+        ("123456789012" + luhn_check_digit("123456789012"), True),
+        ("123456789012", True),  # legacy id
+        ("12345678901", False),
+        ("12345678901a", False),
+        ("１２３４５６７８９０１２", False),  # non ASCII digits
+        ("", False),
+    ],
+)
+def test_is_valid_ticket_id(ticket_id, valid):
+    assert is_valid_ticket_id(ticket_id) is valid
+
+
+@pytest.mark.parametrize("environment", ["production", "staging", ""])
+def test_missing_key_fails_outside_development_and_test(environment):
+    with pytest.raises(ValueError, match="TICKET_ID_KEY is not set"):
+        check_ticket_id_key("", environment)
+
+
+@pytest.mark.parametrize("key, environment", [("secret", "production"), ("", "development"), ("", "test")])
+def test_key_is_optional_in_development_and_test(key, environment):
+    check_ticket_id_key(key, environment)
+
+
+def test_luhn_check_digit():
+    assert luhn_check_digit("7992739871") == "3"
+
+
+def test_workers_never_allocate_the_same_id(engine):
+    # Each worker has its own allocator, sharing the database sequence
+    allocators = [TicketIdAllocator(b"key", block_size=7) for _ in range(4)]
+    make_session = sessionmaker(bind=engine)
+    allocated = []
+
+    def worker(allocator):
+        with make_session() as db:
+            for quantity in [1, 5, 10, 3]:
+                allocated.extend(allocator.allocate(db, quantity))
+
+    threads = [threading.Thread(target=worker, args=(allocator,)) for allocator in allocators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(allocated) == 4 * 19
+    assert len(set(allocated)) == len(allocated)
@@ -0,0 +1,98 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from db.async_database import get_async_db
+from db.database import get_db
+from db.middleware import DBSessionMiddleware
+
+
+def create_app(session_factory, async_session_factory):
+    app = FastAPI()
+    app.add_middleware(
+        DBSessionMiddleware,
+        session_factory=session_factory,
+        async_session_factory=async_session_factory,
+    )
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    def get_same_db(db=Depends(get_db)):
+        return db
+
+    @app.get("/sync")
+    def sync_route(db=Depends(get_db), other=Depends(get_same_db)):
+        return {"shared": db is other}
+
+    @app.get("/async")
+    async def async_route(db=Depends(get_async_db)):
+        return {"session": type(db).__name__}
+
+    return app
+
+
+def test_health_never_opens_a_session():
+    session_factory = MagicMock()
+    async_session_factory = MagicMock()
+    client = TestClient(create_app(session_factory, async_session_factory))
+
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    session_factory.assert_not_called()
+    async_session_factory.assert_not_called()
+
+
+def test_sync_session_is_opened_once_and_closed():
+    session_factory = MagicMock()
+    async_session_factory = MagicMock()
+    client = TestClient(create_app(session_factory, async_session_factory))
+
+    response = client.get("/sync")
+
+    assert response.json() == {"shared": True}
+    session_factory.assert_called_once()
+    session_factory.return_value.close.assert_called_once()
+    async_session_factory.assert_not_called()
+
+
+def test_async_session_is_opened_lazily_and_closed():
+    session_factory = MagicMock()
+    async_session = AsyncMock()
+    async_session_factory = MagicMock(return_value=async_session)
+    client = TestClient(create_app(session_factory, async_session_factory))
+
+    client.get("/async")
+
+    async_session_factory.assert_called_once()
+    async_session.close.assert_awaited_once()
+    session_factory.assert_not_called()
+
+
+def test_session_is_closed_when_the_route_fails():
+    session_factory = MagicMock()
+    app = create_app(session_factory, MagicMock())
+
+    @app.get("/fail")
+    def fail(db=Depends(get_db)):
+        raise RuntimeError("boom")
+
+    client = TestClient(app, raise_server_exceptions=False)
+
+    assert client.get("/fail").status_code == 500
+    session_factory.return_value.close.assert_called_once()
+
+
+def test_non_http_scopes_pass_through():
+    inner = AsyncMock()
+    middleware = DBSessionMiddleware(inner, session_factory=MagicMock(), async_session_factory=MagicMock())
+    scope = {"type": "lifespan"}
+
+    asyncio.run(middleware(scope, None, None))
+
+    inner.assert_awaited_once_with(scope, None, None)
+    assert "state" not in scope
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from db.database import Base
+from db.migrate import Migration, load_migrations, migrate, schema_migrations
+from models.userticket import UserTicket as UserTicketModel
+
+import models.ticket  # noqa: F401
+import models.userticket  # noqa: F401
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def index_columns(engine) -> dict:
+    inspector = inspect(engine)
+    return {
+        index["name"]: (table, tuple(index["column_names"]))
+        for table in ["tickets", "user_tickets"]
+        for index in inspector.get_indexes(table)
+    }
+
+
+def test_migrations_are_ordered():
+    versions = [migration.version for migration in load_migrations()]
+
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_migrations_are_applied_once(engine):
+    first_run = migrate(engine)
+    second_run = migrate(engine)
+
+    assert [migration.version for migration in first_run] == [migration.version for migration in load_migrations()]
+    assert second_run == []
+    with engine.connect() as connection:
+        assert list(connection.scalars(select(schema_migrations.c.version))) == [
+            migration.version for migration in first_run
+        ]
+
+
+def test_migrated_schema_has_the_model_indexes(engine):
+    migrate(engine)
+
+    expected = {
+        index.name: (table.name, tuple(column.name for column in index.columns))
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+    }
+    assert expected.items() <= index_columns(engine).items()
+    assert index_columns(engine)["ix_tickets_game_id_active"] == ("tickets", ("game_id", "active"))
+
+
+def test_existing_tables_are_adopted(engine):
+    # Database created by create_tables before migrations existed
+    initial_schema = load_migrations()[0]
+    with engine.begin() as connection:
+        initial_schema.upgrade(connection)
+
+    migrate(engine)
+
+    assert "ix_user_tickets_user_id" in index_columns(engine)
+
+
+def test_failed_migration_is_not_recorded(engine):
+    def fail(connection):
+        raise RuntimeError("boom")
+
+    migrations = load_migrations() + [Migration(99, "broken", fail)]
+
+    with pytest.raises(RuntimeError):
+        migrate(engine, migrations)
+
+    with engine.connect() as connection:
+        assert 99 not in set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def test_user_ticket_timestamps_are_converted(engine):
+    migrate(engine, [migration for migration in load_migrations() if migration.version < 3])
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO tickets VALUES (1, 1, 'Finals', NULL, 1, 150.0, 'prod', 'price', 'url')"))
+        connection.execute(
+            text("INSERT INTO user_tickets VALUES (:id, 'user', 1, 150.0, :created_at, :is_active, :deactivated_at)"),
+            [
+                {"id": "1", "created_at": "2023-10-01T12:00:00", "is_active": True, "deactivated_at": None},
+                {"id": "2", "created_at": "2023-10-01 12:00:00.123456", "is_active": False, "deactivated_at": "2023-10-05 20:30:00.500000"},
+                {"id": "3", "created_at": "2023-10-01T12:00:00Z", "is_active": False, "deactivated_at": "2023-10-05T22:30:00+02:00"},
+                # Fractional seconds of any length, as JavaScript clients send 3
+                {"id": "4", "created_at": "2023-10-01T14:00:00.12+02:00", "is_active": False, "deactivated_at": "2023-10-05T20:30:00.5Z"},
+            ],
+        )
+
+    migrate(engine)
+
+    with Session(engine) as db:
+        first, second, third, fourth = db.scalars(select(UserTicketModel).order_by(UserTicketModel.id))
+    assert first.created_at == datetime(2023, 10, 1, 12)
+    assert first.deactivated_at is None
+    assert second.created_at == datetime(2023, 10, 1, 12, 0, 0, 123456)
+    assert second.deactivated_at == datetime(2023, 10, 5, 20, 30, 0, 500000)
+    # Converted to UTC
+    assert third.created_at == datetime(2023, 10, 1, 12)
+    assert third.deactivated_at == datetime(2023, 10, 5, 20, 30)
+    assert fourth.created_at == datetime(2023, 10, 1, 12, 0, 0, 120000)
+    assert fourth.deactivated_at == datetime(2023, 10, 5, 20, 30, 0, 500000)
+
+
+def test_invalid_timestamp_aborts_the_conversion(engine):
+    migrate(engine, [migration for migration in load_migrations() if migration.version < 3])
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO tickets VALUES (1, 1, 'Finals', NULL, 1, 150.0, 'prod', 'price', 'url')"))
+        connection.execute(text("INSERT INTO user_tickets VALUES ('1', 'user', 1, 150.0, 'yesterday', 1, NULL)"))
+
+    with pytest.raises(ValueError, match="invalid timestamp"):
+        migrate(engine)
+
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT created_at FROM user_tickets")) == "yesterday"
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import exc, text
+
+from db.database import InstrumentedQueuePool, create_pooled_engine
+
+
+@pytest.fixture
+def engine_factory(tmp_path):
+    engines = []
+
+    def factory(**pool_parameters):
+        engine = create_pooled_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            connect_args={"check_same_thread": False},
+            **pool_parameters,
+        )
+        engines.append(engine)
+        return engine
+
+    yield factory
+    for engine in engines:
+        engine.dispose()
+
+
+def run_concurrently(engine, workers: int, hold: float):
+    """
+    Check out a connection from each worker thread and hold it for a while.
+
+    :return: Number of workers that timed out and maximum connections checked out at once.
+    """
+    timeouts = []
+    checked_out = []
+    barrier = threading.Barrier(workers)
+
+    def worker():
+        barrier.wait()
+        try:
+            with engine.connect() as connection:
+                checked_out.append(engine.pool.checkedout())
+                connection.execute(text("SELECT 1"))
+                time.sleep(hold)
+        except exc.TimeoutError:
+            timeouts.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(timeouts), max(checked_out)
+
+
+def test_engine_uses_instrumented_pool(engine_factory):
+    engine = engine_factory(pool_size=3, max_overflow=2, pool_recycle=60, pool_pre_ping=True)
+
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 2
+    assert engine.pool._recycle == 60
+    assert engine.pool._pre_ping is True
+
+
+def test_concurrency_above_pool_size_waits_for_connections(engine_factory):
+    engine = engine_factory(pool_size=2, max_overflow=1, pool_timeout=5)
+
+    timeouts, max_checked_out = run_concurrently(engine, workers=9, hold=0.05)
+
+    stats = engine.pool.stats()
+    assert timeouts == 0
+    assert max_checked_out <= 3
+    assert stats["checkouts"] == 9
+    assert stats["timeouts"] == 0
+    # Six workers had to wait for another one to give its connection back
+    assert stats["wait_time_max"] >= 0.05
+    assert stats["checked_out"] == 0
+
+
+def test_checkouts_time_out_when_pool_is_exhausted(engine_factory):
+    engine = engine_factory(pool_size=2, max_overflow=1, pool_timeout=0.1)
+
+    timeouts, max_checked_out = run_concurrently(engine, workers=8, hold=0.5)
+
+    stats = engine.pool.stats()
+    assert timeouts == 5
+    assert max_checked_out == 3
+    assert stats["timeouts"] == 5
+    assert stats["checkouts"] == 8
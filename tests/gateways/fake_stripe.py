@@ -0,0 +1,73 @@
+import asyncio
+from typing import List
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class FakeStripe:
+    """
+    Local ASGI app answering the Stripe endpoints used by the gateway.
+
+    Every request waits `latency` seconds, standing in for the round trip to
+    Stripe. Requests and their overlap are recorded.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests: List[tuple] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_products = False
+        self.app = Starlette(
+            routes=[
+                Route("/v1/files", self.create_file, methods=["POST"]),
+                Route("/v1/products", self.create_product, methods=["POST"]),
+                Route("/v1/products/{prod_id}", self.update_product, methods=["POST"]),
+            ]
+        )
+
+    async def handle(self, request: Request, name: str):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            form = await request.form()
+            fields = {key: value for key, value in form.items()}
+            if "file" in fields:
+                fields["file"] = await fields["file"].read()
+            self.requests.append((name, fields))
+            return fields
+        finally:
+            self.in_flight -= 1
+
+    async def create_file(self, request: Request):
+        fields = await self.handle(request, "files.create")
+        if fields.get("purpose") != "product_image" or not fields.get("file"):
+            return JSONResponse({"error": {"type": "invalid_request_error", "message": "Missing file"}}, 400)
+        number = len(self.requests)
+        links = []
+        if str(fields.get("file_link_data[create]")).lower() == "true":
+            links = [{"id": f"link_{number}", "object": "file_link", "url": f"https://files.example.com/links/{number}"}]
+        return JSONResponse(
+            {"id": f"file_{number}", "object": "file", "links": {"object": "list", "data": links, "has_more": False}}
+        )
+
+    async def create_product(self, request: Request):
+        fields = await self.handle(request, "products.create")
+        if self.fail_products:
+            return JSONResponse({"error": {"type": "api_error", "message": "Stripe is down"}}, 500)
+        number = len(self.requests)
+        return JSONResponse(
+            {"id": f"prod_{number}", "object": "product", "name": fields["name"], "default_price": f"price_{number}"}
+        )
+
+    async def update_product(self, request: Request):
+        fields = await self.handle(request, "products.update")
+        return JSONResponse({"id": request.path_params["prod_id"], "object": "product", **fields})
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return httpx.ASGITransport(app=self.app)
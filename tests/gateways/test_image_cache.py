@@ -0,0 +1,86 @@
+import asyncio
+import io
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from crud import async_crud
+from db.migrate import migrate
+from gateways.image_cache import CachedImage, ImageCache
+from gateways.stripe_gateway import StripeGateway
+from tests.gateways.fake_stripe import FakeStripe
+from tests.routers.helpers import png_bytes
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    path = tmp_path / "images.db"
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(async_engine, expire_on_commit=False)
+    asyncio.run(async_engine.dispose())
+
+
+def create_products(fake: FakeStripe, image_cache: ImageCache, images: list[bytes]):
+    async def run():
+        stripe_gateway = StripeGateway(
+            "sk_test_123", api_base="http://stripe.test", transport=fake.transport(), image_cache=image_cache
+        )
+        try:
+            return [
+                await stripe_gateway.create_product(f"Ticket {n}", "Home game", True, 1500, io.BytesIO(image), "image.png")
+                for n, image in enumerate(images)
+            ]
+        finally:
+            await stripe_gateway.close()
+
+    return asyncio.run(run())
+
+
+def test_identical_image_is_not_uploaded_again(session_factory):
+    fake = FakeStripe()
+    image_cache = ImageCache(session_factory)
+
+    first, second = create_products(fake, image_cache, [png_bytes(600, 400), png_bytes(600, 400)])
+
+    # The second product makes no file call and reuses the link of the first image
+    assert [name for name, _ in fake.requests] == ["files.create", "products.create", "products.create"]
+    assert second.image_url == first.image_url
+    assert fake.requests[2][1]["images[0]"] == first.image_url
+    assert image_cache.stats()["hits"] == 1
+    assert image_cache.stats()["misses"] == 1
+
+
+def test_different_images_are_uploaded(session_factory):
+    fake = FakeStripe()
+
+    first, second = create_products(fake, ImageCache(session_factory), [png_bytes(600, 400), png_bytes(400, 600)])
+
+    assert [name for name, _ in fake.requests].count("files.create") == 2
+    assert second.image_url != first.image_url
+
+
+def test_uploaded_images_are_shared_through_the_database(session_factory):
+    fake = FakeStripe()
+    create_products(fake, ImageCache(session_factory), [png_bytes(600, 400)])
+
+    # Another worker, whose memory doesn't hold the image
+    image_cache = ImageCache(session_factory)
+    create_products(fake, image_cache, [png_bytes(600, 400)])
+
+    assert [name for name, _ in fake.requests].count("files.create") == 1
+    assert image_cache.stats()["hits"] == 1
+    assert image_cache.stats()["memory_hits"] == 0
+
+
+def test_image_recorded_concurrently_keeps_the_first_file(session_factory):
+    async def run():
+        async with session_factory() as db:
+            await async_crud.add_stripe_image(db, "a" * 64, "file_1", "https://files.example.com/links/1")
+            await async_crud.add_stripe_image(db, "a" * 64, "file_2", "https://files.example.com/links/2")
+        return await ImageCache(session_factory).get("a" * 64)
+
+    assert asyncio.run(run()) == CachedImage("file_1", "https://files.example.com/links/1")
@@ -0,0 +1,183 @@
+import asyncio
+import io
+import time
+
+import httpx
+import pytest
+import stripe
+
+from gateways.stripe_gateway import StripeGateway, StripeProduct
+from tests.gateways.fake_stripe import FakeStripe
+from tests.routers.helpers import png_bytes
+
+
+def gateway(fake: FakeStripe, **kwargs) -> StripeGateway:
+    return StripeGateway("sk_test_123", api_base="http://stripe.test", transport=fake.transport(), **kwargs)
+
+
+def create(gateway: StripeGateway, name: str = "Championship Finals"):
+    return gateway.create_product(name, "Final match", True, 15000, io.BytesIO(png_bytes(600, 400)), "image.png")
+
+
+def test_product_is_created_in_two_round_trips():
+    fake = FakeStripe()
+
+    async def run():
+        stripe_gateway = gateway(fake)
+        try:
+            return await create(stripe_gateway), stripe_gateway.stats()
+        finally:
+            await stripe_gateway.close()
+
+    product, stats = asyncio.run(run())
+
+    # The image link is created with the file, not by a third request
+    assert [name for name, _ in fake.requests] == ["files.create", "products.create"]
+    upload, product_fields = fake.requests[0][1], fake.requests[1][1]
+    assert upload["purpose"] == "product_image"
+    assert upload["file"] == png_bytes(600, 400)
+    assert product_fields["images[0]"] == "https://files.example.com/links/1"
+    assert product_fields["default_price_data[currency]"] == "eur"
+    assert product_fields["default_price_data[unit_amount]"] == "15000"
+    assert product == StripeProduct("prod_2", "price_2", "https://files.example.com/links/1")
+    assert stats["products_created"] == 1
+    assert stats["requests"] == 2
+
+
+def test_products_are_created_concurrently():
+    latency = 0.05
+    fake = FakeStripe(latency=latency)
+
+    async def run():
+        stripe_gateway = gateway(fake, max_connections=10)
+        try:
+            started_at = time.monotonic()
+            products = await asyncio.gather(*(create(stripe_gateway, f"Ticket {n}") for n in range(10)))
+            return products, time.monotonic() - started_at
+        finally:
+            await stripe_gateway.close()
+
+    products, elapsed = asyncio.run(run())
+
+    assert len({product.prod_id for product in products}) == 10
+    # The event loop isn't blocked by a request, so the creations overlap
+    assert fake.max_in_flight > 1
+    assert elapsed < 10 * 2 * latency
+
+
+def test_product_is_updated():
+    fake = FakeStripe()
+
+    async def run():
+        stripe_gateway = gateway(fake)
+        try:
+            await stripe_gateway.update_product("prod_123", name="New Name", description="Updated", active=False)
+        finally:
+            await stripe_gateway.close()
+
+    asyncio.run(run())
+
+    assert fake.requests == [("products.update", {"name": "New Name", "description": "Updated", "active": "False"})]
+
+
+def test_only_the_given_product_fields_are_updated():
+    fake = FakeStripe()
+
+    async def run():
+        stripe_gateway = gateway(fake)
+        try:
+            await stripe_gateway.update_product("prod_123", active=False)
+        finally:
+            await stripe_gateway.close()
+
+    asyncio.run(run())
+
+    assert fake.requests == [("products.update", {"active": "False"})]
+
+
+def test_stripe_errors_are_raised():
+    fake = FakeStripe()
+    fake.fail_products = True
+
+    async def run():
+        stripe_gateway = gateway(fake, max_network_retries=0)
+        try:
+            with pytest.raises(stripe.APIError):
+                await create(stripe_gateway)
+            return stripe_gateway.stats()
+        finally:
+            await stripe_gateway.close()
+
+    stats = asyncio.run(run())
+
+    assert stats["failures"] == 1
+    assert stats["products_created"] == 0
+
+
+def test_network_errors_are_raised_as_connection_errors():
+    def refuse(request: httpx.Request):
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    async def run():
+        stripe_gateway = StripeGateway(
+            "sk_test_123", api_base="http://stripe.test", max_network_retries=0, transport=httpx.MockTransport(refuse)
+        )
+        try:
+            with pytest.raises(stripe.APIConnectionError):
+                await create(stripe_gateway)
+        finally:
+            await stripe_gateway.close()
+
+    asyncio.run(run())
+
+
+def test_image_is_uploaded_again_after_a_network_error():
+    fake = FakeStripe()
+    transport = fake.transport()
+    uploads = []
+
+    async def fail_first_upload(request: httpx.Request):
+        uploads.append(request.headers)
+        if len(uploads) == 1:
+            raise httpx.ConnectError("Connection reset", request=request)
+        return await transport.handle_async_request(request)
+
+    async def run():
+        stripe_gateway = StripeGateway(
+            "sk_test_123", api_base="http://stripe.test", transport=httpx.MockTransport(fail_first_upload)
+        )
+        try:
+            return await stripe_gateway.upload_image(io.BytesIO(png_bytes(600, 400)), "image.png")
+        finally:
+            await stripe_gateway.close()
+
+    image_url = asyncio.run(run())
+
+    assert image_url == "https://files.example.com/links/1"
+    assert fake.requests[0][1]["file"] == png_bytes(600, 400)
+    # Sent with its length rather than chunked, under one idempotency key
+    assert "transfer-encoding" not in uploads[1]
+    assert uploads[0]["idempotency-key"] == uploads[1]["idempotency-key"]
+    assert uploads[1]["authorization"] == "Bearer sk_test_123"
+
+
+@pytest.mark.parametrize(
+    "status, error",
+    [(400, stripe.InvalidRequestError), (401, stripe.AuthenticationError), (429, stripe.RateLimitError), (500, stripe.APIError)],
+)
+def test_upload_errors_are_raised_as_stripe_errors(status, error):
+    def reject(request: httpx.Request):
+        return httpx.Response(status, json={"error": {"type": "invalid_request_error", "message": "Rejected"}})
+
+    async def run():
+        stripe_gateway = StripeGateway(
+            "sk_test_123", api_base="http://stripe.test", max_network_retries=0, transport=httpx.MockTransport(reject)
+        )
+        try:
+            with pytest.raises(error, match="Rejected") as exc_info:
+                await stripe_gateway.upload_image(io.BytesIO(png_bytes()), "image.png")
+            return exc_info.value
+        finally:
+            await stripe_gateway.close()
+
+    assert asyncio.run(run()).http_status == status
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import stripe
+
+from gateways.stripe_sync import StripeSync, product_changes
+
+
+def test_only_changed_product_fields_are_synced():
+    ticket = SimpleNamespace(name="Finals", description="Final match", active=True)
+
+    assert product_changes(ticket, {"name": "Finals", "active": False, "stock": 10}) == {"active": False}
+    assert product_changes(ticket, {"stock": 10}) == {}
+
+
+def test_successive_changes_are_merged_into_one_update():
+    update_product = AsyncMock()
+    sync = StripeSync(update_product, delay=0.01)
+
+    async def run():
+        sync.schedule("prod_1", {"name": "Finals"})
+        sync.schedule("prod_1", {"description": "Final match"})
+        sync.schedule("prod_2", {"active": False})
+        sync.schedule("prod_1", {"name": "Grand Finals"})
+        # Stock-only update
+        sync.schedule("prod_1", {})
+        await sync.stop()
+
+    asyncio.run(run())
+
+    assert sorted(update_product.call_args_list, key=lambda call: call.args) == [
+        (("prod_1",), {"name": "Grand Finals", "description": "Final match"}),
+        (("prod_2",), {"active": False}),
+    ]
+    assert sync.stats() == {"pending": 0, "scheduled": 4, "skipped": 1, "updated": 2, "retried": 0, "failed": 0}
+
+
+def test_failed_updates_are_retried_before_newer_changes():
+    calls = []
+
+    async def update_product(prod_id, **changes):
+        calls.append(changes)
+        if len(calls) <= 2:
+            raise stripe.APIConnectionError("Connection reset")
+
+    sync = StripeSync(update_product, delay=0.01, retry_base_delay=0.01)
+
+    async def run():
+        sync.schedule("prod_1", {"name": "Finals"})
+        await asyncio.sleep(0.02)
+        # Changed while the first update is retried
+        sync.schedule("prod_1", {"name": "Grand Finals"})
+        await sync.stop()
+
+    asyncio.run(run())
+
+    assert calls == [{"name": "Finals"}] * 3 + [{"name": "Grand Finals"}]
+    assert sync.stats()["retried"] == 2
+    assert sync.stats()["updated"] == 2
+
+
+def test_rejected_updates_and_exhausted_retries_are_dropped():
+    update_product = AsyncMock(
+        side_effect=[stripe.InvalidRequestError("No such product", "id")] + [stripe.APIError("Stripe is down")] * 3
+    )
+    sync = StripeSync(update_product, delay=0, max_attempts=3, retry_base_delay=0)
+
+    async def run():
+        sync.schedule("prod_missing", {"name": "Finals"})
+        await sync.stop()
+        sync.schedule("prod_1", {"name": "Finals"})
+        await sync.stop()
+
+    asyncio.run(run())
+
+    assert update_product.call_count == 4
+    assert sync.stats()["failed"] == 2
+    assert sync.stats()["retried"] == 2
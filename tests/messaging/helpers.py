@@ -0,0 +1,112 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+
+class InMemoryMessage:
+    def __init__(
+        self,
+        queue: "InMemoryQueue",
+        body: bytes,
+        timestamp: Optional[datetime] = None,
+        headers: Optional[dict] = None,
+        message_id: Optional[str] = None,
+    ):
+        self.queue = queue
+        self.body = body
+        self.timestamp = timestamp
+        self.headers = headers or {}
+        self.message_id = message_id
+        self.content_type = "application/json"
+
+    async def ack(self):
+        self.queue.settle(self, acked=True)
+
+    async def reject(self, requeue: bool = False):
+        self.queue.settle(self, acked=False, requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False):
+        try:
+            yield
+        except Exception:
+            self.queue.settle(self, acked=False, requeue=requeue)
+            raise
+        self.queue.settle(self, acked=True)
+
+
+class InMemoryQueue:
+    """
+    Stand-in of an aio_pika queue, delivering its messages to a consumer
+    without ever having more than `prefetch` of them unacked.
+    """
+
+    def __init__(self, bodies: List[bytes], prefetch: int = 10, timestamp: Optional[datetime] = None):
+        self.pending = [InMemoryMessage(self, body, timestamp) for body in bodies]
+        self.prefetch = prefetch
+        self.unacked = 0
+        self.max_unacked = 0
+        self.acked: List[bytes] = []
+        self.rejected: List[bytes] = []
+        self.requeued: List[bytes] = []
+        self.settled = asyncio.Event()
+        self.done = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def consume(self, callback: Callable[[InMemoryMessage], Awaitable]) -> str:
+        self.task = asyncio.create_task(self.deliver(callback))
+        return "consumer"
+
+    async def cancel(self, consumer_tag: str):
+        self.task.cancel()
+
+    async def deliver(self, callback: Callable[[InMemoryMessage], Awaitable]):
+        for message in self.pending:
+            while self.unacked >= self.prefetch:
+                self.settled.clear()
+                await self.settled.wait()
+            self.unacked += 1
+            self.max_unacked = max(self.max_unacked, self.unacked)
+            await callback(message)
+
+    def settle(self, message: InMemoryMessage, acked: bool, requeue: bool = False):
+        self.unacked -= 1
+        (self.acked if acked else self.rejected).append(message.body)
+        if requeue:
+            self.requeued.append(message.body)
+        self.settled.set()
+        if len(self.acked) + len(self.rejected) == len(self.pending):
+            self.done.set()
+
+
+class InMemoryExchange:
+    """
+    Stand-in of an aio_pika exchange on a channel with publisher confirms.
+
+    Frames are written one at a time (`write_time` each) and every publish
+    returns `confirm_latency` seconds after its frame was written, so the
+    confirms of concurrent publishes overlap as they do on a real channel.
+    """
+
+    def __init__(self, confirm_latency: float = 0.0, write_time: float = 0.0, fail: Optional[Callable[[bytes], bool]] = None):
+        self.confirm_latency = confirm_latency
+        self.write_time = write_time
+        self.fail = fail
+        self.write_lock = asyncio.Lock()
+        self.published: List[tuple] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def publish(self, message, routing_key: str):
+        async with self.write_lock:
+            await asyncio.sleep(self.write_time)
+            self.published.append((routing_key, message))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.confirm_latency)
+        finally:
+            self.in_flight -= 1
+        if self.fail is not None and self.fail(message.body):
+            raise ConnectionError("message nacked")
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from messaging.batch_consumer import BatchConsumer
+from tests.messaging.helpers import InMemoryQueue
+
+
+def consume(bodies, batch_handler, handler=None, prefetch=100, **parameters):
+    """
+    Consume in-memory messages in batches until they are all acked or rejected.
+
+    :return: Queue and consumer
+    """
+
+    async def no_handler(body):
+        raise AssertionError("Unexpected fallback")
+
+    async def run():
+        queue = InMemoryQueue(bodies, prefetch=prefetch, timestamp=datetime.now(timezone.utc) - timedelta(seconds=1))
+        consumer = BatchConsumer(batch_handler, handler or no_handler, **parameters)
+        await consumer.start(queue)
+        await asyncio.wait_for(queue.done.wait(), timeout=5)
+        await consumer.stop()
+        return queue, consumer
+
+    return asyncio.run(run())
+
+
+def test_full_batches_are_handled_together():
+    batches = []
+
+    async def batch_handler(bodies):
+        batches.append(bodies)
+
+    bodies = [str(i).encode() for i in range(10)]
+    queue, consumer = consume(bodies, batch_handler, max_batch_size=4, max_wait=0.05)
+
+    assert batches == [bodies[0:4], bodies[4:8], bodies[8:10]]
+    assert queue.acked == bodies
+    assert consumer.stats()["batches"] == 3
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    batches = []
+
+    async def batch_handler(bodies):
+        batches.append(bodies)
+
+    # The prefetch count holds back the third message until the first batch is acked
+    queue, consumer = consume([b"1", b"2", b"3"], batch_handler, prefetch=2, max_batch_size=10, max_wait=0.01)
+
+    assert batches == [[b"1", b"2"], [b"3"]]
+    assert queue.acked == [b"1", b"2", b"3"]
+
+
+def test_failed_batch_falls_back_to_single_messages():
+    handled = []
+
+    async def batch_handler(bodies):
+        raise RuntimeError("duplicate")
+
+    async def handler(body):
+        if body == b"bad":
+            raise ValueError("bad message")
+        handled.append(body)
+
+    queue, consumer = consume([b"1", b"bad", b"3"], batch_handler, handler, max_batch_size=3, max_wait=5)
+
+    assert handled == [b"1", b"3"]
+    assert queue.acked == [b"1", b"3"]
+    assert queue.rejected == [b"bad"]
+    stats = consumer.stats()
+    assert stats["batch_failures"] == 1
+    assert stats["processed"] == 2
+    assert stats["failed"] == 1
+    assert stats["lag_max"] >= 1
+
+
+def test_stop_flushes_the_pending_batch():
+    batches = []
+
+    async def batch_handler(bodies):
+        batches.append(bodies)
+
+    async def run():
+        queue = InMemoryQueue([b"1", b"2"])
+        consumer = BatchConsumer(batch_handler, batch_handler, max_batch_size=10, max_wait=60)
+        await consumer.start(queue)
+        await asyncio.sleep(0.01)
+        await consumer.stop()
+        return queue
+
+    queue = asyncio.run(run())
+
+    assert batches == [[b"1", b"2"]]
+    assert queue.acked == [b"1", b"2"]
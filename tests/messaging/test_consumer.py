@@ -0,0 +1,116 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from messaging.consumer import KeyedConsumer
+from tests.messaging.helpers import InMemoryQueue
+
+
+def body(user: str, sequence: int) -> bytes:
+    return f"{user}:{sequence}".encode()
+
+
+def user_key(message_body: bytes) -> str:
+    return message_body.split(b":")[0].decode()
+
+
+def consume(bodies, handler, workers=4, prefetch=10, key=user_key, timestamp=None):
+    """
+    Consume in-memory messages until they are all acked or rejected.
+
+    :return: Queue and consumer
+    """
+
+    async def run():
+        queue = InMemoryQueue(bodies, prefetch=prefetch, timestamp=timestamp)
+        consumer = KeyedConsumer(handler, workers=workers, key=key)
+        await consumer.start(queue)
+        await asyncio.wait_for(queue.done.wait(), timeout=5)
+        await consumer.stop()
+        return queue, consumer
+
+    return asyncio.run(run())
+
+
+def test_messages_are_handled_concurrently_within_prefetch():
+    active = []
+    max_active = []
+
+    async def handler(message_body):
+        active.append(message_body)
+        max_active.append(len(active))
+        await asyncio.sleep(0.05)
+        active.remove(message_body)
+
+    start = time.monotonic()
+    queue, consumer = consume([body(f"user_{i}", 0) for i in range(8)], handler, workers=8, prefetch=4, key=None)
+    elapsed = time.monotonic() - start
+
+    assert len(queue.acked) == 8
+    assert max(max_active) == 4
+    assert queue.max_unacked == 4
+    assert elapsed < 8 * 0.05
+
+
+def test_order_is_preserved_per_key():
+    handled = []
+
+    async def handler(message_body):
+        await asyncio.sleep(0.001 * (hash(message_body) % 5))
+        handled.append(message_body)
+
+    bodies = [body(f"user_{i % 3}", i // 3) for i in range(30)]
+    queue, consumer = consume(bodies, handler, workers=4, prefetch=30)
+
+    for user in ["user_0", "user_1", "user_2"]:
+        assert [b for b in handled if user_key(b) == user] == [b for b in bodies if user_key(b) == user]
+    assert sorted(queue.acked) == sorted(bodies)
+
+
+def test_failed_message_is_rejected_and_worker_keeps_going():
+    async def handler(message_body):
+        if message_body == body("user", 1):
+            raise RuntimeError("boom")
+
+    queue, consumer = consume([body("user", i) for i in range(3)], handler, workers=1)
+
+    assert queue.rejected == [body("user", 1)]
+    assert queue.acked == [body("user", 0), body("user", 2)]
+    assert consumer.stats()["processed"] == 2
+    assert consumer.stats()["failed"] == 1
+
+
+def test_stats_expose_lag_and_processing_time():
+    async def handler(message_body):
+        await asyncio.sleep(0.01)
+
+    published = datetime.now(timezone.utc) - timedelta(seconds=2)
+    queue, consumer = consume([body("user", i) for i in range(3)], handler, timestamp=published)
+
+    stats = consumer.stats()
+    assert stats["received"] == stats["processed"] == 3
+    assert stats["in_flight"] == stats["queued"] == 0
+    assert stats["processing_time_avg"] >= 0.01
+    assert stats["processing_time_max"] >= stats["processing_time_avg"]
+    assert 2 <= stats["lag_max"] < 5
+
+
+def test_stop_lets_workers_finish_their_messages():
+    handled = []
+
+    async def handler(message_body):
+        await asyncio.sleep(0.02)
+        handled.append(message_body)
+
+    async def run():
+        queue = InMemoryQueue([body(f"user_{i}", 0) for i in range(4)], prefetch=4)
+        consumer = KeyedConsumer(handler, workers=2, key=user_key)
+        await consumer.start(queue)
+        await asyncio.sleep(0.005)
+        await consumer.stop()
+        return queue
+
+    queue = asyncio.run(run())
+
+    assert len(handled) == 4
+    assert len(queue.acked) == 4
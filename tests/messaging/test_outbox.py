@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from crud import async_crud
+from db.migrate import migrate
+from messaging.outbox import OutboxRelay
+from models.outboxmessage import OutboxMessage
+
+
+class Broker:
+    """
+    Record published messages, failing the publishes of the given bodies.
+    """
+
+    def __init__(self, failing=()):
+        self.published = []
+        self.failing = set(failing)
+
+    async def publish(self, routing_key: str, body: bytes, message_id: str):
+        await asyncio.sleep(0)
+        if json.loads(body)["n"] in self.failing:
+            raise ConnectionError("publish not confirmed")
+        self.published.append((routing_key, json.loads(body)["n"], message_id))
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    path = tmp_path / "outbox.db"
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(async_engine, expire_on_commit=False)
+    asyncio.run(async_engine.dispose())
+
+
+async def add_messages(session_factory, numbers):
+    async with session_factory() as db:
+        for n in numbers:
+            async_crud.add_outbox_message(db, {"n": n}, "tickets.messages")
+        await db.commit()
+
+
+async def pending(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(OutboxMessage))
+
+
+def test_messages_are_published_in_order_and_deleted(session_factory):
+    broker = Broker()
+    relay = OutboxRelay(session_factory, broker.publish, batch_size=3)
+
+    async def run():
+        await add_messages(session_factory, range(5))
+        counts = [await relay.relay_batch() for _ in range(3)]
+        return counts, await pending(session_factory)
+
+    counts, left = asyncio.run(run())
+
+    assert counts == [3, 2, 0]
+    assert left == 0
+    assert [n for _, n, _ in broker.published] == [0, 1, 2, 3, 4]
+    # The outbox id is the message id, so consumers can drop republished messages
+    assert len({message_id for _, _, message_id in broker.published}) == 5
+    assert relay.stats() == {"batches": 2, "relayed": 5, "failed": 0}
+
+
+def test_messages_after_a_failed_publish_stay_in_the_outbox(session_factory):
+    broker = Broker(failing={2})
+    relay = OutboxRelay(session_factory, broker.publish)
+
+    async def run():
+        await add_messages(session_factory, range(5))
+        with pytest.raises(ConnectionError):
+            await relay.relay_batch()
+        left = await pending(session_factory)
+        broker.failing.clear()
+        await relay.relay_batch()
+        return left
+
+    left = asyncio.run(run())
+
+    # 3 and 4 were confirmed but are published again after 2, so 2 never overtakes them
+    assert left == 3
+    assert [n for _, n, _ in broker.published] == [0, 1, 3, 4, 2, 3, 4]
+    assert relay.failed == 1
+
+
+def test_restarted_relay_drains_the_outbox_and_wakes_on_notify(session_factory):
+    broker = Broker()
+
+    async def run():
+        # Messages committed while no relay was running
+        await add_messages(session_factory, range(3))
+        relay = OutboxRelay(session_factory, broker.publish, poll_interval=60)
+        relay.start()
+        await asyncio.wait_for(wait_published(3), timeout=5)
+        await add_messages(session_factory, [3])
+        relay.notify()
+        await asyncio.wait_for(wait_published(4), timeout=5)
+        await relay.stop()
+        return await pending(session_factory)
+
+    async def wait_published(count):
+        while len(broker.published) < count:
+            await asyncio.sleep(0.01)
+
+    assert asyncio.run(run()) == 0
+    assert [n for _, n, _ in broker.published] == [0, 1, 2, 3]
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from aio_pika import DeliveryMode
+
+from messaging.publisher import Publisher
+from tests.messaging.helpers import InMemoryExchange
+
+
+def make_publisher(exchanges, **kwargs) -> Publisher:
+    exchanges = iter(exchanges)
+
+    async def open_exchange():
+        return next(exchanges)
+
+    return Publisher(open_exchange, **kwargs)
+
+
+def test_messages_are_persistent_and_confirmed():
+    exchange = InMemoryExchange(confirm_latency=0.01)
+
+    async def run():
+        publisher = make_publisher([exchange], channels=1)
+        await publisher.start()
+        await asyncio.gather(*(publisher.publish("EMAILS", f"{i}".encode(), message_id=str(i)) for i in range(20)))
+        await publisher.stop()
+        return publisher
+
+    publisher = asyncio.run(run())
+
+    assert [message.body for _, message in exchange.published] == [f"{i}".encode() for i in range(20)]
+    assert all(message.delivery_mode == DeliveryMode.PERSISTENT for _, message in exchange.published)
+    assert [message.message_id for _, message in exchange.published] == [str(i) for i in range(20)]
+    # The confirms were awaited together, not one round trip each
+    assert exchange.max_in_flight > 1
+    assert publisher.stats()["published"] == 20
+    assert publisher.stats()["batches"] < 20
+
+
+def test_routing_key_keeps_its_order_on_one_channel():
+    exchanges = [InMemoryExchange(confirm_latency=0.001) for _ in range(4)]
+
+    async def run():
+        publisher = make_publisher(exchanges, channels=4)
+        await publisher.start()
+        await asyncio.gather(
+            *(publisher.publish(f"key.{i % 3}", f"{i}".encode()) for i in range(30))
+        )
+        await publisher.stop()
+
+    asyncio.run(run())
+
+    for key in ["key.0", "key.1", "key.2"]:
+        [channel] = [exchange for exchange in exchanges if any(k == key for k, _ in exchange.published)]
+        bodies = [int(message.body) for k, message in channel.published if k == key]
+        assert bodies == sorted(bodies) and len(bodies) == 10
+
+
+def test_full_buffer_applies_backpressure():
+    exchange = InMemoryExchange(confirm_latency=0.05)
+
+    async def run():
+        publisher = make_publisher([exchange], channels=1, buffer_size=2)
+        await publisher.start()
+        first = [await publisher.enqueue("EMAILS", b"1"), await publisher.enqueue("EMAILS", b"2")]
+        # No room until the first two messages are confirmed
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(publisher.enqueue("EMAILS", b"3"), timeout=0.01)
+        buffered = publisher.buffered
+        await asyncio.gather(*first)
+        third = await asyncio.wait_for(publisher.enqueue("EMAILS", b"3"), timeout=1)
+        await third
+        await publisher.stop()
+        return buffered
+
+    assert asyncio.run(run()) == 2
+
+
+def test_nacked_message_fails_its_publish_only():
+    exchange = InMemoryExchange(fail=lambda body: body == b"bad")
+
+    async def run():
+        publisher = make_publisher([exchange], channels=1)
+        await publisher.start()
+        results = await asyncio.gather(
+            publisher.publish("EMAILS", b"good"), publisher.publish("EMAILS", b"bad"), return_exceptions=True
+        )
+        await publisher.stop()
+        return results, publisher
+
+    results, publisher = asyncio.run(run())
+
+    assert results[0] is None
+    assert isinstance(results[1], ConnectionError)
+    assert publisher.stats()["failed"] == 1
+    assert publisher.buffered == 0
@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+from messaging.consumer import KeyedConsumer
+from messaging.replay import replay
+from messaging.retry import RetryPolicy, exponential_delays
+from sqlalchemy.exc import OperationalError
+from tests.messaging.helpers import InMemoryExchange, InMemoryMessage, InMemoryQueue
+
+
+class FakeChannel:
+    def __init__(self):
+        self.declared = {}
+        self.default_exchange = InMemoryExchange()
+
+    async def declare_queue(self, name, durable=False, arguments=None):
+        self.declared[name] = arguments
+
+
+class DeadLetterQueue:
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def get(self, no_ack=False, fail=True):
+        return self.messages.pop(0) if self.messages else None
+
+
+def db_outage():
+    return OperationalError("SELECT 1", {}, Exception("server has gone away"))
+
+
+def fail(policy, message, error):
+    asyncio.run(policy.on_failure(message, error))
+    routing_key, published = policy.exchange.published[-1]
+    return routing_key, published
+
+
+def test_exponential_delays():
+    assert exponential_delays(2, 4) == [2, 4, 8, 16]
+
+
+def test_retry_queues_expire_back_to_the_queue():
+    channel = FakeChannel()
+    policy = RetryPolicy("PAYMENTS", [2, 4])
+
+    asyncio.run(policy.declare(channel))
+
+    assert channel.declared == {
+        "PAYMENTS.retry.1": {"x-message-ttl": 2000, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": "PAYMENTS"},
+        "PAYMENTS.retry.2": {"x-message-ttl": 4000, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": "PAYMENTS"},
+        "PAYMENTS.dead": None,
+    }
+    assert policy.exchange is channel.default_exchange
+
+
+def test_transient_failure_is_retried_with_backoff_then_dead_lettered():
+    policy = RetryPolicy("PAYMENTS", [2, 4], exchange=InMemoryExchange())
+    queue = InMemoryQueue([])
+    message = InMemoryMessage(queue, b'{"event": "checkout.session.completed"}', message_id="m1")
+
+    routes = []
+    for _ in range(policy.max_attempts):
+        routing_key, message_out = fail(policy, message, db_outage())
+        routes.append(routing_key)
+        # The broker delivers the expired message again with the headers it was published with
+        message = InMemoryMessage(queue, message_out.body, headers=message_out.headers, message_id=message_out.message_id)
+
+    assert routes == ["PAYMENTS.retry.1", "PAYMENTS.retry.2", "PAYMENTS.dead"]
+    assert message.headers["retry_attempts"] == 3
+    assert message.headers["failure_reason"].startswith("OperationalError")
+    assert message.headers["original_queue"] == "PAYMENTS"
+    assert "failed_at" in message.headers
+    assert message.message_id == "m1"
+    assert policy.stats() == {"max_attempts": 3, "retried": 2, "dead_lettered": 1}
+
+
+def test_malformed_message_is_dead_lettered_right_away():
+    policy = RetryPolicy("PAYMENTS", [2, 4], exchange=InMemoryExchange())
+    message = InMemoryMessage(InMemoryQueue([]), b"not json")
+    try:
+        json.loads(message.body)
+    except ValueError as e:
+        error = e
+
+    routing_key, published = fail(policy, message, error)
+
+    assert routing_key == "PAYMENTS.dead"
+    assert published.headers["retry_attempts"] == 1
+    assert published.headers["failure_reason"].startswith("JSONDecodeError")
+
+
+def test_consumer_acks_routed_failures_and_keeps_consuming():
+    policy = RetryPolicy("PAYMENTS", [1], exchange=InMemoryExchange())
+    handled = []
+
+    async def handler(body):
+        message = json.loads(body)
+        handled.append(message["n"])
+
+    async def run():
+        queue = InMemoryQueue([b'{"n": 1}', b"poison", b'{"n": 2}'], prefetch=1)
+        consumer = KeyedConsumer(handler, workers=1, on_failure=policy.on_failure)
+        await consumer.start(queue)
+        await asyncio.wait_for(queue.done.wait(), timeout=5)
+        await consumer.stop()
+        return queue, consumer
+
+    queue, consumer = asyncio.run(run())
+
+    assert handled == [1, 2]
+    assert queue.acked == [b'{"n": 1}', b"poison", b'{"n": 2}']
+    assert [routing_key for routing_key, _ in policy.exchange.published] == ["PAYMENTS.dead"]
+    assert consumer.stats()["failed"] == 1
+
+
+def test_message_is_requeued_when_it_cant_be_routed():
+    async def handler(body):
+        raise db_outage()
+
+    async def broker_down(message, error):
+        raise ConnectionError("broker unreachable")
+
+    async def run():
+        queue = InMemoryQueue([b"{}"])
+        consumer = KeyedConsumer(handler, workers=1, on_failure=broker_down)
+        await consumer.start(queue)
+        await asyncio.wait_for(queue.done.wait(), timeout=5)
+        await consumer.stop()
+        return queue
+
+    queue = asyncio.run(run())
+
+    assert queue.requeued == [b"{}"]
+
+
+def test_replay_moves_dead_letters_back_with_a_fresh_schedule():
+    queue = InMemoryQueue([])
+    dead = [
+        InMemoryMessage(
+            queue,
+            b'{"n": 1}',
+            headers={"retry_attempts": 5, "failure_reason": "OperationalError: gone", "original_queue": "PAYMENTS"},
+            message_id="m1",
+        ),
+        InMemoryMessage(queue, b'{"n": 2}', headers={"retry_attempts": 1, "failure_reason": "KeyError: 'user_id'"}),
+    ]
+    exchange = InMemoryExchange()
+
+    count = asyncio.run(replay(DeadLetterQueue(dead), exchange, "PAYMENTS", limit=5))
+
+    assert count == 2
+    assert queue.acked == [b'{"n": 1}', b'{"n": 2}']
+    assert [routing_key for routing_key, _ in exchange.published] == ["PAYMENTS", "PAYMENTS"]
+    first = exchange.published[0][1]
+    assert first.message_id == "m1"
+    assert "retry_attempts" not in first.headers and "failure_reason" not in first.headers
+    assert first.headers["replays"] == 1
+
+
+def test_dry_run_leaves_dead_letters_in_place():
+    queue = InMemoryQueue([])
+    dead = [InMemoryMessage(queue, b'{"n": 1}', headers={"failure_reason": "KeyError: 'user_id'"})]
+    exchange = InMemoryExchange()
+
+    count = asyncio.run(replay(DeadLetterQueue(dead), exchange, "PAYMENTS", dry_run=True))
+
+    assert count == 1
+    assert queue.acked == [] and exchange.published == []
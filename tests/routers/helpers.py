@@ -1,3 +1,7 @@
+import struct
+import zlib
+
+
 class DualAccessDict:
     def __init__(self, **kwargs):
         self._data = kwargs
@@ -12,4 +16,16 @@ class DualAccessDict:
             raise AttributeError(f"'DualAccessDict' object has no attribute '{key}'")
 
     def __repr__(self):
-        return repr(self._data)
\ No newline at end of file
+        return repr(self._data)
+
+
+def png_bytes(width: int = 1, height: int = 1, padding: int = 0) -> bytes:
+    """
+    Build a PNG file: signature, IHDR, an IDAT chunk of `padding` bytes and IEND.
+    """
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", b"\0" * padding) + chunk(b"IEND", b"")
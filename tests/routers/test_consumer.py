@@ -0,0 +1,233 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from crud import async_crud
+from crud.ticket_ids import TicketIdAllocator
+from db.migrate import migrate
+from models.outboxmessage import OutboxMessage
+from models.processedevent import ProcessedEvent
+from models.userticket import UserTicket as UserTicketModel
+from routers import ticket as ticket_router
+from tests.crud.helpers import ticket_model
+
+
+def checkout_event(**fields) -> bytes:
+    return json.dumps(
+        {
+            "event": "checkout.session.completed",
+            "user_id": "12b-12b-12b",
+            "ticket_id": 1,
+            "quantity": 2,
+            "unit_amount": 150.0,
+            "created_at": "2023-10-01T12:00:00",
+            **fields,
+        }
+    ).encode()
+
+
+stream = [
+    checkout_event(session_id="cs_1"),
+    checkout_event(session_id="cs_2", user_id="34c-34c-34c", quantity=3),
+    # Redelivered within the stream
+    checkout_event(session_id="cs_1"),
+    # No id, deduplicated by the digest of the body
+    checkout_event(quantity=1, created_at="2023-10-01T13:00:00"),
+    json.dumps({"event": "checkout.session.expired", "session_id": "cs_3"}).encode(),
+]
+
+
+@pytest.fixture
+def consumer(tmp_path):
+    path = tmp_path / "consumer.db"
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    with Session(engine) as db:
+        db.add(ticket_model(id=1))
+        db.commit()
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = MagicMock(wraps=async_sessionmaker(async_engine, expire_on_commit=False))
+    mocks = SimpleNamespace(
+        engine=async_engine,
+        session_factory=session_factory,
+        user_profiles_get=AsyncMock(return_value={"name": "User", "email": "user@example.com"}),
+        get_ticket_by_id=AsyncMock(wraps=async_crud.get_ticket_by_id),
+    )
+    ticket_router.recent_events.clear()
+    with patch("routers.ticket.AsyncSessionLocal", session_factory), \
+            patch("routers.ticket.outbox_relay.notify") as notify, \
+            patch("routers.ticket.user_profiles.get", mocks.user_profiles_get), \
+            patch("routers.ticket.async_crud.get_ticket_by_id", mocks.get_ticket_by_id), \
+            patch("crud.async_crud.ticket_id_allocator", TicketIdAllocator(b"test")):
+        mocks.notify = notify
+        yield mocks
+    asyncio.run(async_engine.dispose())
+
+
+def consume(async_engine, bodies: list[bytes], batch_size: int = 1):
+    """
+    Feed events to the consumer, one by one or in batches.
+
+    :return: Stored user tickets and processed event keys
+    """
+
+    async def run():
+        for start in range(0, len(bodies), batch_size):
+            batch = bodies[start:start + batch_size]
+            if batch_size == 1:
+                await ticket_router.process_message(batch[0])
+                continue
+            try:
+                await ticket_router.process_messages(batch)
+            except Exception:
+                # BatchConsumer falls back to the messages one by one
+                for body in batch:
+                    await ticket_router.process_message(body)
+        async with async_engine.connect() as connection:
+            tickets = (await connection.execute(select(UserTicketModel).order_by(UserTicketModel.id))).all()
+            keys = (await connection.scalars(select(ProcessedEvent.event_key))).all()
+        return [tuple(row) for row in tickets], sorted(keys)
+
+    return asyncio.run(run())
+
+
+def emails(async_engine) -> list[dict]:
+    """
+    Get the EMAILS messages written to the outbox.
+    """
+
+    async def run():
+        async with async_engine.connect() as connection:
+            return (
+                await connection.scalars(
+                    select(OutboxMessage.body).where(OutboxMessage.routing_key == "EMAILS").order_by(OutboxMessage.id)
+                )
+            ).all()
+
+    return [json.loads(body) for body in asyncio.run(run())]
+
+
+def test_each_event_is_processed_once(consumer):
+    async_engine, session_factory = consumer.engine, consumer.session_factory
+
+    tickets, keys = consume(async_engine, stream)
+
+    assert len(tickets) == 2 + 3 + 1
+    assert len(keys) == 3
+    # The emails are committed to the outbox with the tickets
+    assert sorted(message["ticket_id"] for message in emails(async_engine)) == [row[0] for row in tickets]
+    assert consumer.notify.call_count == 3
+
+
+@pytest.mark.parametrize("restarted", [False, True])
+def test_replayed_stream_gives_identical_result(consumer, restarted):
+    async_engine, session_factory = consumer.engine, consumer.session_factory
+    first = consume(async_engine, stream)
+    sent = emails(async_engine)
+    session_factory.reset_mock()
+    if restarted:
+        # A new worker has an empty filter, the processed_events table catches the duplicates
+        ticket_router.recent_events.clear()
+
+    second = consume(async_engine, stream)
+
+    assert second == first
+    assert emails(async_engine) == sent
+    if restarted:
+        # One session reading the ticket bought and one transaction per event
+        assert session_factory.call_count == 3 * 2
+    else:
+        # Every duplicate was dropped by the in-memory filter, without a database round trip
+        session_factory.assert_not_called()
+
+
+def test_event_key():
+    assert ticket_router.event_key({"event": "e", "session_id": "cs_1"}, b"") == "e:cs_1"
+    assert ticket_router.event_key({"event": "e", "event_id": "evt_1", "session_id": "cs_1"}, b"") == "e:evt_1"
+    assert ticket_router.event_key({"event": "e"}, b"a") != ticket_router.event_key({"event": "e"}, b"b")
+
+
+@pytest.mark.parametrize("batch_size", [2, len(stream)])
+def test_batches_give_the_same_result_as_single_messages(consumer, batch_size):
+    async_engine, session_factory = consumer.engine, consumer.session_factory
+
+    tickets, keys = consume(async_engine, stream, batch_size=batch_size)
+
+    assert len(tickets) == 2 + 3 + 1
+    assert len(keys) == 3
+    assert len(emails(async_engine)) == 6
+    if batch_size == len(stream):
+        # One session reading the ticket bought and one transaction for the whole stream
+        assert session_factory.call_count == 2
+
+
+def test_batch_with_a_processed_event_falls_back(consumer):
+    async_engine, session_factory = consumer.engine, consumer.session_factory
+    first = consume(async_engine, stream[:1])
+    ticket_router.recent_events.clear()
+
+    second = consume(async_engine, stream, batch_size=len(stream))
+
+    tickets, keys = second
+    assert set(first[0]) <= set(tickets)
+    assert len(tickets) == 2 + 3 + 1
+    assert len(keys) == 3
+    assert len(emails(async_engine)) == 6
+
+
+@pytest.mark.parametrize("email_format, publishes", [("v1", 20), ("v2", 1)])
+def test_group_order_is_enriched_once(consumer, email_format, publishes):
+    with patch("routers.ticket.EMAIL_MESSAGE_FORMAT", email_format):
+        tickets, keys = consume(consumer.engine, [checkout_event(session_id="cs_group", quantity=20)])
+
+    # One Cognito lookup and one ticket read for the whole order
+    consumer.user_profiles_get.assert_awaited_once_with("12b-12b-12b")
+    consumer.get_ticket_by_id.assert_awaited_once()
+    messages = emails(consumer.engine)
+    assert len(messages) == publishes
+    ticket_ids = [row[0] for row in tickets]
+    if email_format == "v2":
+        [message] = messages
+        assert message["version"] == 2
+        assert sorted(message["ticket_ids"]) == ticket_ids
+        assert message["to_email"] == "user@example.com"
+        assert message["ticket_name"] == "Championship Finals"
+    else:
+        assert sorted(message["ticket_id"] for message in messages) == ticket_ids
+        assert all("version" not in message for message in messages)
+
+
+def test_batch_enriches_each_buyer_and_ticket_once(consumer):
+    with patch("routers.ticket.EMAIL_MESSAGE_FORMAT", "v2"):
+        consume(consumer.engine, stream, batch_size=len(stream))
+
+    # Two buyers of the same ticket
+    assert consumer.user_profiles_get.await_count == 2
+    consumer.get_ticket_by_id.assert_awaited_once()
+    assert sorted(len(message["ticket_ids"]) for message in emails(consumer.engine)) == [1, 2, 3]
+
+
+def test_profile_is_looked_up_before_the_transaction(consumer):
+    consumer.user_profiles_get.side_effect = ConnectionError("Cognito unavailable")
+
+    with pytest.raises(ConnectionError):
+        consume(consumer.engine, stream[:1])
+
+    consumer.session_factory.assert_not_called()
+    tickets, keys = consume(consumer.engine, [])
+    assert tickets == [] and keys == []
+
+
+def test_purchase_times_with_an_offset_are_stored_in_utc(consumer):
+    tickets, _ = consume(consumer.engine, [checkout_event(session_id="cs_tz", created_at="2023-10-01T14:00:00+02:00")])
+
+    assert {row[4] for row in tickets} == {datetime(2023, 10, 1, 12)}
@@ -0,0 +1,27 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main import app
+from routers import metrics
+
+client = TestClient(app)
+
+
+def test_get_metrics():
+    metrics_app = FastAPI()
+    metrics_app.include_router(metrics.router)
+
+    response = TestClient(metrics_app).get("/metrics")
+
+    assert response.status_code == 200
+    response_data = response.json()
+    assert "hit_ratio" in response_data["user_profiles"]
+    assert "hits" in response_data["verified_tokens"]
+
+
+@pytest.mark.skipif(metrics.METRICS_ENABLED, reason="METRICS_ENABLED is set")
+def test_metrics_are_not_served_by_default():
+    response = client.get("/metrics")
+
+    assert response.status_code == 404
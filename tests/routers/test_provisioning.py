@@ -0,0 +1,105 @@
+import asyncio
+import io
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from crud import async_crud
+from db.migrate import migrate
+from gateways.stripe_gateway import StripeGateway
+from models.outboxmessage import OutboxMessage
+from models.ticket import Ticket as TicketModel
+from routers import ticket as ticket_router
+from schemas.ticket import TicketCreate
+from tests.gateways.fake_stripe import FakeStripe
+from tests.routers.helpers import png_bytes
+
+ticket = TicketCreate(game_id=101, name="Championship Finals", description="Final match", active=True, price=150.0, stock=10)
+
+
+@pytest.fixture
+def fake_stripe():
+    return FakeStripe()
+
+
+@pytest.fixture
+def session_factory(tmp_path, fake_stripe):
+    path = tmp_path / "provisioning.db"
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    stripe_gateway = StripeGateway(
+        "sk_test_123", api_base="http://stripe.test", max_network_retries=0, transport=fake_stripe.transport()
+    )
+    with patch("routers.ticket.AsyncSessionLocal", session_factory), \
+            patch("routers.ticket.stripe_gateway", stripe_gateway), \
+            patch("routers.ticket.outbox_relay.notify"):
+        yield session_factory
+    asyncio.run(async_engine.dispose())
+
+
+def provision(session_factory):
+    """
+    Create a ticket as background mode does, then run its provisioning task.
+
+    :return: Ticket and outbox messages
+    """
+
+    async def run():
+        async with session_factory() as db:
+            created = await async_crud.post_ticket(db, ticket, "", "", "", provisioning_status="provisioning")
+        await ticket_router.provision_ticket(created.id, ticket, io.BytesIO(png_bytes(600, 400)), "image.png")
+        await ticket_router.stripe_gateway.close()
+        async with session_factory() as db:
+            provisioned = await db.get(TicketModel, created.id)
+            messages = (await db.scalars(select(OutboxMessage))).all()
+        return provisioned, [(message.routing_key, json.loads(message.body)) for message in messages]
+
+    return asyncio.run(run())
+
+
+def test_provisioning_fills_in_the_stripe_fields(session_factory, fake_stripe):
+    provisioned, messages = provision(session_factory)
+
+    assert provisioned.provisioning_status == "ready"
+    assert (provisioned.stripe_prod_id, provisioned.stripe_price_id) == ("prod_2", "price_2")
+    assert provisioned.stripe_image_url == "https://files.example.com/links/1"
+    # The payment microservice is told about the ticket once it has a price
+    assert messages == [
+        ("tickets.messages", {"event": "ticket_created", "ticket_id": provisioned.id, "stripe_price_id": "price_2", "stock": 10})
+    ]
+    ticket_router.outbox_relay.notify.assert_called_once()
+
+
+def test_failed_provisioning_marks_the_ticket(session_factory, fake_stripe):
+    fake_stripe.fail_products = True
+
+    provisioned, messages = provision(session_factory)
+
+    assert provisioned.provisioning_status == "failed"
+    assert provisioned.stripe_price_id == ""
+    assert messages == []
+
+
+@pytest.mark.parametrize(
+    "target, error",
+    [
+        # Raised outside of the Stripe SDK, e.g. by the image cache or the transport
+        ("routers.ticket.stripe_gateway.create_product", httpx.ConnectError("Connection refused")),
+        ("routers.ticket.async_crud.provision_ticket", OperationalError("UPDATE tickets", {}, Exception("gone away"))),
+    ],
+)
+def test_provisioning_failing_on_other_errors_marks_the_ticket(session_factory, target, error):
+    with patch(target, new_callable=AsyncMock, side_effect=error):
+        provisioned, messages = provision(session_factory)
+
+    assert provisioned.provisioning_status == "failed"
+    assert messages == []
+    ticket_router.outbox_relay.notify.assert_not_called()
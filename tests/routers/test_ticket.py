@@ -1,5 +1,6 @@
 import io
 import json
+import threading
 
 import pytest
 from fastapi import UploadFile
@@ -7,17 +8,22 @@ from datetime import datetime
 from fastapi.exceptions import HTTPException
 from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from db.async_database import get_async_db
 from db.database import get_db
 from main import app
 from models.ticket import Ticket as TicketModel
 from models.userticket import UserTicket as UserTicketModel
 from schemas.ticket import TicketCreate, TicketUpdate, TicketInDB
 from schemas.userticket import UserTicketCreate, UserTicketInDB
-from tests.routers.helpers import DualAccessDict
+from gateways.stripe_gateway import StripeProduct
+from tests.routers.helpers import png_bytes
 
-from routers.ticket import auth
-from auth.JWTBearer import JWTAuthorizationCredentials
+from routers.ticket import auth, read_auth
+from auth.JWTBearer import JWKS, JWTAuthorizationCredentials
+from auth.jwks import JWKSProvider
+from tests.services.helpers import generate_rsa_jwk, sign_token
 from dotenv import load_dotenv
 
 client = TestClient(app)
@@ -32,13 +38,26 @@ def mock_db():
     yield db
 
 
+@pytest.fixture(scope="module")
+def mock_async_db():
+    db = AsyncMock(spec=AsyncSession)
+    app.dependency_overrides[get_async_db] = lambda: db
+    yield db
+
+
 @pytest.fixture(autouse=True)
-def reset_mock_db(mock_db):
+def reset_mock_db(mock_db, mock_async_db):
     mock_db.reset_mock()
+    mock_async_db.reset_mock()
 
-@patch("routers.ticket.crud.get_ticket_by_game_id", return_value=True)  # Not None to simulate existing ticket
 @patch(
-    "routers.ticket.crud.post_ticket",
+    "routers.ticket.async_crud.get_ticket_by_game_id",
+    new_callable=AsyncMock,
+    return_value=True,  # Not None to simulate existing ticket
+)
+@patch(
+    "routers.ticket.async_crud.post_ticket",
+    new_callable=AsyncMock,
     return_value=TicketInDB(
         id=1,
         stripe_price_id="price_123",
@@ -51,18 +70,12 @@ def reset_mock_db(mock_db):
     ),
 )
 @patch(
-    "routers.ticket.stripe.Product.create",
-    return_value=DualAccessDict(
-        id="prod_123", default_price="price_123"
-    ),
-)
-@patch("routers.ticket.stripe.File.create", return_value=DualAccessDict(id='file_123'))
-@patch(
-    "routers.ticket.stripe.FileLink.create",
-    return_value=DualAccessDict(url="https://example.com/image.jpg")
+    "routers.ticket.stripe_gateway.create_product",
+    new_callable=AsyncMock,
+    return_value=StripeProduct("prod_123", "price_123", "https://example.com/image.jpg"),
 )
 def test_post_ticket_for_game_with_ticket(
-        mock_file_link, mock_file, mock_product, mock_post_ticket, get_ticket_by_game_id_func, mock_db
+        mock_create_product, mock_post_ticket, get_ticket_by_game_id_func, mock_async_db
 ):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
@@ -95,22 +108,25 @@ def test_post_ticket_for_game_with_ticket(
             "price": 150.0,
             "stock": 10
         }
-        files = {"image": ("image.png", io.BytesIO(b"fake_image_data"), "image/png")}
+        files = {"image": ("image.png", io.BytesIO(png_bytes(600, 400)), "image/png")}
 
         response = client.post("/tickets", data=payload, files=files, headers=headers)
 
         assert response.status_code == 400
         assert response.text == '{"detail":"Ticket already exists for game with id 101"}'
-        assert mock_file.call_count == 0
-        assert mock_product.call_count == 0
+        assert mock_create_product.call_count == 0
         assert mock_post_ticket.call_count == 0
-        assert mock_file_link.call_count == 0
-        assert get_ticket_by_game_id_func.call_args[0] == (mock_db, 101)
+        assert get_ticket_by_game_id_func.call_args[0] == (mock_async_db, 101)
 
 
-@patch("routers.ticket.crud.get_ticket_by_game_id", return_value=None)  # Mock to simulate no existing ticket
 @patch(
-    "routers.ticket.crud.post_ticket",
+    "routers.ticket.async_crud.get_ticket_by_game_id",
+    new_callable=AsyncMock,
+    return_value=None,  # Mock to simulate no existing ticket
+)
+@patch(
+    "routers.ticket.async_crud.post_ticket",
+    new_callable=AsyncMock,
     return_value=TicketInDB(
         id=1,
         stripe_price_id="price_123",
@@ -123,18 +139,12 @@ def test_post_ticket_for_game_with_ticket(
     ),
 )
 @patch(
-    "routers.ticket.stripe.Product.create",
-    return_value=DualAccessDict(
-        id="prod_123", default_price="price_123"
-    ),
-)
-@patch("routers.ticket.stripe.File.create", return_value=DualAccessDict(id='file_123'))
-@patch(
-    "routers.ticket.stripe.FileLink.create",
-    return_value=DualAccessDict(url="https://example.com/image.jpg")
+    "routers.ticket.stripe_gateway.create_product",
+    new_callable=AsyncMock,
+    return_value=StripeProduct("prod_123", "price_123", "https://example.com/image.jpg"),
 )
 def test_post_ticket_for_game_with_no_ticket(
-    mock_file_link, mock_file, mock_product, mock_post_ticket, get_ticket_by_game_id_func, mock_db
+    mock_create_product, mock_post_ticket, get_ticket_by_game_id_func, mock_async_db
 ):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
@@ -167,30 +177,40 @@ def test_post_ticket_for_game_with_no_ticket(
             "price": 150.0,
             "stock": 10
         }
-        files = {"image": ("image.png", io.BytesIO(b"fake_image_data"), "image/png")}
+        files = {"image": ("image.png", io.BytesIO(png_bytes(600, 400)), "image/png")}
+        # The upload is closed with the request, its content is read while Stripe is called
+        uploaded = []
+        mock_create_product.side_effect = lambda *args: uploaded.append(args[4].read()) or mock_create_product.return_value
 
         response = client.post("/tickets", data=payload, files=files, headers=headers)
 
         assert response.status_code == 200
-        mock_file_link.assert_called_once()
-        mock_file.assert_called_once()
-        mock_product.assert_called_once()
+        mock_create_product.assert_called_once()
+        # Stripe reads the upload itself, named after the uploaded file, with the price in cents
+        name, description, active, unit_amount, image, image_name = mock_create_product.call_args[0]
+        assert (name, active, unit_amount, image_name) == ("Championship Finals", True, 15000, "image.png")
+        assert uploaded == [png_bytes(600, 400)]
         mock_post_ticket.assert_called_once()
-        assert publish_mock.call_count == 1
-        _, kwargs = publish_mock.call_args
-        assert kwargs.get('routing_key') == "tickets.messages"
-        assert kwargs.get('message').body == json.dumps({
+        assert mock_post_ticket.call_args[0][2:5] == ("prod_123", "price_123", "https://example.com/image.jpg")
+        # The message is written to the outbox with the ticket, not published by the request
+        publish_mock.assert_not_called()
+        outbox_messages = mock_post_ticket.call_args[0][5]
+        assert outbox_messages(mock_post_ticket.return_value) == [({
             "event": "ticket_created",
             "ticket_id": 1,
             "stripe_price_id": "price_123",
             "stock": 10
-        }).encode()
-        assert get_ticket_by_game_id_func.call_args[0] == (mock_db, 101)
+        }, "tickets.messages")]
+        assert get_ticket_by_game_id_func.call_args[0] == (mock_async_db, 101)
 
 
 # Teste para extensão de arquivo inválida
-@patch("routers.ticket.crud.get_ticket_by_game_id", return_value=None)
-def test_create_ticket_invalid_extension(get_ticket_by_game_id_func, mock_db):
+@patch(
+    "routers.ticket.async_crud.get_ticket_by_game_id",
+    new_callable=AsyncMock,
+    return_value=None,
+)
+def test_create_ticket_invalid_extension(get_ticket_by_game_id_func, mock_async_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
         header={"kid": "some_kid"},
@@ -214,7 +234,7 @@ def test_create_ticket_invalid_extension(get_ticket_by_game_id_func, mock_db):
 
     response = client.post("/tickets", data=payload, files=files, headers=headers)
 
-    assert get_ticket_by_game_id_func.call_args[0] == (mock_db, 101)
+    assert get_ticket_by_game_id_func.call_args[0] == (mock_async_db, 101)
     assert response.status_code == 404
     assert response.json() == {
         "detail": "File extension not supported. Supported file extensions include .png"
@@ -222,8 +242,12 @@ def test_create_ticket_invalid_extension(get_ticket_by_game_id_func, mock_db):
 
 
 # Teste para tipo MIME inválido
-@patch("routers.ticket.crud.get_ticket_by_game_id", return_value=None)
-def test_create_ticket_invalid_mime_type(get_ticket_by_game_id_func, mock_db):
+@patch(
+    "routers.ticket.async_crud.get_ticket_by_game_id",
+    new_callable=AsyncMock,
+    return_value=None,
+)
+def test_create_ticket_invalid_mime_type(get_ticket_by_game_id_func, mock_async_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
         header={"kid": "some_kid"},
@@ -245,7 +269,7 @@ def test_create_ticket_invalid_mime_type(get_ticket_by_game_id_func, mock_db):
 
     response = client.post("/tickets", data=payload, files=files, headers=headers)
 
-    assert get_ticket_by_game_id_func.call_args[0] == (mock_db, 101)
+    assert get_ticket_by_game_id_func.call_args[0] == (mock_async_db, 101)
     assert response.status_code == 400
     assert response.json() == {
         "detail": "Invalid file MIME type. Supported MIME types include image/png."
@@ -254,8 +278,12 @@ def test_create_ticket_invalid_mime_type(get_ticket_by_game_id_func, mock_db):
 
 
 # Teste para tamanho de arquivo excedido
-@patch("routers.ticket.crud.get_ticket_by_game_id", return_value=None)
-def test_create_ticket_file_too_large(get_ticket_by_game_id_func, mock_db):
+@patch(
+    "routers.ticket.async_crud.get_ticket_by_game_id",
+    new_callable=AsyncMock,
+    return_value=None,
+)
+def test_create_ticket_file_too_large(get_ticket_by_game_id_func, mock_async_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
         header={"kid": "some_kid"},
@@ -279,13 +307,14 @@ def test_create_ticket_file_too_large(get_ticket_by_game_id_func, mock_db):
 
     response = client.post("/tickets", data=payload, files=files, headers=headers)
 
-    assert get_ticket_by_game_id_func.call_args[0] == (mock_db, 101)
+    assert get_ticket_by_game_id_func.call_args[0] == (mock_async_db, 101)
     assert response.status_code == 400
     assert response.json() == {"detail": "File too large. Max size is 2097152 bytes."}
 
 
 @patch(
-    "routers.ticket.crud.get_ticket_by_id",
+    "routers.ticket.async_crud.get_ticket_by_id",
+    new_callable=AsyncMock,
     return_value=MagicMock(
         id=1,
         stripe_price_id="price_123",
@@ -295,11 +324,17 @@ def test_create_ticket_file_too_large(get_ticket_by_game_id_func, mock_db):
         description="Final match",
         active=True,
         price=150.0,
+        stripe_prod_id="prod_123",
+        provisioning_status="ready",
     ),
 )
-@patch("routers.ticket.crud.update_ticket", return_value=None)
-@patch("routers.ticket.stripe.Product.modify")
-def test_update_ticket(mock_modify, mock_update_ticket, mock_get_ticket_by_id, mock_db):
+@patch(
+    "routers.ticket.async_crud.update_ticket",
+    new_callable=AsyncMock,
+    return_value=None,
+)
+@patch("routers.ticket.stripe_sync.schedule")
+def test_update_ticket(mock_schedule, mock_update_ticket, mock_get_ticket_by_id, mock_async_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
         header={"kid": "some_kid"},
@@ -320,8 +355,12 @@ def test_update_ticket(mock_modify, mock_update_ticket, mock_get_ticket_by_id, m
 
         # Mock para refletir mudanças feitas durante a atualização
         mock_ticket = mock_get_ticket_by_id.return_value
-        mock_ticket.name = "New Name"
-        mock_ticket.description = "Updated description"
+
+        async def update_ticket(db, ticket, ticket_update, outbox_messages):
+            for field_name, field_value in ticket_update.model_dump(exclude_none=True).items():
+                setattr(ticket, field_name, field_value)
+
+        mock_update_ticket.side_effect = update_ticket
 
         response = client.put(f"/tickets/{ticket_id}", json=payload, headers=headers)
 
@@ -339,27 +378,33 @@ def test_update_ticket(mock_modify, mock_update_ticket, mock_get_ticket_by_id, m
             "price": 150.0,
             "stripe_price_id": "price_123",
             "stripe_image_url": "https://example.com/image.jpg",
+            "provisioning_status": "ready",
         }
 
         # Verifique chamadas dos mocks
-        mock_get_ticket_by_id.assert_called_once_with(mock_db, ticket_id)
+        mock_get_ticket_by_id.assert_called_once_with(mock_async_db, ticket_id)
         mock_update_ticket.assert_called_once()
+        # Only the changed fields stored by Stripe are synced, stock isn't
+        mock_schedule.assert_called_once_with("prod_123", {"name": "New Name", "description": "Updated description"})
 
         # Stock é updated em outro microserviço - verificar que mensagem foi enviada
-        assert publish_mock.call_count == 1
-        _, kwargs = publish_mock.call_args
-        assert kwargs.get('routing_key') == "tickets.messages"
-        assert kwargs.get('message').body == json.dumps({
+        publish_mock.assert_not_called()
+        outbox_messages = mock_update_ticket.call_args[0][3]
+        assert outbox_messages(mock_ticket) == [({
             "event": "ticket_stock_updated",
             "ticket_id": ticket_id,
             "stock": 10
-        }).encode()
+        }, "tickets.messages")]
 
 
 
 # Teste para erro em atualização de ticket
-@patch("routers.ticket.crud.get_ticket_by_id", return_value=None)
-def test_update_ticket_not_found(mock_get_ticket_by_id, mock_db):
+@patch(
+    "routers.ticket.async_crud.get_ticket_by_id",
+    new_callable=AsyncMock,
+    return_value=None,
+)
+def test_update_ticket_not_found(mock_get_ticket_by_id, mock_async_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
         jwt_token="token",
         header={"kid": "some_kid"},
@@ -376,7 +421,7 @@ def test_update_ticket_not_found(mock_get_ticket_by_id, mock_db):
 
     assert response.status_code == 404
     assert response.json() == {"detail": "Ticket with id 999 not found."}
-    mock_get_ticket_by_id.assert_called_once_with(mock_db, ticket_id)
+    mock_get_ticket_by_id.assert_called_once_with(mock_async_db, ticket_id)
 
 
 # Testes para outras rotas
@@ -389,6 +434,7 @@ def test_get_ticket_by_id_not_found(mock_get_ticket_by_id, mock_db):
         signature="signature",
         message="message",
     )
+    app.dependency_overrides[read_auth] = app.dependency_overrides[auth]
     headers = {"Authorization": "Bearer token"}
 
     ticket_id = 999
@@ -397,6 +443,21 @@ def test_get_ticket_by_id_not_found(mock_get_ticket_by_id, mock_db):
     assert response.json() == {"detail": "Ticket not found"}
 
 
+@patch("routers.ticket.crud.get_ticket_by_id")
+def test_get_ticket_by_id_with_expired_token(mock_get_ticket_by_id, mock_db):
+    private_pem, public_jwk = generate_rsa_jwk("kid_1")
+    token = sign_token(private_pem, "kid_1", expires_in=-3600)
+
+    with patch.dict(app.dependency_overrides), \
+            patch.object(read_auth, "jwks_provider", JWKSProvider.from_jwks(JWKS(keys=[public_jwk]))):
+        app.dependency_overrides.pop(read_auth, None)
+        response = client.get("/tickets/1", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Token expired"}
+    mock_get_ticket_by_id.assert_not_called()
+
+
 @patch("routers.ticket.crud.get_ticket_by_game_id", return_value=None)
 def test_get_tickets_by_game_id_not_found(mock_get_tickets_by_game_id, mock_db):
     app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
@@ -406,6 +467,7 @@ def test_get_tickets_by_game_id_not_found(mock_get_tickets_by_game_id, mock_db):
         signature="signature",
         message="message",
     )
+    app.dependency_overrides[read_auth] = app.dependency_overrides[auth]
     headers = {"Authorization": "Bearer token"}
 
     game_id = 999
@@ -423,6 +485,7 @@ def test_get_tickets_no_results(mock_get_tickets, mock_db):
         signature="signature",
         message="message",
     )
+    app.dependency_overrides[read_auth] = app.dependency_overrides[auth]
     headers = {"Authorization": "Bearer token"}
 
     response = client.get("/tickets", headers=headers)
@@ -430,6 +493,26 @@ def test_get_tickets_no_results(mock_get_tickets, mock_db):
     assert response.json() == []
 
 
+@patch("routers.ticket.crud.get_tickets")
+def test_sync_queries_run_on_the_db_executor(mock_get_tickets, mock_db):
+    threads = []
+    mock_get_tickets.side_effect = lambda db, skip, limit: threads.append(threading.current_thread().name) or []
+    app.dependency_overrides[read_auth] = lambda: JWTAuthorizationCredentials(
+        jwt_token="token",
+        header={"kid": "some_kid"},
+        claims={"sub": "user_id"},
+        signature="signature",
+        message="message",
+    )
+
+    response = client.get("/tickets", headers={"Authorization": "Bearer token"})
+
+    assert response.status_code == 200
+    assert response.json() == []
+    mock_get_tickets.assert_called_once_with(mock_db, 0, 100)
+    assert threads[0].startswith("db-sync")
+
+
 @patch("routers.ticket.crud.validate_ticket")
 def test_deactivate_ticket_success(mock_validate_ticket, mock_db):
     """Teste para desativar um ticket com sucesso."""
@@ -441,12 +524,12 @@ def test_deactivate_ticket_success(mock_validate_ticket, mock_db):
         unit_amount=300.0,
         created_at="2023-10-01T12:00:00",
         is_active=False,
-        deactivated_at=str(datetime.now()),
+        deactivated_at="2023-10-05 20:30:00.123456",
     )
 
     mock_validate_ticket.return_value = mock_ticket
 
-    response = client.put("/tickets/1234/validate")
+    response = client.put("/tickets/12345678901280/validate")
 
     assert response.status_code == 200
 
@@ -460,14 +543,16 @@ def test_deactivate_ticket_success(mock_validate_ticket, mock_db):
     assert "deactivated_at" in response_data
 
     assert response_data["is_active"] is False
-    assert response_data["deactivated_at"] is not None
+    assert response_data["created_at"] == "2023-10-01T12:00:00"
+    # The formats returned before the columns were DateTime: as sent for created_at, str(datetime) for deactivated_at
+    assert response_data["deactivated_at"] == "2023-10-05 20:30:00.123456"
 
-    mock_validate_ticket.assert_called_once_with(mock_db, '123')
+    mock_validate_ticket.assert_called_once_with(mock_db, '1234567890128')
 
 
 @patch(
     "routers.ticket.crud.validate_ticket",
-    side_effect=HTTPException(status_code=404, detail="Ticket with id 99 not found."),
+    side_effect=HTTPException(status_code=404, detail="Ticket with id 999999999999 not found."),
 )
 def test_deactivate_ticket_not_found(mock_validate_ticket, mock_db):
     """Teste para tentar desativar um ticket inexistente."""
@@ -480,18 +565,19 @@ def test_deactivate_ticket_not_found(mock_validate_ticket, mock_db):
     )
     headers = {"Authorization": "Bearer token"}
 
-    response = client.put("/tickets/99/validate", headers=headers)
+    # Legacy 12-digit id, without a check digit
+    response = client.put("/tickets/9999999999990/validate", headers=headers)
 
     assert response.status_code == 404
-    assert response.json() == {"detail": "Ticket with id 99 not found."}
+    assert response.json() == {"detail": "Ticket with id 999999999999 not found."}
 
-    mock_validate_ticket.assert_called_once_with(mock_db, '9')
+    mock_validate_ticket.assert_called_once_with(mock_db, '999999999999')
 
 
 @patch(
     "routers.ticket.crud.validate_ticket",
     side_effect=HTTPException(
-        status_code=400, detail="Ticket with id 2 is already deactivated."
+        status_code=400, detail="Ticket with id 2222222222224 is already deactivated."
     ),
 )
 def test_deactivate_ticket_already_deactivated(mock_validate_ticket, mock_db):
@@ -505,10 +591,149 @@ def test_deactivate_ticket_already_deactivated(mock_validate_ticket, mock_db):
     )
     headers = {"Authorization": "Bearer token"}
 
-    response = client.put("/tickets/22/validate", headers=headers)
+    response = client.put("/tickets/22222222222240/validate", headers=headers)
 
     assert response.status_code == 400
-    assert response.json() == {"detail": "Ticket with id 2 is already deactivated."}
+    assert response.json() == {"detail": "Ticket with id 2222222222224 is already deactivated."}
+
+    mock_validate_ticket.assert_called_once_with(mock_db, '2222222222224')
+
+
+@pytest.mark.parametrize("scanned", ["12345678901270", "123456789010", "12a4567890128X", "220"])
+@patch("routers.ticket.crud.validate_ticket")
+def test_deactivate_ticket_rejects_malformed_ids(mock_validate_ticket, scanned, mock_db):
+    """Mistyped or malformed scans are rejected before any database query."""
+    response = client.put(f"/tickets/{scanned}/validate")
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": f"Invalid ticket id {scanned[:-1]}."}
+    mock_validate_ticket.assert_not_called()
+
+
+
+ticket_form = {
+    "game_id": "101",
+    "name": "Championship Finals",
+    "description": "Final match of the championship",
+    "active": "true",
+    "price": "150.0",
+    "stock": 10
+}
+
+
+@pytest.mark.parametrize(
+    "content, detail",
+    [
+        (b"fake_image_data", "Invalid PNG image: Not a PNG image."),
+        (png_bytes()[:20], "Invalid PNG image: Not a PNG image."),
+        (png_bytes(0, 10), "Invalid PNG image: Empty PNG image."),
+        (png_bytes(9000, 10), "Image too large. Max dimensions are 8000x8000 pixels."),
+    ],
+)
+@patch("routers.ticket.async_crud.get_ticket_by_game_id", new_callable=AsyncMock, return_value=None)
+@patch("routers.ticket.stripe_gateway.create_product", new_callable=AsyncMock)
+def test_create_ticket_checks_png_content_before_uploading(mock_create_product, get_ticket_by_game_id_func, content, detail):
+    app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
+        jwt_token="token",
+        header={"kid": "some_kid"},
+        claims={"sub": "user_id"},
+        signature="signature",
+        message="message",
+    )
+    # Declared as a PNG, whatever the content is
+    files = {"image": ("image.png", content, "image/png")}
+
+    response = client.post("/tickets", data=ticket_form, files=files, headers={"Authorization": "Bearer token"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": detail}
+    mock_create_product.assert_not_called()
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+@patch("routers.ticket.async_crud.get_ticket_by_game_id", new_callable=AsyncMock, return_value=None)
+def test_create_ticket_rejects_oversized_body_while_streaming(get_ticket_by_game_id_func, chunked):
+    app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
+        jwt_token="token",
+        header={"kid": "some_kid"},
+        claims={"sub": "user_id"},
+        signature="signature",
+        message="message",
+    )
+    files = {"image": ("image.png", png_bytes(padding=3 * 1024 * 1024), "image/png")}
+    request = client.build_request("POST", "/tickets", data=ticket_form, files=files, headers={"Authorization": "Bearer token"})
+    if chunked:
+        # Without Content-Length, the body is counted as it streams in
+        del request.headers["Content-Length"]
+
+    response = client.send(request)
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large. Max size is 2162688 bytes."}
+    get_ticket_by_game_id_func.assert_not_called()
+
+
+@patch("routers.ticket.TICKET_PROVISIONING_MODE", "background")
+@patch("routers.ticket.async_crud.get_ticket_by_game_id", new_callable=AsyncMock, return_value=None)
+@patch(
+    "routers.ticket.async_crud.post_ticket",
+    new_callable=AsyncMock,
+    return_value=TicketInDB(
+        id=1,
+        stripe_price_id="",
+        stripe_image_url="",
+        provisioning_status="provisioning",
+        game_id=101,
+        name="Championship Finals",
+        description="Final match of the championship",
+        active=True,
+        price=150.0,
+    ),
+)
+@patch("routers.ticket.provision_ticket", new_callable=AsyncMock)
+@patch("routers.ticket.stripe_gateway.create_product", new_callable=AsyncMock)
+def test_create_ticket_in_background_mode_is_accepted_before_provisioning(
+    mock_create_product, mock_provision_ticket, mock_post_ticket, get_ticket_by_game_id_func, mock_async_db
+):
+    app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
+        jwt_token="token",
+        header={"kid": "some_kid"},
+        claims={"sub": "user_id"},
+        signature="signature",
+        message="message",
+    )
+    files = {"image": ("image.png", png_bytes(600, 400), "image/png")}
+
+    response = client.post("/tickets", data=ticket_form, files=files, headers={"Authorization": "Bearer token"})
+
+    assert response.status_code == 202
+    assert response.json()["provisioning_status"] == "provisioning"
+    # The row is written without Stripe fields and no message for the payment microservice
+    mock_create_product.assert_not_called()
+    assert mock_post_ticket.call_args[0][2:] == ("", "", "")
+    assert mock_post_ticket.call_args.kwargs == {"provisioning_status": "provisioning"}
+    ticket_id, ticket, image, image_name = mock_provision_ticket.call_args[0]
+    assert (ticket_id, ticket.stock, image_name) == (1, 10, "image.png")
+    assert image.read() == png_bytes(600, 400)
+
+
+@pytest.mark.parametrize("status", ["provisioning", "failed"])
+@patch("routers.ticket.async_crud.update_ticket", new_callable=AsyncMock)
+@patch("routers.ticket.stripe_sync.schedule")
+def test_update_ticket_without_stripe_product_is_rejected(mock_schedule, mock_update_ticket, status, mock_async_db):
+    app.dependency_overrides[auth] = lambda: JWTAuthorizationCredentials(
+        jwt_token="token",
+        header={"kid": "some_kid"},
+        claims={"sub": "user_id"},
+        signature="signature",
+        message="message",
+    )
+    ticket = MagicMock(id=1, stripe_prod_id="", provisioning_status=status)
 
-    mock_validate_ticket.assert_called_once_with(mock_db, '2')
+    with patch("routers.ticket.async_crud.get_ticket_by_id", new_callable=AsyncMock, return_value=ticket):
+        response = client.put("/tickets/1", json={"name": "New Name"}, headers={"Authorization": "Bearer token"})
 
+    assert response.status_code == 409
+    assert response.json() == {"detail": f"Ticket with id 1 has no Stripe product ({status})."}
+    mock_update_ticket.assert_not_called()
+    mock_schedule.assert_not_called()
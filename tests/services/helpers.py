@@ -0,0 +1,51 @@
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from starlette.requests import Request
+
+
+def generate_rsa_jwk(kid: str):
+    """
+    Generate an RSA key pair for signing test tokens.
+
+    :param kid: Key ID to assign to the public JWK.
+    :return: Private key in PEM format and the public JWK.
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    public_jwk = jwk.construct(public_pem, algorithm="RS256").to_dict()
+    public_jwk = {key: value.decode() if isinstance(value, bytes) else value for key, value in public_jwk.items()}
+    public_jwk.update({"kid": kid, "use": "sig"})
+    return private_pem, public_jwk
+
+
+def sign_token(private_pem: str, kid: str, expires_in: int = 3600, **claims) -> str:
+    payload = {
+        "sub": "user-sub",
+        "username": "user",
+        "iat": int(time.time()),
+        "exp": int(time.time()) + expires_in,
+        **claims,
+    }
+    return jwt.encode(payload, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+def bearer_request(token: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+        }
+    )
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from auth.jwks import JWKS, JWKSProvider
+from tests.services.helpers import generate_rsa_jwk
+
+_, jwk_1 = generate_rsa_jwk("kid_1")
+_, jwk_2 = generate_rsa_jwk("kid_2")
+jwks_url = "https://cognito.example.com/.well-known/jwks.json"
+
+
+class RequestsMockResponse:
+    def __init__(self, json_data, status_code=200):
+        self.json_data = json_data
+        self.status_code = status_code
+
+    def json(self):
+        return self.json_data
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [jwk_1]}))
+    return str(path)
+
+
+@patch("auth.jwks.requests.get")
+def test_loads_snapshot_without_network(requests_get_mock, snapshot_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=snapshot_path)
+
+    assert set(provider.kid_to_key) == {"kid_1"}
+    requests_get_mock.assert_not_called()
+
+
+@patch("auth.jwks.requests.get")
+def test_missing_snapshot_starts_empty(requests_get_mock, tmp_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=str(tmp_path / "missing.json"))
+
+    assert provider.kid_to_key == {}
+    requests_get_mock.assert_not_called()
+
+
+@patch("auth.jwks.requests.get", return_value=RequestsMockResponse({"keys": [jwk_1, jwk_2]}))
+def test_refresh_serves_and_saves_new_keys(requests_get_mock, snapshot_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=snapshot_path)
+
+    assert asyncio.run(provider.refresh()) is True
+
+    assert set(provider.kid_to_key) == {"kid_1", "kid_2"}
+    with open(snapshot_path) as snapshot:
+        assert JWKS.model_validate(json.load(snapshot)).keys == [jwk_1, jwk_2]
+
+
+@patch("auth.jwks.requests.get", return_value=RequestsMockResponse({}, 503))
+def test_failed_refresh_serves_last_good_keys(requests_get_mock, snapshot_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=snapshot_path)
+
+    assert asyncio.run(provider.refresh()) is False
+
+    assert set(provider.kid_to_key) == {"kid_1"}
+    assert provider.refresh_failures == 1
+
+
+@patch("auth.jwks.requests.get", return_value=RequestsMockResponse({"keys": [jwk_1]}))
+def test_unknown_kid_refetch_is_rate_limited(requests_get_mock, snapshot_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=snapshot_path, min_refetch_interval=60)
+
+    async def run():
+        await asyncio.gather(*(provider.refresh_for_unknown_kid("kid_2") for _ in range(5)))
+        await provider.refresh_for_unknown_kid("kid_2")
+
+    asyncio.run(run())
+
+    requests_get_mock.assert_called_once()
+
+
+@patch("auth.jwks.requests.get", return_value=RequestsMockResponse({"keys": [jwk_1, jwk_2]}))
+def test_known_kid_is_not_refetched(requests_get_mock, snapshot_path):
+    provider = JWKSProvider(jwks_url, snapshot_path=snapshot_path)
+
+    asyncio.run(provider.refresh_for_unknown_kid("kid_1"))
+
+    requests_get_mock.assert_not_called()
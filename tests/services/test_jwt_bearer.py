@@ -0,0 +1,165 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.exceptions import HTTPException
+
+from auth.JWTBearer import JWKS, JWTAuthorizationCredentials, JWTBearer, parse_jwt
+from auth.cache import LRUCache
+from auth.jwks import JWKSProvider
+from auth.revocation import RevocationPolicy
+from tests.services.helpers import bearer_request, generate_rsa_jwk, sign_token
+
+private_pem, public_jwk = generate_rsa_jwk("kid_1")
+other_private_pem, other_public_jwk = generate_rsa_jwk("kid_2")
+
+
+@pytest.fixture
+def bearer():
+    return JWTBearer(JWKS(keys=[public_jwk, other_public_jwk]), cache_size=2)
+
+
+def test_keys_constructed_once(bearer):
+    assert set(bearer.kid_to_key) == {"kid_1", "kid_2"}
+
+
+@patch("auth.revocation.user_info_with_token")
+def test_repeated_token_hits_cache(mock_user_info, bearer):
+    token = sign_token(private_pem, "kid_1")
+
+    with patch("auth.jwks.jwk.construct") as mock_construct:
+        first = asyncio.run(bearer(bearer_request(token)))
+        second = asyncio.run(bearer(bearer_request(token)))
+
+    assert first is second
+    assert first.claims["username"] == "user"
+    assert bearer.cache_misses == 1
+    assert bearer.cache_hits == 1
+    mock_construct.assert_not_called()
+
+
+@patch("auth.revocation.user_info_with_token")
+def test_invalid_signature_is_not_cached(mock_user_info, bearer):
+    # Signed with the key of kid_2 but claiming kid_1
+    token = sign_token(other_private_pem, "kid_1")
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(bearer(bearer_request(token)))
+        assert exc_info.value.detail == "JWK invalid"
+
+    assert len(bearer.verified_tokens) == 0
+
+
+@patch("auth.revocation.user_info_with_token")
+def test_cache_is_bounded(mock_user_info, bearer):
+    tokens = [sign_token(private_pem, "kid_1", username=f"user_{i}") for i in range(3)]
+
+    for token in tokens:
+        asyncio.run(bearer(bearer_request(token)))
+
+    assert len(bearer.verified_tokens) == 2
+    assert bearer.token_digest(tokens[0]) not in bearer.verified_tokens
+
+
+def test_cache_entries_expire():
+    now = [1000.0]
+    cache = LRUCache(maxsize=10, clock=lambda: now[0])
+    cache.set("token", "credentials", expires_at=1010.0)
+    cache.set("expired", "credentials", expires_at=999.0)
+
+    assert cache.get("token") == "credentials"
+    assert "expired" not in cache
+
+    now[0] = 1010.0
+    assert cache.get("token") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+@patch("auth.revocation.user_info_with_token")
+def test_expired_entry_is_verified_again(mock_user_info, bearer):
+    token = sign_token(private_pem, "kid_1", expires_in=60)
+
+    asyncio.run(bearer(bearer_request(token)))
+    with patch.object(bearer.verified_tokens, "clock", return_value=time.time() + 120):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(bearer(bearer_request(token)))
+
+    # The expired token isn't served from the cache, and is rejected once verified again
+    assert exc_info.value.detail == "Token expired"
+    assert bearer.cache_hits == 0
+    assert bearer.cache_misses == 2
+
+
+@pytest.mark.parametrize("revocation_policy", list(RevocationPolicy))
+@patch("auth.revocation.user_info_with_token")
+def test_expired_token_is_rejected_under_every_policy(mock_user_info, bearer, revocation_policy):
+    token = sign_token(private_pem, "kid_1", expires_in=-3600)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(bearer.with_policy(revocation_policy)(bearer_request(token)))
+
+    assert exc_info.value.status_code == 403
+    assert exc_info.value.detail == "Token expired"
+    assert len(bearer.verified_tokens) == 0
+
+
+@patch("auth.revocation.user_info_with_token")
+def test_unknown_kid_triggers_jwks_refetch(mock_user_info):
+    provider = JWKSProvider.from_jwks(JWKS(keys=[public_jwk]))
+    bearer = JWTBearer(provider)
+    token = sign_token(other_private_pem, "kid_2")
+
+    async def refresh_for_unknown_kid(kid):
+        provider.set_keys(JWKS(keys=[public_jwk, other_public_jwk]))
+
+    with patch.object(provider, "refresh_for_unknown_kid", side_effect=refresh_for_unknown_kid) as refetch:
+        credentials = asyncio.run(bearer(bearer_request(token)))
+
+    refetch.assert_called_once_with("kid_2")
+    assert credentials.header["kid"] == "kid_2"
+
+
+def test_parse_jwt_reuses_token_segments():
+    token = sign_token(private_pem, "kid_1", version=2)
+    header_segment, claims_segment, signature_segment = token.split(".")
+
+    credentials = parse_jwt(token)
+
+    assert credentials.header["kid"] == "kid_1"
+    assert credentials.claims["username"] == "user"
+    assert credentials.message == f"{header_segment}.{claims_segment}"
+    assert credentials.signing_input == credentials.message.encode()
+    assert credentials.signature == signature_segment
+    assert not hasattr(credentials, "__dict__")
+
+
+def test_credentials_convert_to_model():
+    token = sign_token(private_pem, "kid_1", version=2)
+
+    model = parse_jwt(token).to_model()
+
+    assert isinstance(model, JWTAuthorizationCredentials)
+    assert "version" not in model.claims
+    assert model.claims["exp"] == str(parse_jwt(token).claims["exp"])
+    assert model.message == token.rsplit(".", 1)[0]
+    assert model.signature == token.rsplit(".", 1)[-1]
+
+
+@pytest.mark.parametrize(
+    "token, detail",
+    [
+        ("a.b", "Invalid JWT structure"),
+        ("a.b.c.d", "Invalid JWT structure"),
+        ("eyJraWQiOiJrIn0.bm90LWpzb24.c2ln", "Failed to decode claims"),
+        ("bm90LWpzb24.e30.c2ln", "Invalid JWT header"),
+    ],
+)
+def test_parse_jwt_rejects_malformed_tokens(token, detail):
+    with pytest.raises(HTTPException) as exc_info:
+        parse_jwt(token)
+
+    assert exc_info.value.status_code == 403
+    assert exc_info.value.detail == detail
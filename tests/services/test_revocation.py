@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi.exceptions import HTTPException
+
+from auth.revocation import RevocationChecker, RevocationPolicy
+
+token_digest = b"digest"
+expires_at = time.time() + 3600
+
+
+def not_authorized(*args):
+    raise ClientError({"Error": {"Code": "NotAuthorizedException"}}, "GetUser")
+
+
+def test_cached_policy_reuses_good_result():
+    lookup = MagicMock(return_value={"ResponseMetadata": {"HTTPStatusCode": 200}})
+    checker = RevocationChecker(lookup=lookup)
+
+    async def run():
+        await checker.check("token", token_digest, expires_at, RevocationPolicy.CACHED)
+        await checker.check("token", token_digest, expires_at, RevocationPolicy.CACHED)
+
+    asyncio.run(run())
+
+    lookup.assert_called_once_with("token")
+
+
+def test_strict_policy_always_asks_cognito():
+    lookup = MagicMock()
+    checker = RevocationChecker(lookup=lookup)
+
+    async def run():
+        await checker.check("token", token_digest, expires_at, RevocationPolicy.STRICT)
+        await checker.check("token", token_digest, expires_at, RevocationPolicy.STRICT)
+
+    asyncio.run(run())
+
+    assert lookup.call_count == 2
+
+
+def test_signature_only_policy_skips_cognito():
+    lookup = MagicMock()
+    checker = RevocationChecker(lookup=lookup)
+
+    asyncio.run(checker.check("token", token_digest, expires_at, RevocationPolicy.SIGNATURE_ONLY))
+
+    lookup.assert_not_called()
+
+
+def test_concurrent_checks_share_one_lookup_off_the_event_loop():
+    threads = []
+
+    def lookup(token):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.05)
+
+    checker = RevocationChecker(lookup=lookup)
+
+    async def run():
+        await asyncio.gather(
+            *(checker.check("token", token_digest, expires_at, RevocationPolicy.STRICT) for _ in range(10))
+        )
+
+    asyncio.run(run())
+
+    assert len(threads) == 1
+    assert threads[0].startswith("cognito")
+    assert checker.in_flight == {}
+
+
+def test_revoked_token_is_negatively_cached():
+    lookup = MagicMock(side_effect=not_authorized)
+    checker = RevocationChecker(lookup=lookup)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(checker.check("token", token_digest, expires_at, RevocationPolicy.STRICT))
+        assert exc_info.value.status_code == 403
+        assert exc_info.value.detail == "Access token has been revoked"
+
+    lookup.assert_called_once()
+
+
+def test_cognito_error_is_not_cached():
+    lookup = MagicMock(side_effect=RuntimeError("unreachable"))
+    checker = RevocationChecker(lookup=lookup)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(checker.check("token", token_digest, expires_at, RevocationPolicy.CACHED))
+        assert exc_info.value.detail == "An error occurred while validating the token"
+
+    assert lookup.call_count == 2
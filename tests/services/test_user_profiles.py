@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from auth.user_profiles import UserProfileCache
+
+profile = {"email": "user@example.com", "name": "User"}
+
+
+def test_repeated_lookups_hit_cache():
+    lookup = MagicMock(return_value=profile)
+    cache = UserProfileCache(lookup=lookup)
+
+    async def run():
+        return [await cache.get("sub-1") for _ in range(10)]
+
+    assert asyncio.run(run()) == [profile] * 10
+    lookup.assert_called_once_with("sub-1")
+    assert cache.stats()["hit_ratio"] == 0.9
+
+
+def test_concurrent_lookups_share_one_call_off_the_event_loop():
+    threads = []
+
+    def lookup(user_sub):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return profile
+
+    cache = UserProfileCache(lookup=lookup)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("sub-1") for _ in range(10)))
+
+    assert asyncio.run(run()) == [profile] * 10
+    assert len(threads) == 1
+    assert threads[0].startswith("cognito-users")
+
+
+def test_missing_user_is_not_cached():
+    lookup = MagicMock(return_value=None)
+    cache = UserProfileCache(lookup=lookup)
+
+    async def run():
+        return [await cache.get("sub-1") for _ in range(2)]
+
+    assert asyncio.run(run()) == [None, None]
+    assert lookup.call_count == 2
+
+
+def test_profiles_expire_and_cache_is_bounded():
+    lookup = MagicMock(side_effect=lambda user_sub: {**profile, "name": user_sub})
+    cache = UserProfileCache(ttl=60, maxsize=2, lookup=lookup)
+
+    async def run():
+        for user_sub in ["sub-1", "sub-2", "sub-3"]:
+            await cache.get(user_sub)
+        assert len(cache.profiles) == 2
+        with patch.object(cache.profiles, "clock", return_value=time.time() + 120):
+            await cache.get("sub-3")
+
+    asyncio.run(run())
+
+    assert lookup.call_count == 4
+
+
+@patch("auth.user_profiles.get_user_info_from_user_sub", return_value=profile)
+def test_default_lookup_is_cognito(get_user_info_from_user_sub_mock):
+    cache = UserProfileCache()
+
+    assert asyncio.run(cache.get("sub-1")) == profile
+    get_user_info_from_user_sub_mock.assert_called_once_with("sub-1")
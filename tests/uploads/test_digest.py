@@ -0,0 +1,13 @@
+import hashlib
+import io
+
+from tests.routers.helpers import png_bytes
+from uploads.digest import file_digest
+
+
+def test_file_is_hashed_in_chunks_and_rewound():
+    content = png_bytes(600, 400, padding=200000)
+    file = io.BytesIO(content)
+
+    assert file_digest(file, chunk_size=4096) == hashlib.sha256(content).hexdigest()
+    assert file.read() == content
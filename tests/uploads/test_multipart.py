@@ -0,0 +1,39 @@
+import asyncio
+import io
+
+from tests.routers.helpers import png_bytes
+from uploads.multipart import MultipartFile
+
+
+def read(body: MultipartFile) -> list:
+    async def run():
+        return [chunk async for chunk in body]
+
+    return asyncio.run(run())
+
+
+def test_file_is_streamed_in_chunks():
+    content = png_bytes(600, 400, padding=200000)
+    body = MultipartFile({"purpose": "product_image"}, "file", io.BytesIO(content), "image.png", chunk_size=4096)
+
+    head, *file_chunks, tail = read(body)
+
+    assert b"".join(file_chunks) == content
+    assert max(len(chunk) for chunk in file_chunks) == 4096
+    assert b'name="purpose"\r\n\r\nproduct_image\r\n' in head
+    assert head.endswith(b'name="file"; filename="image.png"\r\nContent-Type: application/octet-stream\r\n\r\n')
+    assert tail == f"\r\n--{body.boundary}--\r\n".encode()
+    assert int(body.headers["Content-Length"]) == len(head) + len(content) + len(tail)
+    assert body.headers["Content-Type"] == f"multipart/form-data; boundary={body.boundary}"
+
+
+def test_body_is_sent_again_from_the_start():
+    body = MultipartFile({}, "file", io.BytesIO(png_bytes()), "image.png")
+
+    assert read(body) == read(body)
+
+
+def test_quotes_in_file_names_are_escaped():
+    body = MultipartFile({}, "file", io.BytesIO(b""), 'my "ticket".png')
+
+    assert b'filename="my %22ticket%22.png"' in body.head
@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+from tests.routers.helpers import png_bytes
+from uploads.png import InvalidImage, parse_png_header, read_png_header
+
+
+def test_header_gives_dimensions_and_rewinds():
+    file = io.BytesIO(png_bytes(640, 480, padding=100))
+
+    header = read_png_header(file)
+
+    assert (header.width, header.height) == (640, 480)
+    assert file.tell() == 0
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (b"GIF89a" + b"\0" * 40, "Not a PNG image"),
+        (png_bytes()[:32], "Not a PNG image"),
+        (png_bytes()[:12] + b"IDAT" + png_bytes()[16:], "Missing PNG IHDR chunk"),
+        (png_bytes()[:20] + b"\xff" + png_bytes()[21:], "Corrupted PNG IHDR chunk"),
+        (png_bytes(1, 0), "Empty PNG image"),
+    ],
+)
+def test_invalid_headers_are_rejected(data, error):
+    with pytest.raises(InvalidImage, match=error):
+        parse_png_header(data)
+
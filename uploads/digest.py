@@ -0,0 +1,19 @@
+import hashlib
+from typing import BinaryIO
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Hash a file in chunks, without holding it in memory.
+
+    :param file: File positioned at its start, rewound once hashed.
+    :param chunk_size: Number of bytes read at once.
+    :return: Hex SHA-256 of the file content.
+    """
+    digest = hashlib.sha256()
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,67 @@
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BodyTooLarge(HTTPException):
+    # An HTTPException, so FastAPI's body parsing lets it through and it is answered with a 413
+    def __init__(self, max_body_size: int):
+        super().__init__(status_code=413, detail=f"Request body too large. Max size is {max_body_size} bytes.")
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies larger than `max_body_size` with a 413.
+
+    Requests declaring a larger Content-Length are rejected before their body
+    is read. Chunked bodies are counted while they stream in and rejected as
+    soon as they go over the limit, before the multipart parser spools the
+    rest of them to disk.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        """
+        :param app: Application.
+        :param max_body_size: Maximum request body size in bytes.
+        """
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise BodyTooLarge(self.max_body_size)
+            return message
+
+        async def tracked_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge as e:
+            if response_started:
+                raise
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send):
+        error = BodyTooLarge(self.max_body_size)
+        await JSONResponse({"detail": error.detail}, status_code=error.status_code)(scope, receive, send)
@@ -0,0 +1,67 @@
+import os
+import uuid
+from typing import AsyncIterator, BinaryIO, Dict, Mapping
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MultipartFile:
+    """
+    multipart/form-data request body of form fields and one file, streamed from the file.
+
+    Only the parts around the file are held in memory: the file is read in
+    chunks as the body is sent, so a spooled upload is never copied whole.
+    Each iteration rewinds the file, so the body can be sent again on retry.
+    """
+
+    def __init__(
+        self,
+        fields: Mapping[str, str],
+        name: str,
+        file: BinaryIO,
+        file_name: str,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        """
+        :param fields: Form fields sent before the file.
+        :param name: Form field of the file.
+        :param file: File to send, seekable.
+        :param file_name: File name sent with the file.
+        :param chunk_size: Number of bytes of the file read at once.
+        """
+        self.boundary = uuid.uuid4().hex
+        self.file = file
+        self.chunk_size = chunk_size
+        parts = [
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{quote(key)}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        ]
+        parts.append(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{quote(name)}"; filename="{quote(file_name)}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        )
+        self.head = "".join(parts).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """
+        Headers of the body, its length given up front so it isn't sent chunked.
+        """
+        size = self.file.seek(0, os.SEEK_END)
+        self.file.seek(0)
+        return {
+            "Content-Type": f"multipart/form-data; boundary={self.boundary}",
+            "Content-Length": str(len(self.head) + size + len(self.tail)),
+        }
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self.file.seek(0)
+        yield self.head
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+        yield self.tail
+
+
+def quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
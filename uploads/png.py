@@ -0,0 +1,56 @@
+import struct
+import zlib
+from typing import BinaryIO, NamedTuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Signature, then the IHDR chunk: length, type, 13 bytes of data and CRC
+PNG_HEADER_SIZE = 8 + 4 + 4 + 13 + 4
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class PNGHeader(NamedTuple):
+    width: int
+    height: int
+    bit_depth: int
+    color_type: int
+
+
+def parse_png_header(data: bytes) -> PNGHeader:
+    """
+    Check the PNG signature and IHDR chunk at the start of a file.
+
+    :param data: First PNG_HEADER_SIZE bytes of the file.
+    :return: Dimensions and pixel format of the image.
+    :raises InvalidImage: If the bytes don't start a PNG image.
+    """
+    if len(data) < PNG_HEADER_SIZE or not data.startswith(PNG_SIGNATURE):
+        raise InvalidImage("Not a PNG image")
+    length, chunk_type = struct.unpack(">I4s", data[8:16])
+    if length != 13 or chunk_type != b"IHDR":
+        raise InvalidImage("Missing PNG IHDR chunk")
+    chunk_data = data[16:29]
+    (crc,) = struct.unpack(">I", data[29:33])
+    if zlib.crc32(chunk_type + chunk_data) != crc:
+        raise InvalidImage("Corrupted PNG IHDR chunk")
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", chunk_data[:10])
+    if width == 0 or height == 0:
+        raise InvalidImage("Empty PNG image")
+    return PNGHeader(width, height, bit_depth, color_type)
+
+
+def read_png_header(file: BinaryIO) -> PNGHeader:
+    """
+    Check the header of a PNG file and rewind it.
+
+    :param file: File positioned at its start.
+    :return: Dimensions and pixel format of the image.
+    :raises InvalidImage: If the file isn't a PNG image.
+    """
+    try:
+        return parse_png_header(file.read(PNG_HEADER_SIZE))
+    finally:
+        file.seek(0)
+